@@ -0,0 +1,247 @@
+import glob
+import logging
+import os
+import pickle
+import shutil
+import tempfile
+import threading
+from concurrent.futures import CancelledError, ThreadPoolExecutor, ProcessPoolExecutor
+from typing import Callable, List, Tuple
+from Filter import _MetaOutputTab, Task, normalize_filter_plan, get_input_tab_by_filename, \
+    get_output_tab_by_filename
+
+logger = logging.getLogger(__name__)
+
+# 目录输入时收集的文件类型
+INPUT_EXTS = ('.csv', '.xlsx', '.xls')
+
+
+def expand_input_files(spec) -> List[str]:
+    """
+    展开输入: 可以是路径列表, 或以 "||" 分隔的字符串(界面多选文件),
+    每一项可以是文件, 目录(取其中的 csv/xlsx/xls), 或通配符
+    """
+    if isinstance(spec, str):
+        spec = [m_item for m_item in spec.split("||") if m_item.strip()]
+    fin = []
+    for m_item in spec:
+        m_item = m_item.strip()
+        if os.path.isdir(m_item):
+            fin.extend(sorted(os.path.join(m_item, name) for name in os.listdir(m_item)
+                              if os.path.splitext(name)[-1].lower() in INPUT_EXTS and not name.startswith("~$")))
+        elif glob.has_magic(m_item):
+            fin.extend(sorted(glob.glob(m_item)))
+        else:
+            fin.append(m_item)
+    return fin
+
+
+class _RowPartOutputTab(_MetaOutputTab):
+    """合并输出时单个输入的中间结果, 按批 pickle 到临时文件, 保留单元格原始类型"""
+
+    def __init__(self, file_path: str, title: List[str], filter_title: List[str] = None, **kwargs):
+        super().__init__(file_path, title, filter_title, **kwargs)
+        self.__f = open(file_path, 'wb')
+        self.__buf = []
+        self.__cur = 0
+
+    def write_raw(self, raw: List):
+        self.__buf.append(raw)
+        self.__cur += 1
+        if len(self.__buf) >= 1000:
+            pickle.dump(self.__buf, self.__f)
+            self.__buf = []
+
+    def get_cur_len(self) -> int:
+        return self.__cur
+
+    def save(self):
+        if self.__buf:
+            pickle.dump(self.__buf, self.__f)
+            self.__buf = []
+        self.__f.close()
+
+    @staticmethod
+    def iter_rows(file_path: str):
+        with open(file_path, 'rb') as f:
+            while True:
+                try:
+                    batch = pickle.load(f)
+                except EOFError:
+                    break
+                for m_item in batch:
+                    yield m_item
+
+
+def run_filter_job(src: str, dst: str, title_pos: Tuple, data_pos: Tuple, plan, filter_title: List[str] = None,
+                   in_kwargs: dict = None, out_kwargs: dict = None, part: bool = False,
+                   on_task: Callable = None, memo_dir: str = None) -> int:
+    """
+    执行单个输入文件的筛选, 返回写入行数; 出错时抛出异常
+    part: 写入合并用的中间文件; on_task(src, task): 线程模式下登记 Task 以便查询进度和暂停/取消
+    memo_dir: 结果缓存目录, 见 Task
+    """
+    ai = get_input_tab_by_filename(src)(src, title_pos=title_pos, data_pos=data_pos, **(in_kwargs or {}))
+    try:
+        ai.set_filter_plan(plan)
+    except Exception:
+        ai.close()
+        raise
+    out_cls = _RowPartOutputTab if part else get_output_tab_by_filename(dst)
+    ao = out_cls(dst, title=ai.read_title(), filter_title=filter_title, **(out_kwargs or {}))
+    tsk = Task(ai, ao, memo_dir=memo_dir)
+    if on_task is not None:
+        on_task(src, tsk)
+    tsk.run()
+    if tsk.fault_msg:
+        raise Exception(tsk.fault_msg)
+    return tsk.get_write_len()
+
+
+class BatchTask:
+    """
+    多个输入文件使用相同条件批量筛选, 每个文件一个 Task, 在线程池或进程池中执行
+    merge=False: 每个输入输出一个文件, 路径为 <output 所在目录>/<输入文件名>_<output 文件名>
+    merge=True: 所有结果按输入顺序合并写入 output
+    可暂停/取消; 进程池模式下只能取消尚未开始的文件
+    """
+
+    def __init__(self, inputs, output: str, title_pos: Tuple, data_pos: Tuple, plan=None,
+                 filter_title: List[str] = None, merge: bool = False, workers: int = 4, use_process: bool = False,
+                 in_kwargs: dict = None, out_kwargs: dict = None, memo_dir: str = None):
+        self.inputs = expand_input_files(inputs)
+        if not self.inputs:
+            raise Exception("未找到输入文件")
+        self.output = output
+        self.title_pos = title_pos
+        self.data_pos = data_pos
+        self.plan = normalize_filter_plan(plan if plan is not None else [])
+        self.filter_title = filter_title
+        self.merge = merge
+        self.workers = workers
+        self.use_process = use_process
+        self.in_kwargs = in_kwargs or {}
+        self.out_kwargs = out_kwargs or {}
+        self.memo_dir = memo_dir
+        self.fault_msg = ""
+        # 每个输入的结果: src -> (输出路径, 写入行数, 错误信息)
+        self.results = {}
+        self._tasks = {}
+        self._futures = []
+        self._paused = False
+        self.cancelled = False
+        self._is_done = False
+        self._write_len = 0
+
+        # 用第一个输入提前校验条件和列名
+        ai = get_input_tab_by_filename(self.inputs[0])(self.inputs[0], title_pos=title_pos, data_pos=data_pos,
+                                                       **self.in_kwargs)
+        try:
+            ai.set_filter_plan(self.plan)
+            self._title = ai.read_title()
+        finally:
+            ai.close()
+
+    def get_output_path(self, src: str) -> str:
+        out_dir, out_name = os.path.split(self.output)
+        return os.path.join(out_dir, "{0}_{1}".format(os.path.splitext(os.path.split(src)[-1])[0], out_name))
+
+    def run(self):
+        part_dir = tempfile.mkdtemp(prefix="excel_filter_") if self.merge else None
+        pool_cls = ProcessPoolExecutor if self.use_process else ThreadPoolExecutor
+        futures = self._futures
+        try:
+            with pool_cls(max_workers=self.workers) as pool:
+                for i, src in enumerate(self.inputs):
+                    if self.merge:
+                        dst = os.path.join(part_dir, "{0}.part".format(i))
+                    else:
+                        dst = self.get_output_path(src)
+                    futures.append((src, dst, pool.submit(
+                        run_filter_job, src, dst, self.title_pos, self.data_pos, self.plan, self.filter_title,
+                        self.in_kwargs, self.out_kwargs, self.merge, None if self.use_process else self.__on_task,
+                        self.memo_dir)))
+                    if self.cancelled:
+                        futures[-1][2].cancel()
+                for src, dst, m_future in futures:
+                    try:
+                        cnt = m_future.result()
+                        self.results[src] = (dst, cnt, "")
+                        self._write_len += cnt
+                    except CancelledError:
+                        self.results[src] = (dst, 0, "任务已取消")
+                    except Exception as e:
+                        logger.warning("batch input failed %s: %s", src, e)
+                        self.results[src] = (dst, 0, str(e))
+            faults = ["{0}: {1}".format(os.path.split(k)[-1], v[2]) for k, v in self.results.items() if v[2]]
+            if self.cancelled:
+                self.fault_msg = "任务已取消"
+            elif faults:
+                self.fault_msg = "; ".join(faults)
+            elif self.merge:
+                self.__merge_parts([dst for _, dst, _ in futures])
+        except Exception as e:
+            logger.exception("batch task failed: %s", e)
+            self.fault_msg = str(e)
+        finally:
+            if part_dir:
+                shutil.rmtree(part_dir, ignore_errors=True)
+            self._is_done = True
+
+    def __merge_parts(self, parts: List[str]):
+        head = self.filter_title if self.filter_title else self._title
+        ao = get_output_tab_by_filename(self.output)(self.output, title=head, **self.out_kwargs)
+        for m_item in parts:
+            for row in _RowPartOutputTab.iter_rows(m_item):
+                ao.write_raw(row)
+        ao.save()
+
+    def __on_task(self, src: str, tsk: Task):
+        self._tasks[src] = tsk
+        if self.cancelled:
+            tsk.cancel()
+        elif self._paused:
+            tsk.pause()
+
+    def start(self):
+        t = threading.Thread(target=self.run)
+        t.setDaemon(True)
+        t.start()
+
+    def pause(self):
+        self._paused = True
+        for tsk in list(self._tasks.values()):
+            tsk.pause()
+
+    def resume(self):
+        self._paused = False
+        for tsk in list(self._tasks.values()):
+            tsk.resume()
+
+    def is_paused(self) -> bool:
+        return self._paused and not self._is_done
+
+    def cancel(self):
+        self.cancelled = True
+        for _, _, m_future in list(self._futures):
+            m_future.cancel()
+        for tsk in list(self._tasks.values()):
+            tsk.cancel()
+
+    def is_done(self):
+        return self._is_done
+
+    def get_progress(self) -> float:
+        """已完成的文件按 1 计, 线程模式下执行中的文件按其自身进度计"""
+        done = len(self.results)
+        running = 0.0
+        for src, tsk in list(self._tasks.items()):
+            if src not in self.results:
+                running += min(tsk.get_progress(), 1)
+        return (done + running) / len(self.inputs)
+
+    def get_write_len(self) -> int:
+        if self._is_done:
+            return self._write_len
+        return self._write_len + sum(tsk.get_write_len() for src, tsk in list(self._tasks.items())
+                                     if src not in self.results)
@@ -0,0 +1,477 @@
+"""
+xlsx 解析结果的列式磁盘缓存: 首次读取时把整张表转换为列式二进制文件, 之后直接从该文件读取, 不再经过 openpyxl
+
+文件结构(小端):
+    MAGIC | 行组 ... | 字符串字符偏移(int64 * (n + 1)) | 字符串 utf-8 | 其他对象 pickle | footer json | footer 长度(uint64) | MAGIC
+每个行组最多 GROUP_ROWS 行, 按列存放: 每格一个类型标记(uint8, 整列同类型时省略)和一个 8 字节值
+(整数/布尔/字符串编号/日期时间按 int64, 浮点按 float64), 各段按 8 字节对齐, 以 mmap 方式读取
+"""
+
+import array
+import hashlib
+import json
+import logging
+import mmap
+import os
+import pickle
+import struct
+import sys
+import time
+from datetime import datetime, date, time as dt_time, timedelta
+from typing import List
+
+logger = logging.getLogger(__name__)
+
+MAGIC = b"EFCOL001"
+GROUP_ROWS = 65536
+DEFAULT_MAX_BYTES = 2 << 30
+CACHE_EXT = ".efc"
+
+# 单元格类型标记
+T_NONE = 0
+T_INT = 1
+T_FLOAT = 2
+T_STR = 3
+T_BOOL = 4
+T_DATETIME = 5
+T_DATE = 6
+T_TIME = 7
+T_TIMEDELTA = 8
+T_OBJECT = 9
+# 整列类型不一致
+MIXED = 255
+
+_EPOCH = datetime(1970, 1, 1)
+_US = timedelta(microseconds=1)
+_INT64_MIN = -(1 << 63)
+_INT64_MAX = (1 << 63) - 1
+_DOUBLE = struct.Struct("<d")
+_INT64 = struct.Struct("<q")
+
+
+def file_fingerprint(file_path: str) -> dict:
+    st = os.stat(file_path)
+    return {"size": st.st_size, "mtime_ns": st.st_mtime_ns}
+
+
+def content_hash(file_path: str, chunk_size: int = 1 << 20) -> str:
+    h = hashlib.sha1()
+    with open(file_path, "rb") as f:
+        chunk = f.read(chunk_size)
+        while chunk:
+            h.update(chunk)
+            chunk = f.read(chunk_size)
+    return h.hexdigest()
+
+
+def evict_lru(cache_dir: str, ext: str, max_bytes: int, keep: str = None):
+    """目录中 ext 结尾的文件总大小超过 max_bytes 时, 按修改时间从旧到新删除, keep 除外"""
+    entries = []
+    total = 0
+    for name in os.listdir(cache_dir):
+        if not name.endswith(ext):
+            continue
+        m_path = os.path.join(cache_dir, name)
+        try:
+            st = os.stat(m_path)
+        except OSError:
+            continue
+        entries.append((st.st_mtime, st.st_size, m_path))
+        total += st.st_size
+    entries.sort()
+    for _, size, m_path in entries:
+        if total <= max_bytes:
+            break
+        if keep and os.path.abspath(m_path) == os.path.abspath(keep):
+            continue
+        try:
+            os.remove(m_path)
+            total -= size
+        except OSError:
+            # 其他进程正在使用(Windows)
+            pass
+
+
+def _pad8(f):
+    pad = -f.tell() % 8
+    if pad:
+        f.write(b"\0" * pad)
+
+
+class _Writer:
+    """按行追加单元格, 每满 GROUP_ROWS 行写出一个行组; 字符串和其他对象在结束时统一写出"""
+
+    def __init__(self, f, cols: int):
+        self.f = f
+        self.cols = cols
+        self.groups = []
+        self.strings = {}
+        self.objects = []
+        self.rows = 0
+        self.__reset()
+
+    def __reset(self):
+        self.tags = [bytearray() for _ in range(self.cols)]
+        self.values = [array.array("q") for _ in range(self.cols)]
+        self.n = 0
+
+    def __str_id(self, text: str) -> int:
+        idx = self.strings.get(text, None)
+        if idx is None:
+            idx = self.strings[text] = len(self.strings)
+        return idx
+
+    def __encode(self, value):
+        """返回 (类型标记, int64 值)"""
+        if value is None:
+            return T_NONE, 0
+        cls = type(value)
+        if cls is str:
+            return T_STR, self.__str_id(value)
+        if cls is float:
+            return T_FLOAT, _INT64.unpack(_DOUBLE.pack(value))[0]
+        if cls is int:
+            if _INT64_MIN <= value <= _INT64_MAX:
+                return T_INT, value
+        elif cls is bool:
+            return T_BOOL, int(value)
+        elif cls is datetime:
+            if value.tzinfo is None:
+                return T_DATETIME, (value - _EPOCH) // _US
+        elif cls is date:
+            return T_DATE, value.toordinal()
+        elif cls is dt_time:
+            if value.tzinfo is None:
+                return T_TIME, ((value.hour * 60 + value.minute) * 60 + value.second) * 1000000 + value.microsecond
+        elif cls is timedelta:
+            return T_TIMEDELTA, value // _US
+        self.objects.append(value)
+        return T_OBJECT, len(self.objects) - 1
+
+    def append(self, row):
+        for c in range(self.cols):
+            tag, value = self.__encode(row[c] if c < len(row) else None)
+            self.tags[c].append(tag)
+            self.values[c].append(value)
+        self.n += 1
+        self.rows += 1
+        if self.n >= GROUP_ROWS:
+            self.flush()
+
+    def flush(self):
+        if not self.n:
+            return
+        columns = []
+        for c in range(self.cols):
+            tags = self.tags[c]
+            kind = tags[0] if tags.count(tags[0]) == len(tags) else MIXED
+            col = {"kind": kind}
+            if kind == MIXED:
+                col["tags"] = self.f.tell()
+                self.f.write(tags)
+                _pad8(self.f)
+            if kind != T_NONE:
+                col["values"] = self.f.tell()
+                values = self.values[c]
+                if sys.byteorder != "little":
+                    values.byteswap()
+                self.f.write(values.tobytes())
+            columns.append(col)
+        self.groups.append({"rows": self.n, "columns": columns})
+        self.__reset()
+
+    def finish(self, meta: dict):
+        self.flush()
+        texts = list(self.strings.keys())
+        offsets = array.array("q", [0])
+        for m_item in texts:
+            offsets.append(offsets[-1] + len(m_item))
+        if sys.byteorder != "little":
+            offsets.byteswap()
+        footer = dict(meta)
+        footer.update({"rows": self.rows, "cols": self.cols, "groups": self.groups, "strings": len(texts)})
+        footer["string_offsets"] = self.f.tell()
+        self.f.write(offsets.tobytes())
+        footer["string_blob"] = self.f.tell()
+        blob = "".join(texts).encode("utf-8")
+        footer["string_blob_len"] = len(blob)
+        self.f.write(blob)
+        _pad8(self.f)
+        footer["objects"] = self.f.tell()
+        data = pickle.dumps(self.objects)
+        footer["objects_len"] = len(data)
+        self.f.write(data)
+        data = json.dumps(footer).encode("utf-8")
+        self.f.write(data)
+        self.f.write(struct.pack("<Q", len(data)))
+        self.f.write(MAGIC)
+
+
+def update_meta(path: str, meta: dict):
+    """
+    原地改写缓存文件的 footer, 不重写数据段; 新 footer 较短时以空格补齐,
+    文件不会变短, 其他进程已映射的部分仍然有效
+    """
+    with open(path, "r+b") as f:
+        f.seek(-16, os.SEEK_END)
+        old_len = struct.unpack("<Q", f.read(8))[0]
+        start = f.tell() + 8 - 16 - old_len
+        data = json.dumps(meta).encode("utf-8")
+        if len(data) < old_len:
+            data += b" " * (old_len - len(data))
+        f.seek(start)
+        f.write(data)
+        f.write(struct.pack("<Q", len(data)))
+        f.write(MAGIC)
+
+
+class ColumnarSheet:
+    """以 mmap 方式打开的列式缓存文件, 按行组逐列解码后组装为行"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.__f = open(path, "rb")
+        try:
+            self.__mm = mmap.mmap(self.__f.fileno(), 0, access=mmap.ACCESS_READ)
+        except Exception:
+            self.__f.close()
+            raise
+        self.__views = []
+        try:
+            mm = self.__mm
+            if mm[:8] != MAGIC or mm[-8:] != MAGIC:
+                raise Exception("缓存文件格式错误: {0}".format(path))
+            footer_len = struct.unpack("<Q", mm[-16:-8])[0]
+            self.meta = json.loads(mm[len(mm) - 16 - footer_len:len(mm) - 16].decode("utf-8"))
+            self.rows = self.meta["rows"]
+            self.cols = self.meta["cols"]
+            self.__base = memoryview(mm)
+            self.__views.append(self.__base)
+            n = self.meta["strings"]
+            offsets = self.__cast(self.meta["string_offsets"], n + 1, "q")
+            text = bytes(mm[self.meta["string_blob"]:self.meta["string_blob"] + self.meta["string_blob_len"]]) \
+                .decode("utf-8")
+            self.__strings = [text[offsets[i]:offsets[i + 1]] for i in range(n)]
+            self.__release_views()
+            self.__objects = pickle.loads(mm[self.meta["objects"]:self.meta["objects"] + self.meta["objects_len"]])
+            self.__group_start = []
+            start = 0
+            for m_item in self.meta["groups"]:
+                self.__group_start.append(start)
+                start += m_item["rows"]
+        except Exception:
+            self.close()
+            raise
+
+    def __cast(self, offset: int, n: int, fmt: str):
+        view = self.__base[offset:offset + 8 * n].cast(fmt) if fmt != "B" else self.__base[offset:offset + n]
+        self.__views.append(view)
+        if sys.byteorder != "little" and fmt != "B":
+            ret = array.array(fmt, view.tobytes())
+            ret.byteswap()
+            return ret
+        return view
+
+    def __decode_column(self, group: dict, c: int) -> list:
+        try:
+            return self.__decode_column_views(group, c)
+        finally:
+            self.__release_views()
+
+    def __decode_column_views(self, group: dict, c: int) -> list:
+        n = group["rows"]
+        col = group["columns"][c]
+        kind = col["kind"]
+        if kind == T_NONE:
+            return [None] * n
+        if kind == T_FLOAT:
+            return self.__cast(col["values"], n, "d").tolist()
+        values = self.__cast(col["values"], n, "q").tolist()
+        if kind == T_INT:
+            return values
+        if kind == T_STR:
+            strings = self.__strings
+            return [strings[i] for i in values]
+        if kind != MIXED:
+            return [self.__decode(kind, v) for v in values]
+        tags = self.__cast(col["tags"], n, "B")
+        floats = None
+        fin = []
+        for i, v in enumerate(values):
+            tag = tags[i]
+            if tag == T_INT:
+                fin.append(v)
+            elif tag == T_STR:
+                fin.append(self.__strings[v])
+            elif tag == T_NONE:
+                fin.append(None)
+            elif tag == T_FLOAT:
+                if floats is None:
+                    floats = self.__cast(col["values"], n, "d")
+                fin.append(floats[i])
+            else:
+                fin.append(self.__decode(tag, v))
+        return fin
+
+    def __decode(self, tag: int, v: int):
+        if tag == T_BOOL:
+            return bool(v)
+        if tag == T_DATETIME:
+            return _EPOCH + v * _US
+        if tag == T_DATE:
+            return date.fromordinal(v)
+        if tag == T_TIME:
+            v, us = divmod(v, 1000000)
+            v, sec = divmod(v, 60)
+            return dt_time(v // 60, v % 60, sec, us)
+        if tag == T_TIMEDELTA:
+            return v * _US
+        if tag == T_OBJECT:
+            return self.__objects[v]
+        if tag == T_FLOAT:
+            return _DOUBLE.unpack(_INT64.pack(v))[0]
+        if tag == T_STR:
+            return self.__strings[v]
+        return v if tag == T_INT else None
+
+    def iter_rows(self, min_row: int = 0, min_col: int = 0, columns: List[int] = None):
+        """
+        从第 min_row 行(从 0 开始)起逐行返回 list, 每行为第 min_col 列起的各列;
+        columns 指定时只解码这些列(绝对列号), 行内按 columns 的顺序排列
+        """
+        cols = list(columns) if columns is not None else list(range(min_col, self.cols))
+        for g, group in enumerate(self.meta["groups"]):
+            start = self.__group_start[g]
+            if start + group["rows"] <= min_row:
+                continue
+            data = [self.__decode_column(group, c) if c < self.cols else [None] * group["rows"] for c in cols]
+            skip = max(min_row - start, 0)
+            if not data:
+                for _ in range(skip, group["rows"]):
+                    yield []
+                continue
+            rows = zip(*data)
+            for _ in range(skip):
+                next(rows)
+            for m_item in rows:
+                yield list(m_item)
+
+    def row(self, idx: int, min_col: int = 0) -> list:
+        for m_item in self.iter_rows(idx, min_col):
+            return m_item
+        return []
+
+    def __release_views(self):
+        # 只保留整体视图, 解码用的列视图用完即释放, 否则无法关闭 mmap
+        while len(self.__views) > 1:
+            self.__views.pop().release()
+
+    def close(self):
+        for m_item in reversed(self.__views):
+            m_item.release()
+        self.__views = []
+        if self.__mm is not None:
+            self.__mm.close()
+            self.__mm = None
+        self.__f.close()
+
+
+class ColumnarCache:
+    """
+    缓存目录: 每个 xlsx 对应一个 .efc 文件, 以 路径 的哈希命名, 文件内记录源文件的大小/修改时间/内容哈希
+    大小和修改时间一致时直接使用; 大小一致而修改时间变化时比较内容哈希, 一致则继续使用, 否则重建
+    命中时更新文件修改时间, 目录总大小超过 max_bytes 时按修改时间删除最久未用的缓存
+    """
+
+    def __init__(self, cache_dir: str, max_bytes: int = DEFAULT_MAX_BYTES, verify: bool = False):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        # verify: 每次都比较内容哈希, 不依赖修改时间
+        self.verify = verify
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def entry_path(self, file_path: str) -> str:
+        key = hashlib.sha1(os.path.normcase(os.path.abspath(file_path)).encode("utf-8")).hexdigest()
+        return os.path.join(self.cache_dir, key + CACHE_EXT)
+
+    def open(self, file_path: str) -> ColumnarSheet:
+        """返回 file_path 的缓存, 不存在或已失效时先用 openpyxl 读取整张表生成"""
+        path = self.entry_path(file_path)
+        sheet = self.__open_valid(file_path, path)
+        if sheet is None:
+            self.build(file_path, path)
+            sheet = ColumnarSheet(path)
+        return sheet
+
+    def __open_valid(self, file_path: str, path: str):
+        if not os.path.isfile(path):
+            return None
+        try:
+            sheet = ColumnarSheet(path)
+        except Exception as e:
+            logger.warning("cache ignored %s: %s", path, e)
+            return None
+        src = sheet.meta.get("source", {})
+        fp = file_fingerprint(file_path)
+        valid = src.get("path") == os.path.abspath(file_path) and src.get("size") == fp["size"]
+        if valid and (self.verify or src.get("mtime_ns") != fp["mtime_ns"]):
+            valid = src.get("hash") == content_hash(file_path)
+            if valid and src.get("mtime_ns") != fp["mtime_ns"]:
+                # 内容未变只是修改时间变化(touch/复制), 记录新的修改时间, 之后不必再计算内容哈希
+                meta = dict(sheet.meta)
+                meta["source"] = dict(src, mtime_ns=fp["mtime_ns"])
+                sheet.close()
+                try:
+                    update_meta(path, meta)
+                    sheet = ColumnarSheet(path)
+                except Exception as e:
+                    logger.warning("cache ignored %s: %s", path, e)
+                    return None
+        if not valid:
+            sheet.close()
+            return None
+        try:
+            os.utime(path, None)
+        except OSError:
+            pass
+        return sheet
+
+    def build(self, file_path: str, path: str = None):
+        import openpyxl
+        path = path or self.entry_path(file_path)
+        fp = file_fingerprint(file_path)
+        source = {"path": os.path.abspath(file_path), "size": fp["size"], "mtime_ns": fp["mtime_ns"],
+                  "hash": content_hash(file_path)}
+        wb = openpyxl.open(file_path, read_only=True, data_only=True)
+        tmp = "{0}.{1}.tmp".format(path, os.getpid())
+        try:
+            tab = wb.active
+            if tab.max_row is None or tab.max_column is None:
+                tab.reset_dimensions()
+                tab.calculate_dimension(force=True)
+            max_col = tab.max_column or 0
+            with open(tmp, "wb") as f:
+                f.write(MAGIC)
+                writer = _Writer(f, max_col)
+                if max_col:
+                    for row in tab.iter_rows(min_row=1, max_row=tab.max_row, min_col=1, max_col=max_col,
+                                             values_only=True):
+                        writer.append(row)
+                writer.finish({"source": source, "sheet": tab.title, "created": time.time()})
+            os.replace(tmp, path)
+        finally:
+            wb.close()
+            if os.path.exists(tmp):
+                os.remove(tmp)
+        self.evict(keep=path)
+
+    def evict(self, keep: str = None):
+        evict_lru(self.cache_dir, CACHE_EXT, self.max_bytes, keep)
+
+    def clear(self):
+        for name in os.listdir(self.cache_dir):
+            if name.endswith(CACHE_EXT):
+                try:
+                    os.remove(os.path.join(self.cache_dir, name))
+                except OSError:
+                    pass
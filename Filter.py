@@ -1,92 +1,873 @@
-import openpyxl
-import re
-import copy
+import ast
+import json
+import locale
 import os
+import pickle
+import queue
 import re
 import threading
 import time
-from typing import List, Tuple
+from typing import Callable, List, Tuple
 import abc
+import collections
+import builtins
+import functools
+import math
 from datetime import datetime, date, timedelta
 import logging
+from Typed import infer_column_types, get_converter
 logging.basicConfig(level=logging.DEBUG, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
 
+# 列表条件从文件读取 key 的前缀, 例: @file:D:/ids.txt 或 @file:D:/users.xlsx::客户编号
+KEY_FILE_PREFIX = "@file:"
+
+
+def load_key_list(file_path: str, column: str = None) -> frozenset:
+    """
+    从文件读取 key 集合
+    csv/xlsx: 指定 column 时按首行列名取该列(不含列名行), 否则取第一列全部行
+    其他文件: 每行一个 key
+    """
+    if not os.path.isfile(file_path):
+        raise Exception("列表文件[{0}]不存在".format(file_path))
+    ext = os.path.splitext(file_path)[-1].lower()
+    if ext not in ('.csv', '.xlsx', '.xls'):
+        with open(file_path, 'r', encoding='utf-8-sig') as f:
+            return frozenset(line.strip() for line in f)
+    if column is None:
+        tab = get_input_tab_by_filename(file_path)(file_path, title_pos=(-1, 0), data_pos=(0, 0))
+        idx = 0
+    else:
+        tab = get_input_tab_by_filename(file_path)(file_path, title_pos=(0, 0), data_pos=(1, 0))
+        if column not in tab.get_title_map():
+            tab.close()
+            raise Exception("列表文件[{0}]中不存在列[{1}]".format(file_path, column))
+        idx = tab.get_title_map()[column]
+    keys = set()
+    try:
+        line = tab.read_nxt_raw_data_line()
+        while line:
+            if idx < len(line) and line[idx] is not None:
+                keys.add(str(line[idx]).strip())
+            line = tab.read_nxt_raw_data_line()
+    finally:
+        tab.close()
+    return frozenset(keys)
+
+
+class MultiRegex:
+    """
+    多条正则合并为一个非捕获分组选择 (?:p0)|(?:p1)|..., 一次 search 判断是否有任意一条命中,
+    命中后再逐条确认是哪一条 (用命名分组标记会使 re 无法做前缀优化, 慢两个数量级)
+    prefilter: 每条正则都以字面量开头时, 先用字面量做子串检查快速排除不可能命中的值;
+               适合少量前缀固定而后半部分复杂的正则, 正则很多时逐个子串检查反而更慢, 默认关闭
+    含反向引用或无法合并的正则时, 退化为逐条 search
+    """
+
+    def __init__(self, patterns: List[str], prefilter: bool = False, flags: int = 0):
+        self.patterns = list(patterns)
+        compiled = []
+        for m_item in self.patterns:
+            try:
+                compiled.append(re.compile(m_item, flags))
+            except re.error as e:
+                raise Exception("正则表达式[{0}]错误,ERROR: {1}".format(m_item, e))
+        self.__compiled = compiled
+        self.__regex = None
+        if not any(re.search(r'\\[1-9]|\(\?P=', m_item) for m_item in self.patterns):
+            try:
+                self.__regex = re.compile("|".join("(?:{0})".format(m_item) for m_item in self.patterns), flags)
+            except re.error:
+                self.__regex = None
+        self.__prefixes = None
+        if prefilter and not flags & (re.IGNORECASE | re.VERBOSE) and self.patterns:
+            prefixes = [self.literal_prefix(m_item) for m_item in self.patterns]
+            if all(prefixes):
+                self.__prefixes = tuple(set(prefixes))
+
+    @staticmethod
+    def literal_prefix(pattern: str) -> str:
+        """正则开头必须出现的字面量, 无法确定时返回空串"""
+        if pattern.startswith('^'):
+            pattern = pattern[1:]
+        if pattern.startswith('(?') or MultiRegex.has_top_alternation(pattern):
+            return ''
+        fin = []
+        for ch in pattern:
+            if ch in '.^$*+?{}[]\\|()':
+                # 量词作用于前一个字符, 该字符不是必须出现的
+                if ch in '*?{' and fin:
+                    fin.pop()
+                break
+            fin.append(ch)
+        return ''.join(fin)
+
+    @staticmethod
+    def has_top_alternation(pattern: str) -> bool:
+        """正则最外层是否有 |, 有时各分支开头不同, 不存在必须出现的字面量"""
+        depth = 0
+        in_class = False
+        i = 0
+        while i < len(pattern):
+            ch = pattern[i]
+            if ch == '\\':
+                i += 2
+                continue
+            if in_class:
+                if ch == ']':
+                    in_class = False
+            elif ch == '[':
+                in_class = True
+                # [] 或 [^] 开头的 ] 是字面量
+                if pattern[i + 1:i + 2] == '^':
+                    i += 1
+                if pattern[i + 1:i + 2] == ']':
+                    i += 1
+            elif ch == '(':
+                depth += 1
+            elif ch == ')':
+                depth -= 1
+            elif ch == '|' and depth == 0:
+                return True
+            i += 1
+        return False
+
+    def is_match(self, s: str) -> bool:
+        if self.__prefixes is not None:
+            for m_item in self.__prefixes:
+                if m_item in s:
+                    break
+            else:
+                return False
+        if self.__regex is not None:
+            return self.__regex.search(s) is not None
+        for m_item in self.__compiled:
+            if m_item.search(s):
+                return True
+        return False
+
+    def search(self, s: str) -> int:
+        """返回命中的正则序号, 未命中返回 -1"""
+        if not self.is_match(s):
+            return -1
+        for i, m_item in enumerate(self.__compiled):
+            if m_item.search(s):
+                return i
+        return -1
+
+    def which(self, s: str) -> str:
+        """返回命中的正则文本, 未命中返回 None"""
+        i = self.search(s)
+        return self.patterns[i] if i >= 0 else None
+
+
+class AhoCorasick:
+    """
+    多关键字子串匹配 (Aho-Corasick 自动机), 建立一次后每次查找只与值的长度线性相关
+    ignore_case: 忽略大小写
+    whole_word: 只匹配完整单词, 关键字前后不能紧接字母/数字/下划线
+    """
+
+    def __init__(self, keywords, ignore_case: bool = False, whole_word: bool = False):
+        self.keywords = [m_item for m_item in keywords if m_item]
+        self.__ignore_case = ignore_case
+        self.__whole_word = whole_word
+        goto = [{}]
+        out = [()]
+        for idx, kw in enumerate(self.keywords):
+            if ignore_case:
+                kw = kw.lower()
+            state = 0
+            for ch in kw:
+                nxt = goto[state].get(ch, None)
+                if nxt is None:
+                    nxt = len(goto)
+                    goto[state][ch] = nxt
+                    goto.append({})
+                    out.append(())
+                state = nxt
+            out[state] = out[state] + ((len(kw), idx),)
+
+        # 按层构造失败指针, 并把失败链上的输出合并到当前状态
+        fail = [0] * len(goto)
+        queue = collections.deque(goto[0].values())
+        while queue:
+            r = queue.popleft()
+            for ch, u in goto[r].items():
+                queue.append(u)
+                f = fail[r]
+                while f and ch not in goto[f]:
+                    f = fail[f]
+                fail[u] = goto[f].get(ch, 0)
+                out[u] = out[u] + out[fail[u]]
+        self.__goto = goto
+        self.__fail = fail
+        self.__out = out
+
+    @staticmethod
+    def __is_word(ch: str) -> bool:
+        return ch.isalnum() or ch == '_'
+
+    def search(self, s: str) -> int:
+        """返回最先命中的关键字序号, 未命中返回 -1"""
+        if self.__ignore_case:
+            s = s.lower()
+        goto = self.__goto
+        fail = self.__fail
+        out = self.__out
+        whole_word = self.__whole_word
+        state = 0
+        for i, ch in enumerate(s):
+            while state and ch not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(ch, 0)
+            if out[state]:
+                if not whole_word:
+                    return out[state][0][1]
+                for length, idx in out[state]:
+                    start = i - length + 1
+                    if (start == 0 or not self.__is_word(s[start - 1])) and \
+                            (i + 1 == len(s) or not self.__is_word(s[i + 1])):
+                        return idx
+        return -1
+
+    def is_match(self, s: str) -> bool:
+        return self.search(s) >= 0
+
+    def which(self, s: str) -> str:
+        """返回命中的关键字, 未命中返回 None"""
+        i = self.search(s)
+        return self.keywords[i] if i >= 0 else None
+
+
 class FilterType:
     raw_list = 0
     py_exp = 1
     reg_exp = 2
-    __raw_list_cache = {}
+    # 多条正则, 每行一条, 任意一条命中即可
+    reg_multi = 3
+    # 包含关键字列表中的任意一个(子串), 关键字写法同列表条件
+    kw_contains = 4
+    # 列表条件 key 集合及关键字条件自动机的 LRU 缓存, 超出数量时淘汰最久未使用的
+    raw_list_cache_size = 8
+    __raw_list_cache = collections.OrderedDict()
+    __raw_list_lock = threading.Lock()
+    # py_exp 表达式中可以使用的名称, 除 X 外不暴露模块全局变量
+    py_exp_namespace = {
+        "__builtins__": {name: getattr(builtins, name) for name in (
+            "abs", "all", "any", "bool", "chr", "dict", "divmod", "enumerate", "filter", "float", "format",
+            "frozenset", "hex", "int", "isinstance", "len", "list", "map", "max", "min", "oct", "ord", "pow",
+            "range", "repr", "reversed", "round", "set", "sorted", "str", "sum", "tuple", "zip")},
+        "datetime": datetime,
+        "date": date,
+        "timedelta": timedelta,
+        "re": re,
+        "math": math,
+    }
+
+    names = {
+        "raw_list": raw_list,
+        "py_exp": py_exp,
+        "reg_exp": reg_exp,
+        "reg_multi": reg_multi,
+        "kw_contains": kw_contains
+    }
+
+    @classmethod
+    def parse(cls, filter_type) -> int:
+        """筛选类型可以是编号或名称('raw_list'/'py_exp'/'reg_exp'/'reg_multi'/'kw_contains')"""
+        if isinstance(filter_type, str) and filter_type in cls.names:
+            return cls.names[filter_type]
+        if filter_type in cls.names.values():
+            return filter_type
+        raise Exception("未知筛选类型[{0}]".format(filter_type))
 
     @classmethod
     def check(cls, filter_type: int, raw: str, pt: str) -> bool:
         return cls.__check_map[filter_type](raw, pt)
 
+    @classmethod
+    def compile(cls, filter_type: int, pt, **options) -> Callable:
+        """返回单个值的判断函数 raw -> bool, 条件只解析一次; options 为各类型的附加选项"""
+        return cls.__compile_map[filter_type](pt, **options)
+
     @staticmethod
-    def check_raw_list(raw: str, pt: str) -> bool:
-        if FilterType.__raw_list_cache.get(pt, None) is not None:
-            pt = FilterType.__raw_list_cache[pt]
+    def instrument(func: Callable, stats: "FilterStats") -> Callable:
+        """包装判断函数, 把调用次数/通过次数/出错次数/耗时累计到 stats"""
+        perf_counter = time.perf_counter
+
+        def _checker(raw, *args):
+            st = perf_counter()
+            try:
+                ret = func(raw, *args)
+            except Exception:
+                stats.errors += 1
+                raise
+            finally:
+                stats.evals += 1
+                stats.seconds += perf_counter() - st
+            if ret:
+                stats.passed += 1
+            return ret
+        return _checker
+
+    @staticmethod
+    def raw_list_checker(pt: str) -> Callable:
+        keys = FilterType.__raw_list_keys(pt)
+        check = lambda raw: str(raw).strip() in keys
+        # 供批量判断直接使用 key 集合
+        check.keys = keys
+        check.strip_check = keys.__contains__
+        check.skip_falsy = False
+        return check
+
+    @staticmethod
+    def reg_exp_checker(pt) -> Callable:
+        if isinstance(pt, str):
+            try:
+                pt = re.compile(pt)
+            except re.error as e:
+                raise Exception("正则表达式[{0}]错误,ERROR: {1}".format(pt, e))
+        search = pt.search
+        check = lambda raw: bool(raw) and search(str(raw).strip()) is not None
+        # 批量判断时同一列的 str(raw).strip() 只算一次, 由调用方传入
+        check.strip_check = lambda s: search(s) is not None
+        check.skip_falsy = True
+        return check
+
+    @staticmethod
+    def reg_multi_checker(pt, prefilter: bool = False, ignore_case: bool = False) -> Callable:
+        if isinstance(pt, str):
+            pt = FilterType.compile_reg_multi(pt, prefilter, ignore_case)
+        is_match = pt.is_match
+        check = lambda raw: bool(raw) and is_match(str(raw).strip())
+        check.strip_check = is_match
+        check.skip_falsy = True
+        return check
+
+    @staticmethod
+    @functools.lru_cache(maxsize=32)
+    def compile_reg_multi(pt: str, prefilter: bool = False, ignore_case: bool = False) -> MultiRegex:
+        patterns = [m_item.strip('\r') for m_item in pt.strip().split('\n')]
+        return MultiRegex([m_item for m_item in patterns if m_item], prefilter,
+                          re.IGNORECASE if ignore_case else 0)
+
+    @staticmethod
+    def kw_contains_checker(pt, ignore_case: bool = False, whole_word: bool = False) -> Callable:
+        if isinstance(pt, str):
+            pt = FilterType.compile_kw_contains(pt, ignore_case, whole_word)
+        search = pt.search
+        check = lambda raw: bool(raw) and search(str(raw).strip()) >= 0
+        check.strip_check = lambda s: search(s) >= 0
+        check.skip_falsy = True
+        return check
+
+    @staticmethod
+    def compile_kw_contains(pt: str, ignore_case: bool = False, whole_word: bool = False) -> AhoCorasick:
+        """与列表条件共用 LRU 缓存, @file: 文件变化后重新建立"""
+        key = ("kw_contains", FilterType.__list_cache_key(pt), ignore_case, whole_word)
+        return FilterType.__list_cached(key, lambda: AhoCorasick(sorted(FilterType.__raw_list_keys(pt)),
+                                                                 ignore_case, whole_word))
+
+    @staticmethod
+    def py_exp_checker(pt) -> Callable:
+        func = FilterType.compile_py_exp(pt) if isinstance(pt, str) else pt
+
+        uses_t = func.uses_t
+
+        def _check(X, T=None):
+            # 空值, 以及用到 T 时无法按列类型转换的值不命中
+            if not X or (uses_t and T is None):
+                return False
+            try:
+                return func(X, T)
+            except Exception as e:
+                raise Exception("表达式[{0}]错误,ERROR: {1}".format(func.py_exp, e))
+        # 表达式用到 T 时, 调用方需按列类型转换后传入
+        _check.uses_t = uses_t
+        return _check
+
+    @staticmethod
+    def parse_raw_list(pt: str) -> frozenset:
+        """
+        解析列表条件为 key 集合
+        以 @file: 开头时从文件读取, 见 load_key_list
+        """
+        if pt.startswith(KEY_FILE_PREFIX):
+            path, _, column = pt[len(KEY_FILE_PREFIX):].strip().partition("::")
+            return load_key_list(path.strip(), column.strip() or None)
+        pt = pt.strip()
+        if re.search(r'\n', pt):
+            pt = pt.split('\n')
         else:
-            raw_pt = pt
-            pt = pt.strip()
-            if re.search(r'\n', pt):
-                pt = pt.split('\n')
-            else:
-                pt = pt.split('\t')
-            FilterType.__raw_list_cache[raw_pt] = {}
-            if isinstance(pt, list):
-                for item in pt:
-                    FilterType.__raw_list_cache[raw_pt][str(item).strip()] = True
-            else:
-                FilterType.__raw_list_cache[raw_pt][str(pt).strip()] = True
-            pt = FilterType.__raw_list_cache[raw_pt]
+            pt = pt.split('\t')
+        return frozenset(str(item).strip() for item in pt)
 
-        if pt.get(str(raw).strip(), False) is True:
-            return True
-        return False
+    @staticmethod
+    def __list_cache_key(pt: str):
+        """@file: 条件的缓存键带上文件大小和修改时间, 文件变化后重新读取"""
+        if pt.startswith(KEY_FILE_PREFIX):
+            path = pt[len(KEY_FILE_PREFIX):].strip().partition("::")[0].strip()
+            try:
+                st = os.stat(path)
+                return pt, st.st_size, st.st_mtime_ns
+            except OSError:
+                pass
+        return pt
+
+    @staticmethod
+    def __list_cached(key, build: Callable):
+        with FilterType.__raw_list_lock:
+            fin = FilterType.__raw_list_cache.get(key, None)
+            if fin is not None:
+                FilterType.__raw_list_cache.move_to_end(key)
+                return fin
+        fin = build()
+        with FilterType.__raw_list_lock:
+            FilterType.__raw_list_cache[key] = fin
+            while len(FilterType.__raw_list_cache) > FilterType.raw_list_cache_size:
+                FilterType.__raw_list_cache.popitem(last=False)
+        return fin
+
+    @staticmethod
+    def __raw_list_keys(pt: str) -> frozenset:
+        return FilterType.__list_cached(FilterType.__list_cache_key(pt), lambda: FilterType.parse_raw_list(pt))
+
+    @staticmethod
+    def clear_raw_list_cache():
+        with FilterType.__raw_list_lock:
+            FilterType.__raw_list_cache.clear()
+
+    @staticmethod
+    def check_raw_list(raw: str, pt: str) -> bool:
+        return str(raw).strip() in FilterType.__raw_list_keys(pt)
 
     @staticmethod
     def check_reg_exp(raw: str, pt: re.Pattern) -> bool:
         if not raw:
             return False
-        if re.search(pt, str(raw).strip()):
+        if isinstance(pt, str):
+            pt = re.compile(pt)
+        if pt.search(str(raw).strip()):
             return True
         return False
 
     @staticmethod
-    def check_py_exp(X: str, pt: str) -> bool:
+    def check_reg_multi(raw: str, pt) -> bool:
+        if not raw:
+            return False
+        if isinstance(pt, str):
+            pt = FilterType.compile_reg_multi(pt)
+        return pt.is_match(str(raw).strip())
+
+    @staticmethod
+    def check_kw_contains(raw: str, pt) -> bool:
+        if not raw:
+            return False
+        if isinstance(pt, str):
+            pt = FilterType.compile_kw_contains(pt)
+        return pt.is_match(str(raw).strip())
+
+    @staticmethod
+    @functools.lru_cache(maxsize=128)
+    def compile_py_exp(pt: str):
+        """
+        将表达式编译为 (X, T=None) -> bool 的函数, 只在受限的名称空间中执行
+        X 为单元格原始值, T 为按列类型转换后的值(见 Typed.py), 如 T > 100, T >= date(2020, 1, 1)
+        """
+        exp = pt.strip()
+        try:
+            # 先单独编译校验, 保证输入是单个表达式
+            tree = compile(exp, '<py_exp>', 'eval', ast.PyCF_ONLY_AST)
+            func = eval(compile("lambda X, T=None: ({0}\n)".format(exp), '<py_exp>', 'eval'),
+                        dict(FilterType.py_exp_namespace))
+        except SyntaxError as e:
+            raise Exception("表达式[{0}]错误,ERROR: {1}".format(exp, e))
+        func.py_exp = exp
+        func.uses_t = any(isinstance(m_item, ast.Name) and m_item.id == "T" for m_item in ast.walk(tree))
+        return func
+
+    @staticmethod
+    def check_py_exp(X: str, pt) -> bool:
         if not X:
             return False
-        # exp = pt.replace('X', str(raw).strip())
-        exp = pt
+        if isinstance(pt, str):
+            pt = FilterType.compile_py_exp(pt)
         try:
-            ret = eval(exp)
-            return ret
+            return pt(X)
         except Exception as e:
             # print(e)
-            raise Exception("表达式[{0}]错误,ERROR: {1}".format(exp, e))
-        return False
+            raise Exception("表达式[{0}]错误,ERROR: {1}".format(pt.py_exp, e))
 
     __check_map = {
         raw_list: lambda x, y: FilterType.check_raw_list(x, y),
         py_exp: lambda x, y: FilterType.check_py_exp(x, y),
-        reg_exp: lambda x, y: FilterType.check_reg_exp(x, y)
+        reg_exp: lambda x, y: FilterType.check_reg_exp(x, y),
+        reg_multi: lambda x, y: FilterType.check_reg_multi(x, y),
+        kw_contains: lambda x, y: FilterType.check_kw_contains(x, y)
+    }
+
+    __compile_map = {
+        raw_list: lambda y, **kw: FilterType.raw_list_checker(y, **kw),
+        py_exp: lambda y, **kw: FilterType.py_exp_checker(y, **kw),
+        reg_exp: lambda y, **kw: FilterType.reg_exp_checker(y, **kw),
+        reg_multi: lambda y, **kw: FilterType.reg_multi_checker(y, **kw),
+        kw_contains: lambda y, **kw: FilterType.kw_contains_checker(y, **kw)
+    }
+
+
+class FilterStats:
+    """单个叶子条件的统计: 求值次数, 通过次数, 出错次数, 累计耗时"""
+
+    def __init__(self, leaf: dict):
+        self.leaf = leaf
+        self.evals = 0
+        self.passed = 0
+        self.errors = 0
+        self.seconds = 0.0
+
+    def snapshot(self) -> dict:
+        return {
+            "filter_type": self.leaf["filter_type"],
+            "pattern": self.leaf["pattern"],
+            "filter_title": self.leaf["filter_title"],
+            "evals": self.evals,
+            "passed": self.passed,
+            "errors": self.errors,
+            "seconds": self.seconds,
+            "pass_rate": self.passed / self.evals if self.evals else None,
+            "ns_per_eval": self.seconds * 1e9 / self.evals if self.evals else None
+        }
+
+
+def normalize_filter_plan(plan) -> dict:
+    """
+    将筛选条件树整理为统一的 dict 形式:
+      {"and": [...]} / {"or": [...]} / {"not": 节点}
+      叶子: {"filter_type": int, "pattern": str, "filter_title": str[, "options": dict]}
+    也接受 (filter_type, pattern, filter_title) 元组作为叶子(json 中为 3 个字符串的列表), 其他列表视为 and
+    """
+    if isinstance(plan, tuple) or (isinstance(plan, list) and len(plan) == 3 and
+                                   not any(isinstance(m_item, (dict, list, tuple)) for m_item in plan)):
+        filter_type, pattern, filter_title = plan
+        plan = {"filter_type": filter_type, "pattern": pattern, "filter_title": filter_title}
+    elif isinstance(plan, list):
+        plan = {"and": plan}
+    if not isinstance(plan, dict):
+        raise Exception("筛选条件格式错误: {0}".format(plan))
+    if "and" in plan or "or" in plan:
+        op = "and" if "and" in plan else "or"
+        return {op: [normalize_filter_plan(m_item) for m_item in plan[op]]}
+    if "not" in plan:
+        return {"not": normalize_filter_plan(plan["not"])}
+    pattern = plan.get("pattern", "")
+    if isinstance(pattern, re.Pattern):
+        pattern = pattern.pattern
+    leaf = {
+        "filter_type": FilterType.parse(plan.get("filter_type")),
+        "pattern": pattern,
+        "filter_title": str(plan.get("filter_title", ""))
     }
+    if plan.get("options"):
+        leaf["options"] = dict(plan["options"])
+    return leaf
+
+
+# 共享子条件在当前行尚未求值的标记
+_UNSET = object()
+
+
+class _PlanCodeGen:
+    """
+    把条件树生成为 python 表达式源码, 叶子的判断函数放入 env
+    shared 中的节点(按 plan_node_key)在同一行内只求值一次, 结果缓存在局部变量中
+    stats 不为 None 时叶子的判断函数经 FilterType.instrument 包装, 统计按叶子累计到 stats[plan_node_key]
+    表达式用到 T 时按 types 中的列类型转换, 同一行同一列只转换一次, 结果缓存在局部变量 typed[列下标] 中
+    """
+
+    def __init__(self, title_map: dict, checkers: dict = None, shared: set = None, stats: dict = None,
+                 types: List[str] = None):
+        self.env = {"_U": _UNSET}
+        self.title_map = title_map
+        self.checkers = checkers
+        self.shared = shared or set()
+        self.stats = stats
+        self.types = types
+        self.names = {}
+        self.typed = {}
+
+    def __typed_value(self, idx: int) -> str:
+        if idx not in self.typed:
+            self.typed[idx] = "_t{0}".format(idx)
+            column_type = self.types[idx] if self.types and idx < len(self.types) else None
+            self.env["_T{0}".format(idx)] = get_converter(column_type)
+        return "({0} if {0} is not _U else ({0} := _T{1}(line[{1}])))".format(self.typed[idx], idx)
+
+    def gen(self, node: dict) -> str:
+        expr = self.__gen(node)
+        if self.shared:
+            key = plan_node_key(node)
+            if key in self.shared:
+                if key not in self.names:
+                    self.names[key] = "_s{0}".format(len(self.names))
+                return "({0} if {0} is not _U else ({0} := {1}))".format(self.names[key], expr)
+        return expr
+
+    def __gen(self, node: dict) -> str:
+        if "and" in node:
+            if not node["and"]:
+                return "True"
+            return "(" + " and ".join(self.gen(m_item) for m_item in node["and"]) + ")"
+        if "or" in node:
+            if not node["or"]:
+                return "False"
+            return "(" + " or ".join(self.gen(m_item) for m_item in node["or"]) + ")"
+        if "not" in node:
+            return "(not " + self.gen(node["not"]) + ")"
+        idx = self.title_map.get(node["filter_title"], None)
+        if idx is None:
+            raise Exception("筛选列[{0}]不存在, 可选列: {1}".format(node["filter_title"],
+                                                              list(self.title_map.keys())))
+        name = "_c{0}".format(len(self.env))
+        options = node.get("options", {})
+        key = (node["filter_type"], node["pattern"], tuple(sorted(options.items())))
+        if self.checkers is None:
+            self.env[name] = FilterType.compile(node["filter_type"], node["pattern"], **options)
+        else:
+            if key not in self.checkers:
+                self.checkers[key] = FilterType.compile(node["filter_type"], node["pattern"], **options)
+            self.env[name] = self.checkers[key]
+        uses_t = getattr(self.env[name], "uses_t", False)
+        if self.stats is not None:
+            leaf_key = plan_node_key(node)
+            if leaf_key not in self.stats:
+                self.stats[leaf_key] = FilterStats(node)
+            self.env[name] = FilterType.instrument(self.env[name], self.stats[leaf_key])
+        if uses_t:
+            return "{0}(line[{1}], {2})".format(name, idx, self.__typed_value(idx))
+        return "{0}(line[{1}])".format(name, idx)
+
+    def params(self) -> str:
+        """生成的函数中缓存列转换结果的局部变量, 以默认参数的形式声明"""
+        return "".join(", {0}=_U".format(m_item) for m_item in self.typed.values())
+
+
+def plan_node_key(node: dict) -> str:
+    """已整理的条件节点的唯一文本表示"""
+    return json.dumps(node, sort_keys=True, ensure_ascii=False, default=str)
+
+
+def plan_columns(plan, title_map: dict) -> set:
+    """条件树用到的列下标"""
+    node = normalize_filter_plan(plan)
+    if "and" in node or "or" in node:
+        fin = set()
+        for m_item in node.get("and", node.get("or", [])):
+            fin |= plan_columns(m_item, title_map)
+        return fin
+    if "not" in node:
+        return plan_columns(node["not"], title_map)
+    idx = title_map.get(node["filter_title"], None)
+    return set() if idx is None else {idx}
+
+
+def plan_uses_typed(plan) -> bool:
+    """条件树中是否有用到 T(按列类型转换后的值)的表达式条件"""
+    node = normalize_filter_plan(plan)
+    if "and" in node or "or" in node:
+        return any(plan_uses_typed(m_item) for m_item in node.get("and", node.get("or", [])))
+    if "not" in node:
+        return plan_uses_typed(node["not"])
+    return node["filter_type"] == FilterType.py_exp and isinstance(node["pattern"], str) and \
+        FilterType.compile_py_exp(node["pattern"]).uses_t
+
+
+def compile_filter_plan(plan, title_map: dict, checkers: dict = None, stats: dict = None,
+                        types: List[str] = None) -> Callable[[List], bool]:
+    """
+    把筛选条件树编译为单个函数 line -> bool
+    列名在编译时解析为下标, 列名不存在时直接报错
+    checkers: 可选, (filter_type, pattern, options) -> 已编译判断函数, 用于复用已解析的条件
+    stats: 可选, 统计各叶子条件的求值情况, 见 FilterStats
+    types: 可选, 各列类型(见 Typed.py), 表达式中的 T 按此转换, 未指定的列只去掉首尾空白
+    """
+    gen = _PlanCodeGen(title_map, checkers, stats=stats, types=types)
+    expr = gen.gen(normalize_filter_plan(plan))
+    src = "lambda line" + gen.params() + ": " + expr
+    return eval(compile(src, '<filter_plan>', 'eval'), gen.env)
+
+
+def compile_fan_out(plans: List, title_map: dict, checkers: dict = None,
+                    types: List[str] = None) -> Callable[[List], tuple]:
+    """
+    把多个条件树编译为单个函数 line -> (各条件的结果, ...)
+    多个条件树(或同一树内)重复出现的子条件每行只求值一次, 且仍按需短路求值
+    """
+    plans = [normalize_filter_plan(m_item) for m_item in plans]
+    counts = collections.Counter()
+
+    def _count(node: dict):
+        counts[plan_node_key(node)] += 1
+        for m_item in node.get("and", node.get("or", [])):
+            _count(m_item)
+        if "not" in node:
+            _count(node["not"])
+    for m_item in plans:
+        _count(m_item)
+
+    gen = _PlanCodeGen(title_map, checkers, {k for k, v in counts.items() if v > 1}, types=types)
+    exprs = [gen.gen(m_item) for m_item in plans]
+    src = "def _fan(line):\n"
+    if gen.names or gen.typed:
+        src += "    " + " = ".join(list(gen.names.values()) + list(gen.typed.values())) + " = _U\n"
+    src += "    return (" + "".join(m_item + ", " for m_item in exprs) + ")\n"
+    exec(compile(src, '<fan_out_plan>', 'exec'), gen.env)
+    return gen.env["_fan"]
+
+
+class AdaptiveConjunction:
+    """
+    自适应排序的 and 条件:
+    前 sample_rows 行对每个条件都求值, 统计通过率和耗时,
+    之后按 耗时 / (1 - 通过率) 从小到大排序, 便宜且筛掉行多的条件先执行;
+    每隔 retune_rows 行重新采样一次
+    条件按新顺序执行出错时, 改用原顺序重新判断, 保证结果与原顺序一致
+    """
+
+    def __init__(self, plan, title_map: dict, sample_rows: int = 1000, retune_rows: int = 100000,
+                 checkers: dict = None, stats: dict = None, types: List[str] = None):
+        self.__nodes = self.__flatten(normalize_filter_plan(plan))
+        self.__title_map = title_map
+        self.__checkers = {} if checkers is None else checkers
+        self.__stats = stats
+        self.__types = types
+        self.__funcs = [compile_filter_plan(m_item, title_map, self.__checkers, stats, types)
+                        for m_item in self.__nodes]
+        self.__orig = compile_filter_plan({"and": self.__nodes}, title_map, self.__checkers, stats, types)
+        self.__sample_rows = sample_rows
+        self.__retune_rows = retune_rows
+        self.__order = list(range(len(self.__nodes)))
+        self.__fast = self.__orig
+        self.__start_sampling()
+
+    @staticmethod
+    def __flatten(plan: dict) -> List[dict]:
+        if "and" not in plan:
+            return [plan]
+        fin = []
+        for m_item in plan["and"]:
+            fin.extend(AdaptiveConjunction.__flatten(m_item))
+        return fin
+
+    def __start_sampling(self):
+        self.__sampling_left = self.__sample_rows
+        self.__since = 0
+        self.__cost = [0.0] * len(self.__funcs)
+        self.__pass = [0] * len(self.__funcs)
+        self.__raised = [False] * len(self.__funcs)
+        self.__seen = 0
+
+    def __retune(self):
+        seen = self.__seen if self.__seen else 1
+
+        def _rank(i):
+            # 采样中出过错的条件依赖前面条件的短路, 保持原相对顺序放在最后
+            if self.__raised[i]:
+                return 1, i
+            fail_rate = 1 - self.__pass[i] / seen
+            if fail_rate <= 0:
+                return 0, float('inf')
+            return 0, (self.__cost[i] / seen) / fail_rate
+        self.__order = sorted(range(len(self.__funcs)), key=_rank)
+        self.__fast = compile_filter_plan({"and": [self.__nodes[i] for i in self.__order]}, self.__title_map,
+                                          self.__checkers, self.__stats, self.__types)
+
+    def __sample(self, line: List) -> bool:
+        ret = True
+        cost = []
+        passed = []
+        for i, f in enumerate(self.__funcs):
+            st = time.perf_counter()
+            try:
+                ok = f(line)
+            except Exception:
+                self.__raised[i] = True
+                # 原顺序下可能被前面的条件短路, 以原顺序结果为准
+                return self.__orig(line)
+            cost.append(time.perf_counter() - st)
+            passed.append(bool(ok))
+            ret = ret and bool(ok)
+        for i in range(len(cost)):
+            self.__cost[i] += cost[i]
+            self.__pass[i] += passed[i]
+        self.__seen += 1
+        self.__sampling_left -= 1
+        if self.__sampling_left <= 0:
+            self.__retune()
+        return ret
+
+    def __call__(self, line: List) -> bool:
+        if self.__sampling_left > 0:
+            return self.__sample(line)
+        self.__since += 1
+        if self.__since >= self.__retune_rows:
+            self.__start_sampling()
+        try:
+            return self.__fast(line)
+        except Exception:
+            return self.__orig(line)
+
+    def get_order(self) -> List[dict]:
+        return [self.__nodes[i] for i in self.__order]
+
+
+# 不影响读出内容的输入参数, 结果缓存和断点不比较这些参数
+_READ_IGNORED_OPTIONS = {"instrument", "adaptive", "adaptive_sample_rows", "adaptive_retune_rows", "workers",
+                         "cache_dir", "cache_max_bytes", "cache_verify", "fileobj"}
 
 
 class _MetaInputTab(metaclass=abc.ABCMeta):
     def __init__(self, file_path: str, title_pos: Tuple, data_pos: Tuple, **kwargs):
         self.__filter_pool = []
+        self.__filter_plan = None
+        self.__match = None
+        self.__batch_match = None
+        # 批量判断(见 Vector.py), vectorize=False 时逐行判断
+        self.__vectorize = kwargs.get("vectorize", True)
+        # 只读取的列(标题下标), None 为全部列, 见 set_columns
+        self.__columns = None
+        # 列类型, 条件中的表达式用到 T 时按前 infer_rows 行推断, 见 infer_types
+        self.__column_types = None
+        self.__needs_types = None
+        self.__infer_rows = kwargs.get("infer_rows", 1000)
+        # 推断类型时预读的行及每行之后的读取位置
+        self.__peek = collections.deque()
+        self.__peek_pos = None
+        # 已编译的条件, 列表条件的 key 集合在 add_filter 时建立并绑定在此
+        self.__checkers = {}
+        self.file_path = file_path
         self.title_pos = title_pos
         self.data_pos = data_pos
         self.__paras = kwargs
+        # 自适应条件排序, adaptive=True 开启
+        self.__adaptive = None
+        if kwargs.get("adaptive", False):
+            self.set_adaptive(True, kwargs.get("adaptive_sample_rows", 1000), kwargs.get("adaptive_retune_rows", 100000))
         self.__title = self.read_title()
         self.__title_map = {}
         self.__read_cnt = 0
-        self.__total_cnt = self.get_total_data_len()
+        # 总行数在首次查询进度时才计算, 避免开始筛选前先完整扫描一遍输入
+        self.__total_cnt = None
         for i, m_item in enumerate(self.__title):
             self.__title_map[m_item] = i
+        # 统计, instrument=True 或 set_instrument 开启: 读取调用次数/耗时, 各叶子条件的求值情况
+        self.__filter_stats = None
+        self.__read_calls = 0
+        self.__read_time = 0.0
+        if kwargs.get("instrument", False):
+            self.set_instrument(True)
 
     @abc.abstractmethod
     def read_nxt_raw_data_line(self) -> List:
@@ -105,38 +886,208 @@ class _MetaInputTab(metaclass=abc.ABCMeta):
         raise NotImplementedError
 
     def get_progress(self) -> float:
+        if self.__total_cnt is None:
+            self.__total_cnt = self.get_total_data_len()
+        if self.__total_cnt <= 0:
+            return 0.0
         return self.__read_cnt / self.__total_cnt
 
     def _read_nxt_raw_data_line(self) -> List:
+        if self.__peek:
+            fin, self.__peek_pos = self.__peek.popleft()
+            return fin
+        self.__peek_pos = None
         fin = self.read_nxt_raw_data_line()
         if fin:
             self.__read_cnt += 1
         return fin
 
+    def _get_position(self) -> int:
+        """已交给调用方的行之后的读取位置, 推断类型预读的行尚未取完时不是 get_position"""
+        if self.__peek_pos is not None:
+            return self.__peek_pos
+        return self.get_position()
+
+    def _sample_rows(self, n: int) -> List[List]:
+        """读取前 n 行用于推断类型, 读出的行暂存, 之后照常读出"""
+        fin = [m_item[0] for m_item in self.__peek]
+        while len(fin) < n:
+            line = self.read_nxt_raw_data_line()
+            if not line:
+                break
+            self.__read_cnt += 1
+            fin.append(line)
+            self.__peek.append((line, self.get_position()))
+        return fin
+
+    def infer_types(self):
+        """按前 infer_rows 行推断各列类型, 需在开始读取数据前调用; 已有类型或 infer_rows <= 0 时不做"""
+        if self.__column_types is not None or self.__infer_rows <= 0:
+            return
+        self.set_column_types(infer_column_types(self._sample_rows(self.__infer_rows)))
+
+    def set_column_types(self, types: List[str]):
+        self.__column_types = list(types) if types is not None else None
+        self.__match = None
+        self.__batch_match = None
+
+    def get_column_types(self) -> List[str]:
+        return self.__column_types
+
+    def needs_column_types(self) -> bool:
+        if self.__needs_types is None:
+            self.__needs_types = plan_uses_typed(self.get_filter_plan())
+        return self.__needs_types
+
+    def set_instrument(self, enable: bool = True):
+        """开启后读取和条件判断都会计时, 有额外开销; 多进程并行筛选时不统计条件"""
+        if enable and self.__filter_stats is None:
+            self.__filter_stats = {}
+            read = self.read_nxt_raw_data_line
+            perf_counter = time.perf_counter
+
+            def _timed_read() -> List:
+                st = perf_counter()
+                try:
+                    return read()
+                finally:
+                    self.__read_calls += 1
+                    self.__read_time += perf_counter() - st
+            self.read_nxt_raw_data_line = _timed_read
+        elif not enable and self.__filter_stats is not None:
+            self.__filter_stats = None
+            del self.read_nxt_raw_data_line
+        self.__match = None
+        self.__batch_match = None
+
+    def get_stats(self) -> dict:
+        fin = {"rows_read": self.__read_cnt}
+        if self.__filter_stats is not None:
+            fin["read_calls"] = self.__read_calls
+            fin["read_seconds"] = self.__read_time
+            fin["filters"] = [m_item.snapshot() for m_item in list(self.__filter_stats.values())]
+        return fin
+
+    def get_position(self) -> int:
+        """当前读取位置, 用于断点续传; 默认为已读取的数据行数"""
+        return self.__read_cnt
+
+    def seek_position(self, pos: int):
+        """跳到 get_position 返回的位置继续读取, 需在开始读取数据前调用"""
+        while self._get_position() < pos and self._read_nxt_raw_data_line():
+            pass
+
     def add_filter(self, filter_type: int, pattern: str, filter_title: str):
-        if filter_type == FilterType.reg_exp:
-            pattern = re.compile(pattern)
-        self.__filter_pool.append((filter_type, pattern, filter_title))
+        leaf = normalize_filter_plan((filter_type, pattern, filter_title))
+        # 条件与列名在此处校验, 表达式错误或列名不存在时直接抛出
+        compile_filter_plan(leaf, self.__title_map, self.__checkers)
+        self.__filter_pool.append(leaf)
+        self.__needs_types = None
+        self.__match = None
+        self.__batch_match = None
+
+    def set_filter_plan(self, plan):
+        """设置任意 and/or/not 组合的筛选条件树, 与 add_filter 添加的条件为 and 关系"""
+        plan = normalize_filter_plan(plan)
+        compile_filter_plan(plan, self.__title_map, self.__checkers)
+        self.__filter_plan = plan
+        self.__needs_types = None
+        self.__match = None
+        self.__batch_match = None
+
+    def get_filter_plan(self) -> dict:
+        if self.__filter_plan is None:
+            return {"and": list(self.__filter_pool)}
+        return {"and": self.__filter_pool + [self.__filter_plan]}
+
+    def get_title_map(self) -> dict:
+        return self.__title_map
+
+    def set_columns(self, columns):
+        """
+        只读取这些列(标题下标), 需在开始读取数据前调用; None 为读取全部列
+        读出的行仍按标题下标对应, 不需要的列不保证读出(可能为 None), 最后一个需要的列之后的列不读出
+        """
+        self.__columns = sorted(set(columns)) if columns is not None else None
+
+    def get_columns(self) -> List[int]:
+        return self.__columns
+
+    def get_options(self) -> dict:
+        """构造时传入的参数"""
+        return dict(self.__paras)
+
+    def get_read_options(self) -> dict:
+        """影响读出内容的构造参数(只含可以写入 json 的简单值)"""
+        return {k: v for k, v in self.__paras.items()
+                if k not in _READ_IGNORED_OPTIONS and (v is None or isinstance(v, (str, int, float, bool)))}
+
+    def set_adaptive(self, enable: bool = True, sample_rows: int = 1000, retune_rows: int = 100000):
+        self.__adaptive = (sample_rows, retune_rows) if enable else None
+        self.__match = None
+        self.__batch_match = None
+
+    def __compile_match(self):
+        if self.__adaptive is not None:
+            return AdaptiveConjunction(self.get_filter_plan(), self.__title_map, *self.__adaptive,
+                                       checkers=self.__checkers, stats=self.__filter_stats,
+                                       types=self.__column_types)
+        return compile_filter_plan(self.get_filter_plan(), self.__title_map, self.__checkers, self.__filter_stats,
+                                   self.__column_types)
+
+    def get_filter_order(self) -> List[dict]:
+        """当前实际执行的条件顺序"""
+        if isinstance(self.__match, AdaptiveConjunction):
+            return self.__match.get_order()
+        return self.get_filter_plan()["and"]
+
+    def is_parallel(self) -> bool:
+        """是否由 iter_parallel_batches 并行完成读取和筛选"""
+        return False
+
+    def iter_parallel_batches(self):
+        raise NotImplementedError
+
+    def get_match(self) -> Callable[[List], bool]:
+        """当前筛选条件编译后的判断函数 line -> bool"""
+        if self.__match is None:
+            self.__match = self.__compile_match()
+        return self.__match
+
+    def get_batch_match(self) -> Callable[[List[List]], List[int]]:
+        """
+        批量判断函数 rows -> 命中行的下标列表(升序), 结果与 get_match 逐行判断一致;
+        自适应排序, 统计条件或 vectorize=False 时按 get_match 逐行判断
+        """
+        if self.__batch_match is None:
+            if self.__vectorize and self.__adaptive is None and self.__filter_stats is None:
+                from Vector import compile_batch_plan
+                self.__batch_match = compile_batch_plan(self.get_filter_plan(), self.__title_map, self.__checkers,
+                                                        self.__column_types)
+            else:
+                match = self.get_match()
+                self.__batch_match = lambda rows: [i for i, line in enumerate(rows) if match(line)]
+        return self.__batch_match
 
     def read_nxt_data_line(self) -> List:
+        if self.__column_types is None and self.needs_column_types():
+            self.infer_types()
+        match = self.get_match()
         line = self._read_nxt_raw_data_line()
         while line:
-            match = True
-            for m_item in self.__filter_pool:
-                filter_type, pattern, filter_title = m_item
-                if self.__title_map.get(filter_title, None) is None:
-                    return []
-                if not FilterType.check(filter_type, line[self.__title_map[filter_title]], pattern):
-                    match = False
-                    break
-            if match:
+            if match(line):
                 return line
-            else:
-                line = self._read_nxt_raw_data_line()
+            line = self._read_nxt_raw_data_line()
 
         return []
 
 
+def output_head(title: List[str], filter_title: List[str] = None) -> List[str]:
+    """按输出列筛选后的列名, 不在输入中的列忽略; 未指定或都不在输入中时为全部列"""
+    fin = [m_item for m_item in filter_title if m_item in title] if filter_title else []
+    return fin if fin else list(title)
+
+
 class _MetaOutputTab(metaclass=abc.ABCMeta):
     def __init__(self, file_path: str, title: List[str], filter_title: List[str] = None, **kwargs):
         self.file_path = file_path
@@ -148,6 +1099,58 @@ class _MetaOutputTab(metaclass=abc.ABCMeta):
                     self.__filter_index_lst.append(title.index(item))
         else:
             self.__filter_index_lst = []
+        self.__head = output_head(title, filter_title)
+        self.__instrument = False
+        self.__write_calls = 0
+        self.__write_time = 0.0
+        self.__write_max = 0.0
+        self.__save_time = None
+        if kwargs.get("instrument", False):
+            self.set_instrument(True)
+
+    def set_instrument(self, enable: bool = True):
+        """开启后统计每次 write 的耗时(次数/累计/最大)"""
+        if enable and not self.__instrument:
+            write = self.write
+            perf_counter = time.perf_counter
+
+            def _timed_write(raw: List):
+                st = perf_counter()
+                try:
+                    return write(raw)
+                finally:
+                    cost = perf_counter() - st
+                    self.__write_calls += 1
+                    self.__write_time += cost
+                    if cost > self.__write_max:
+                        self.__write_max = cost
+            self.write = _timed_write
+        elif not enable and self.__instrument:
+            del self.write
+        self.__instrument = enable
+
+    def finish(self):
+        """保存输出并记录保存耗时"""
+        st = time.perf_counter()
+        self.save()
+        self.__save_time = time.perf_counter() - st
+
+    def get_stats(self) -> dict:
+        fin = {"rows_written": self.get_cur_len(), "save_seconds": self.__save_time}
+        if self.__instrument:
+            fin["write_calls"] = self.__write_calls
+            fin["write_seconds"] = self.__write_time
+            fin["write_max_seconds"] = self.__write_max
+            fin["write_mean_seconds"] = self.__write_time / self.__write_calls if self.__write_calls else None
+        return fin
+
+    def get_columns(self) -> List[int]:
+        """写入时用到的输入列下标, None 为全部列"""
+        return list(self.__filter_index_lst) if self.__filter_index_lst else None
+
+    def get_head(self) -> List[str]:
+        """输出的列名"""
+        return list(self.__head)
 
     def write(self, raw: List):
         if not self.__filter_index_lst:
@@ -166,6 +1169,17 @@ class _MetaOutputTab(metaclass=abc.ABCMeta):
     def save(self):
         raise NotImplementedError
 
+    def get_state(self) -> dict:
+        """
+        断点续传用的输出状态, 调用时先把已写入的行落盘;
+        构造时以 resume_state 传回即可从该状态续写. 不支持续写的输出返回 None
+        """
+        return None
+
+    def clear_state(self):
+        """任务完成后清理续写用的中间数据"""
+        pass
+
 
 class ExcelInputTab(_MetaInputTab):
     def __init__(self, file_path: str, title_pos: Tuple, data_pos: Tuple, **kwargs):
@@ -173,8 +1187,19 @@ class ExcelInputTab(_MetaInputTab):
         self.__file_path = file_path
         self.__output = None
         self.__tab = None
+        # 只读模式: 按行流式读取, 内存占用只与行宽相关
+        self.__read_only = kwargs.get("read_only", True)
+        self.__rows = None
+        # cache_dir: 开启列式缓存, 首次读取时转换整张表, 之后直接从缓存读取, 文件变化时自动重建
+        self.__sheet = None
+        if kwargs.get("cache_dir", None):
+            self.__init_cached(file_path, title_pos, data_pos, **kwargs)
+            super().__init__(file_path, title_pos, data_pos, **kwargs)
+            return
         try:
-            rb = openpyxl.open(file_path, data_only=True)
+            # openpyxl 较重, 只在实际读写 xlsx 时导入
+            import openpyxl
+            rb = openpyxl.open(file_path, read_only=self.__read_only, data_only=True)
             self.__output = rb
             self.__tab = self.__output.active
         except Exception as e:
@@ -183,12 +1208,27 @@ class ExcelInputTab(_MetaInputTab):
 
         self.__my_title = []
         self.__max_column = 0
+        self.__max_row = 0
         if self.__tab:
             cur_row = title_pos[0]
             cur_col = title_pos[1]
-            self.__max_column = self.__tab.max_column
+            if self.__read_only and (self.__tab.max_row is None or self.__tab.max_column is None):
+                # 文件未记录表格尺寸(如只写模式保存的文件): 不扫描整张表, 列数取标题行(无标题时取数据首行)的宽度,
+                # 行数在需要计算进度时再统计, 见 get_total_data_len
+                self.__tab.reset_dimensions()
+                width_row = cur_row if cur_row >= 0 else data_pos[0]
+                for row in self.__tab.iter_rows(min_row=width_row + 1, max_row=width_row + 1, values_only=True):
+                    self.__max_column = len(row)
+                self.__max_row = None
+            else:
+                self.__max_column = self.__tab.max_column
+                self.__max_row = self.__tab.max_row
             if title_pos[0] < 0:
                 self.__my_title = [str(i + 1) for i in list(range(self.__max_column))]
+            elif self.__read_only:
+                for row in self.__tab.iter_rows(min_row=cur_row + 1, max_row=cur_row + 1, min_col=cur_col + 1,
+                                                max_col=self.__max_column, values_only=True):
+                    self.__my_title = [str(m_item) for m_item in row]
             else:
                 m_item = self.__tab.cell(cur_row + 1, cur_col + 1).value
                 while cur_col < self.__max_column:
@@ -196,15 +1236,88 @@ class ExcelInputTab(_MetaInputTab):
                     cur_col += 1
                     m_item = self.__tab.cell(cur_row + 1, cur_col + 1).value
 
+            if self.__read_only and data_pos[1] < self.__max_column:
+                self.__rows = self.__tab.iter_rows(min_row=data_pos[0] + 1, min_col=data_pos[1] + 1,
+                                                   max_col=self.__max_column, values_only=True)
+
         self.__cur = data_pos[0] + 1
         super().__init__(file_path, title_pos, data_pos, **kwargs)
 
+    def __init_cached(self, file_path: str, title_pos: Tuple, data_pos: Tuple, **kwargs):
+        from Cache import ColumnarCache, DEFAULT_MAX_BYTES
+        try:
+            cache = ColumnarCache(kwargs["cache_dir"], kwargs.get("cache_max_bytes", DEFAULT_MAX_BYTES),
+                                  kwargs.get("cache_verify", False))
+            self.__sheet = cache.open(file_path)
+        except Exception as e:
+            print("open failed  ", self.__file_path, e)
+            raise e
+        # 与只读模式一致: 按缓存中的整表尺寸读取, 行补齐到最大列
+        self.__read_only = True
+        self.__max_column = self.__sheet.cols
+        self.__max_row = self.__sheet.rows
+        if title_pos[0] < 0:
+            self.__my_title = [str(i + 1) for i in list(range(self.__max_column))]
+        else:
+            self.__my_title = [str(m_item) for m_item in self.__sheet.row(title_pos[0], title_pos[1])]
+        if data_pos[1] < self.__max_column:
+            self.__rows = self.__sheet.iter_rows(data_pos[0], data_pos[1])
+        self.__cur = data_pos[0] + 1
+
+    def set_columns(self, columns):
+        if self.__cur != self.data_pos[0] + 1:
+            raise Exception("已开始读取数据, 不能修改读取的列")
+        super().set_columns(columns)
+        columns = self.get_columns()
+        data_pos = self.data_pos
+        if not self.__read_only or data_pos[1] >= self.__max_column:
+            return
+        if self.__sheet:
+            # 列式缓存只解码需要的列
+            if columns:
+                self.__rows = self.__scatter(
+                    self.__sheet.iter_rows(data_pos[0], columns=[data_pos[1] + i for i in columns]), columns)
+            else:
+                self.__rows = self.__sheet.iter_rows(data_pos[0], data_pos[1])
+        elif self.__tab:
+            # openpyxl 按行解析, 只能不读出最后一个需要的列之后的列
+            max_col = min(self.__max_column, data_pos[1] + columns[-1] + 1) if columns else self.__max_column
+            self.__rows = self.__tab.iter_rows(min_row=data_pos[0] + 1, min_col=data_pos[1] + 1,
+                                               max_col=max_col, values_only=True)
+
+    @staticmethod
+    def __scatter(rows, columns: List[int]):
+        width = columns[-1] + 1
+        for row in rows:
+            fin = [None] * width
+            for i, m_item in zip(columns, row):
+                fin[i] = m_item
+            yield fin
+
     def read_nxt_raw_data_line(self) -> List:
+        if self.__read_only:
+            if self.__rows is None:
+                return []
+            row = next(self.__rows, None)
+            if row is None:
+                return []
+            self.__cur += 1
+            return list(row)
+
         fin = []
 
         cur_col = self.data_pos[1] + 1
         if self.__tab:
-            if self.__cur > self.__tab.max_row:
+            if self.__cur > self.__max_row:
+                return fin
+            columns = self.get_columns()
+            if columns:
+                # 只读取需要的单元格
+                fin = [None] * (columns[-1] + 1)
+                for i in columns:
+                    if cur_col + i <= self.__max_column:
+                        fin[i] = self.__tab.cell(self.__cur, cur_col + i).value
+                self.__cur += 1
                 return fin
             m_item = self.__tab.cell(self.__cur, cur_col).value
             while cur_col <= self.__max_column:
@@ -215,16 +1328,126 @@ class ExcelInputTab(_MetaInputTab):
         return fin
 
     def get_total_data_len(self) -> int:
-        if self.__tab:
-            return self.__tab.max_row - self.data_pos[0]
+        if self.__tab and self.__max_row is None:
+            self.__max_row = self.__count_rows()
+        if self.__tab or self.__sheet:
+            return self.__max_row - self.data_pos[0]
         return 0
 
+    def __count_rows(self) -> int:
+        """未记录表格尺寸时按 <row r="n"> 标签统计行数, 只解压不解析 xml, 另开文件句柄不影响正在进行的读取"""
+        import zipfile
+        pattern = re.compile(rb'<(?:\w+:)?row\b([^>]*)>')
+        index = re.compile(rb'\br="(\d+)"')
+        fin = 0
+        tail = b''
+        try:
+            with zipfile.ZipFile(self.__file_path) as zf, zf.open(self.__tab._worksheet_path) as f:
+                chunk = f.read(1 << 20)
+                while chunk:
+                    buf = tail + chunk
+                    # 末尾可能是不完整的标签, 留到下一块
+                    cut = buf.rfind(b'<')
+                    if cut < 0:
+                        cut = len(buf)
+                    for m_item in pattern.finditer(buf, 0, cut):
+                        r = index.search(m_item.group(1))
+                        fin = int(r.group(1)) if r else fin + 1
+                    tail = buf[cut:]
+                    chunk = f.read(1 << 20)
+        except Exception as e:
+            logger.warning("count rows failed %s: %s", self.__file_path, e)
+        return fin
+
     def read_title(self) -> List:
         return self.__my_title
 
     def close(self):
         if self.__output:
             self.__output.close()
+        if self.__sheet:
+            self.__rows = None
+            self.__sheet.close()
+            self.__sheet = None
+
+
+def count_lines(file_path: str, chunk_size: int = 1 << 20) -> int:
+    """按块统计文件行数, 不构造行列表; 末行无换行符时也计为一行"""
+    cnt = 0
+    last = b''
+    with open(file_path, 'rb') as f:
+        chunk = f.read(chunk_size)
+        while chunk:
+            cnt += chunk.count(b'\n')
+            last = chunk
+            chunk = f.read(chunk_size)
+    if last and not last.endswith(b'\n'):
+        cnt += 1
+    return cnt
+
+
+def split_line_ranges(file_path: str, start: int, end: int, chunk_bytes: int) -> List[Tuple[int, int]]:
+    """把 [start, end) 切分为约 chunk_bytes 大小的字节区间, 区间边界对齐到行首"""
+    fin = []
+    with open(file_path, 'rb') as f:
+        cur = start
+        while cur < end:
+            nxt = cur + chunk_bytes
+            if nxt >= end:
+                nxt = end
+            else:
+                f.seek(nxt - 1)
+                f.readline()
+                nxt = min(f.tell(), end)
+            fin.append((cur, nxt))
+            cur = nxt
+    return fin
+
+
+# 并行筛选子进程内的筛选条件等, 由 _init_csv_worker 在进程启动时设置一次
+_csv_worker_env = {}
+
+
+def _init_csv_worker(plan: dict, title: List, sep: str, encoding: str, col_start: int, max_split: int = -1,
+                     types: List[str] = None):
+    title_map = {}
+    for i, m_item in enumerate(title):
+        title_map[m_item] = i
+    from Vector import compile_batch_plan
+    _csv_worker_env["match"] = compile_batch_plan(plan, title_map, types=types)
+    _csv_worker_env["sep"] = sep
+    _csv_worker_env["encoding"] = encoding
+    _csv_worker_env["col_start"] = col_start
+    _csv_worker_env["max_split"] = max_split
+
+
+def _filter_csv_range(file_path: str, start: int, end: int) -> Tuple[List[List], bool]:
+    """
+    在子进程中筛选 [start, end) 内的行, 解析方式与 CsvInputTab.read_nxt_raw_data_line 一致
+    返回 (命中的行, 是否遇到了结束读取的空行)
+    """
+    match = _csv_worker_env["match"]
+    sep = _csv_worker_env["sep"]
+    encoding = _csv_worker_env["encoding"]
+    col_start = _csv_worker_env["col_start"]
+    max_split = _csv_worker_env["max_split"]
+    col_end = max_split if max_split >= 0 else None
+    rows = []
+    stopped = False
+    with open(file_path, 'rb') as f:
+        f.seek(start)
+        pos = start
+        while pos < end:
+            line = f.readline()
+            if not line:
+                break
+            pos += len(line)
+            row = line.decode(encoding).strip().split(sep, max_split)[col_start:col_end]
+            if not row:
+                stopped = True
+                break
+            rows.append(row)
+    return [rows[i] for i in match(rows)], stopped
 
 
 class CsvInputTab(_MetaInputTab):
@@ -232,48 +1455,163 @@ class CsvInputTab(_MetaInputTab):
 
         self.__file_path = file_path
         self.__sep = kwargs.get("sep", ',')
+        self.__encoding = kwargs.get("encoding", None) or locale.getpreferredencoding(False)
+        # workers > 1 时按字节区间多进程并行筛选
+        self.__workers = kwargs.get("workers", 1)
+        self.__chunk_bytes = kwargs.get("chunk_bytes", 8 << 20)
+        # 只需要前面的列时, 拆分到最后一个需要的列为止, 见 set_columns
+        self.__max_split = -1
+        self.__col_end = None
+        # fileobj: 从已打开的二进制流(如 sys.stdin.buffer)读取, 此时总大小未知
+        self.__stream = kwargs.get("fileobj", None)
         self.__f = None
-        try:
-            self.__f = open(file_path, 'r+')
-        except FileNotFoundError:
-            print("not found ", self.__file_path)
+        self.__size = 0
+        self.__pos = 0
+        self.__pending = None
+        if self.__stream is not None:
+            self.__f = self.__stream
+            self.__size = None
+        else:
+            try:
+                # 二进制方式读取, 以字节偏移量计算进度
+                self.__f = open(file_path, 'rb')
+                self.__size = os.path.getsize(file_path)
+            except FileNotFoundError:
+                print("not found ", self.__file_path)
         cnt = 0
         title = []
         if title_pos[0] < 0:
             max_col_len = 0
-            try:
-                with open(self.__file_path, 'r') as f:
-                    max_col_len = f.readline().split(self.__sep).__len__()
-            except FileNotFoundError:
-                print("not found ", self.__file_path)
+            if self.__f:
+                line = self.__readline()
+                max_col_len = self.__decode(line).split(self.__sep).__len__()
+                # 首行仍是数据, 放回去
+                self.__pending = line
+                self.__pos -= len(line)
             self.__my_title = [str(i + 1) for i in list(range(max_col_len))]
         else:
             if self.__f:
                 while cnt < title_pos[0]:
-                    self.__f.readline()
+                    self.__readline()
                     cnt += 1
-                title = self.__f.readline().strip().split(self.__sep)[title_pos[1]:]
+                title = self.__decode(self.__readline()).strip().split(self.__sep)[title_pos[1]:]
                 cnt += 1
             self.__my_title = title
 
         # 读到数据起始
-        while cnt < data_pos[0]:
-            self.__f.readline()
-            cnt += 1
+        if self.__f:
+            while cnt < data_pos[0]:
+                self.__readline()
+                cnt += 1
+        self.__start = self.__pos
 
         super().__init__(file_path, title_pos, data_pos, **kwargs)
 
+    def __readline(self) -> bytes:
+        if self.__pending is not None:
+            line = self.__pending
+            self.__pending = None
+        else:
+            line = self.__f.readline()
+        self.__pos += len(line)
+        return line
+
+    def __decode(self, line: bytes) -> str:
+        return line.decode(self.__encoding)
+
     def read_nxt_raw_data_line(self) -> List:
         fin = []
         if self.__f:
-            fin = self.__f.readline().strip().split(self.__sep)[self.data_pos[1]:]
+            line = self.__readline()
+            if not line:
+                return fin
+            fin = self.__decode(line).strip().split(self.__sep, self.__max_split)[self.data_pos[1]:self.__col_end]
         return fin
 
+    def _sample_rows(self, n: int) -> List[List]:
+        if self.__stream is not None or not self.__f:
+            return super()._sample_rows(n)
+        # 文件可以定位, 读完样本后回到原位置, 不需要暂存
+        start = self.__pos
+        fin = []
+        while len(fin) < n:
+            line = self.read_nxt_raw_data_line()
+            if not line:
+                break
+            fin.append(line)
+        self.seek_position(start)
+        return fin
+
+    def set_columns(self, columns):
+        super().set_columns(columns)
+        columns = self.get_columns()
+        if columns:
+            self.__col_end = self.data_pos[1] + columns[-1] + 1
+            self.__max_split = self.__col_end
+        else:
+            self.__col_end = None
+            self.__max_split = -1
+
+    def get_position(self) -> int:
+        # 按字节偏移量记录, 续传时直接定位
+        return self.__pos
+
+    def seek_position(self, pos: int):
+        if self.__stream is not None:
+            raise Exception("标准输入不支持断点续传")
+        if self.__f:
+            self.__pending = None
+            self.__f.seek(pos)
+            self.__pos = pos
+
+    def is_parallel(self) -> bool:
+        return self.__workers > 1 and self.__f is not None and self.__stream is None
+
+    def iter_parallel_batches(self):
+        """
+        文件按行对齐切分为 chunk_bytes 大小的区间, 由进程池并行筛选,
+        按原顺序逐个区间返回命中的行; 同时在途的区间不超过 2 * workers 个
+        """
+        import multiprocessing
+        ranges = split_line_ranges(self.__file_path, self.__pos, self.__size, self.__chunk_bytes)
+        pool = multiprocessing.Pool(self.__workers, initializer=_init_csv_worker,
+                                    initargs=(self.get_filter_plan(), self.read_title(), self.__sep,
+                                              self.__encoding, self.data_pos[1], self.__max_split,
+                                              self.get_column_types()))
+        try:
+            pending = collections.deque()
+            it = iter(ranges)
+            for m_item in it:
+                pending.append((m_item, pool.apply_async(_filter_csv_range, (self.__file_path,) + m_item)))
+                if len(pending) >= 2 * self.__workers:
+                    break
+            while pending:
+                m_range, ret = pending.popleft()
+                rows, stopped = ret.get()
+                self.__pos = m_range[1]
+                yield rows
+                if stopped:
+                    break
+                m_item = next(it, None)
+                if m_item is not None:
+                    pending.append((m_item, pool.apply_async(_filter_csv_range, (self.__file_path,) + m_item)))
+            self.__pos = self.__size
+        finally:
+            pool.terminate()
+
+    def get_progress(self) -> float:
+        if self.__size is None:
+            return 0.0
+        if self.__size <= self.__start:
+            return 1.0 if self.__f else 0.0
+        return (self.__pos - self.__start) / (self.__size - self.__start)
+
     def get_total_data_len(self) -> int:
         tt_len = 0
+        if self.__stream is not None:
+            return tt_len
         try:
-            with open(self.__file_path, 'r') as f:
-                tt_len = f.readlines().__len__() - self.data_pos[0]
+            tt_len = count_lines(self.__file_path) - self.data_pos[0]
         except FileNotFoundError:
             print("not found ", self.__file_path)
         return tt_len
@@ -282,39 +1620,142 @@ class CsvInputTab(_MetaInputTab):
         return self.__my_title
 
     def close(self):
-        if self.__f:
+        if self.__f and self.__stream is None:
             self.__f.close()
 
 
+# Excel 单表最大行数
+EXCEL_MAX_ROWS = 1048576
+
+
 class ExcelOutputTab(_MetaOutputTab):
     def __init__(self, file_path: str, title: List[str], filter_title: List[str] = None, **kwargs):
         super().__init__(file_path, title, filter_title, **kwargs)
-        self.__output = openpyxl.Workbook()
-        self.__tab = self.__output.active
-        self.__cur = 1
-        print(filter_title)
-        for i, m_item in enumerate(filter_title if filter_title else title):
-            self.__tab.cell(self.__cur, i + 1, m_item)
-        self.__cur += 1
+        # 只写模式: 整行追加流式写入, 内存占用不随行数增长
+        self.__write_only = kwargs.get("write_only", True)
+        # 超出单表行数后换新表(sheet)或新文件(file)
+        self.__rollover = kwargs.get("rollover", "sheet")
+        self.__max_rows = kwargs.get("max_rows", EXCEL_MAX_ROWS)
+        self.__head = list(filter_title if filter_title else title)
+        self.__part = 1
+        logger.debug("output columns: %s", filter_title)
+        import openpyxl
+        if self.__write_only:
+            self.__output = openpyxl.Workbook(write_only=True)
+            self.__new_sheet()
+            self.__cnt = 0
+        else:
+            self.__output = openpyxl.Workbook()
+            self.__tab = self.__output.active
+            self.__cur = 1
+            for i, m_item in enumerate(self.__head):
+                self.__tab.cell(self.__cur, i + 1, m_item)
+            self.__cur += 1
+        # 断点续传: xlsx 只能整体保存, 写入的行同时按批 pickle 到 journal 文件, 续写时先重放
+        self.__journal_path = kwargs.get("journal", None)
+        self.__journal = None
+        self.__journal_buf = []
+        if self.__journal_path:
+            self.__open_journal(kwargs.get("resume_state", None))
+
+    def __open_journal(self, state: dict):
+        if not state:
+            self.__journal = open(self.__journal_path, 'wb')
+            return
+        self.__journal = open(self.__journal_path, 'r+b')
+        end = state["journal_pos"]
+        while self.__journal.tell() < end:
+            for raw in pickle.load(self.__journal):
+                self.__write(raw)
+        self.__journal.truncate()
+
+    def __new_sheet(self):
+        self.__tab = self.__output.create_sheet()
+        self.__tab.append(self.__head)
+        self.__sheet_rows = 1
+
+    def __part_path(self, part: int) -> str:
+        if part <= 1:
+            return self.file_path
+        name, ext = os.path.splitext(self.file_path)
+        return "{0}_{1}{2}".format(name, part, ext)
+
+    def __roll(self):
+        if self.__rollover == "file":
+            import openpyxl
+            self.__output.save(self.__part_path(self.__part))
+            self.__output = openpyxl.Workbook(write_only=True)
+        self.__part += 1
+        self.__new_sheet()
 
     def write_raw(self, raw: List):
+        if self.__journal is not None:
+            self.__journal_buf.append(raw)
+            if len(self.__journal_buf) >= 1000:
+                self.__flush_journal()
+        self.__write(raw)
+
+    def __flush_journal(self):
+        if self.__journal_buf:
+            pickle.dump(self.__journal_buf, self.__journal)
+            self.__journal_buf = []
+
+    def __write(self, raw: List):
+        if self.__write_only:
+            if self.__sheet_rows >= self.__max_rows:
+                self.__roll()
+            self.__tab.append(raw)
+            self.__sheet_rows += 1
+            self.__cnt += 1
+            return
         for i, m_item in enumerate(raw):
             self.__tab.cell(self.__cur, i + 1, m_item)
         self.__cur += 1
 
     def get_cur_len(self) -> int:
+        if self.__write_only:
+            return self.__cnt
         return self.__cur
 
+    def get_state(self) -> dict:
+        if self.__journal is None:
+            return None
+        self.__flush_journal()
+        self.__journal.flush()
+        return {"rows": self.get_cur_len(), "journal_pos": self.__journal.tell()}
+
+    def clear_state(self):
+        if self.__journal_path and os.path.isfile(self.__journal_path):
+            os.remove(self.__journal_path)
+
     def save(self):
-        print(self.file_path)
+        if self.__journal is not None:
+            self.__flush_journal()
+            self.__journal.close()
+        if self.__write_only:
+            path = self.__part_path(self.__part) if self.__rollover == "file" else self.file_path
+            logger.debug("save %s", path)
+            self.__output.save(path)
+            return
+        logger.debug("save %s", self.file_path)
         self.__output.save(self.file_path)
 
 
 class CsvOutputTab(_MetaOutputTab):
     def __init__(self, file_path: str, title: List[str], filter_title: List[str] = None, **kwargs):
         super().__init__(file_path, title, filter_title, **kwargs)
-        self.__f = open(file_path, 'w+', encoding='utf-8')
+        # fileobj: 写入已打开的文本流(如 sys.stdout), 保存时只刷新不关闭
+        self.__stream = kwargs.get("fileobj", None)
         self.__sep = kwargs.get("sep", ',')
+        # resume_state: 断点续传, 截掉断点之后写入的内容后接着写
+        state = kwargs.get("resume_state", None)
+        if state and self.__stream is None:
+            self.__f = open(file_path, 'r+', encoding='utf-8')
+            self.__f.seek(state["offset"])
+            self.__f.truncate()
+            self.__cur = state["rows"]
+            return
+        self.__f = self.__stream if self.__stream is not None else open(file_path, 'w+', encoding='utf-8')
         self.__f.write(self.__sep.join(filter_title if filter_title else title))
         self.__f.write('\n')
         self.__cur = 0
@@ -327,39 +1768,616 @@ class CsvOutputTab(_MetaOutputTab):
     def get_cur_len(self) -> int:
         return self.__cur
 
+    def get_state(self) -> dict:
+        if self.__stream is not None:
+            return None
+        self.__f.flush()
+        return {"rows": self.__cur, "offset": self.__f.tell()}
+
     def save(self):
-        if self.__f:
+        if self.__stream is not None:
+            self.__stream.flush()
+        elif self.__f:
             self.__f.close()
 
 
+# 拆分输出路径中替换为拆分列取值的占位符
+PARTITION_PLACEHOLDER = "{value}"
+
+
+class PartitionedOutputTab(_MetaOutputTab):
+    """
+    按某列(partition_by)的取值拆分输出, 一次读取写出多个文件:
+    file_path 中的 {value} 替换为该列的值, 如 out/{value}.csv; 不含 {value} 时为 <目录>/<文件名>_<值><扩展名>
+    各分区先缓存在内存, 累计 buffer_rows 行后集中写出; 同时打开的文件不超过 max_open 个,
+    超出时关闭最久未写入的文件, 再次写入时追加打开
+    xlsx 不能追加写入, 先 pickle 暂存到临时目录, 保存时逐个转换
+    """
+
+    def __init__(self, file_path: str, title: List[str], filter_title: List[str] = None, **kwargs):
+        super().__init__(file_path, title, filter_title, **kwargs)
+        partition_by = kwargs.get("partition_by", None)
+        if partition_by is None or partition_by not in title:
+            raise Exception("拆分列[{0}]不存在".format(partition_by))
+        self.__key_idx = title.index(partition_by)
+        self.__index_lst = [title.index(m_item) for m_item in filter_title if m_item in title] if filter_title else []
+        self.__head = [title[i] for i in self.__index_lst] if self.__index_lst else list(title)
+        # write_raw 收到的是已按输出列截取的行
+        self.__raw_key_idx = self.__head.index(partition_by) if partition_by in self.__head else -1
+        self.__sep = kwargs.get("sep", ',')
+        self.__max_open = max(1, kwargs.get("max_open", 64))
+        self.__buffer_rows = kwargs.get("buffer_rows", 100000)
+        self.__out_kwargs = kwargs.get("out_kwargs", None) or {}
+        self.__excel = os.path.splitext(file_path)[-1].lower() in ('.xlsx', '.xls')
+        self.__spool = None
+        if self.__excel:
+            import tempfile
+            self.__spool = tempfile.mkdtemp(prefix="partition_")
+        # 分区路径 -> 待写入的行 / 已写入行数 / 暂存文件路径
+        self.__buf = {}
+        self.__buf_len = 0
+        self.__cnt = {}
+        self.__tmp = {}
+        # 打开的文件, 按最近写入排序
+        self.__open = collections.OrderedDict()
+        self.__cur = 0
+
+    @staticmethod
+    def format_value(value) -> str:
+        """分区取值转为文件名, 去掉路径分隔符等不能出现在文件名中的字符"""
+        text = "" if value is None else str(value).strip()
+        text = re.sub(r'[\\/:*?"<>|\r\n\t]', "_", text)
+        if not text or text in (".", ".."):
+            text = "_"
+        return text
+
+    def get_partition_path(self, value) -> str:
+        name = self.format_value(value)
+        if PARTITION_PLACEHOLDER in self.file_path:
+            return self.file_path.replace(PARTITION_PLACEHOLDER, name)
+        stem, ext = os.path.splitext(self.file_path)
+        return "{0}_{1}{2}".format(stem, name, ext)
+
+    def get_columns(self) -> List[int]:
+        columns = super().get_columns()
+        return None if columns is None else columns + [self.__key_idx]
+
+    def write(self, raw: List):
+        value = raw[self.__key_idx] if self.__key_idx < len(raw) else None
+        if self.__index_lst:
+            raw = [raw[i] for i in self.__index_lst]
+        self.__append(value, raw)
+
+    def write_raw(self, raw: List):
+        if self.__raw_key_idx < 0:
+            raise Exception("输出列中没有拆分列")
+        self.__append(raw[self.__raw_key_idx] if self.__raw_key_idx < len(raw) else None, raw)
+
+    def __append(self, value, raw: List):
+        path = self.get_partition_path(value)
+        buf = self.__buf.get(path, None)
+        if buf is None:
+            buf = self.__buf[path] = []
+        buf.append(raw)
+        self.__buf_len += 1
+        self.__cur += 1
+        if self.__buf_len >= self.__buffer_rows:
+            self.__flush()
+
+    def __handle(self, path: str):
+        f = self.__open.get(path, None)
+        if f is not None:
+            self.__open.move_to_end(path)
+            return f
+        while len(self.__open) >= self.__max_open:
+            self.__open.popitem(last=False)[1].close()
+        if self.__excel:
+            if path not in self.__tmp:
+                self.__tmp[path] = os.path.join(self.__spool, "{0}.pkl".format(len(self.__tmp)))
+                f = open(self.__tmp[path], 'wb')
+            else:
+                f = open(self.__tmp[path], 'ab')
+        elif path not in self.__cnt:
+            folder = os.path.dirname(path)
+            if folder:
+                os.makedirs(folder, exist_ok=True)
+            f = open(path, 'w+', encoding='utf-8')
+            f.write(self.__sep.join(self.__head))
+            f.write('\n')
+        else:
+            f = open(path, 'a', encoding='utf-8')
+        self.__open[path] = f
+        return f
+
+    def __flush(self):
+        for path, rows in self.__buf.items():
+            f = self.__handle(path)
+            if self.__excel:
+                pickle.dump(rows, f)
+            else:
+                f.write("".join(self.__sep.join([str(m_item) if m_item is not None else '' for m_item in raw]) + '\n'
+                                for raw in rows))
+            self.__cnt[path] = self.__cnt.get(path, 0) + len(rows)
+        self.__buf = {}
+        self.__buf_len = 0
+
+    def __close_all(self):
+        while self.__open:
+            self.__open.popitem(last=False)[1].close()
+
+    def get_cur_len(self) -> int:
+        return self.__cur
+
+    def get_partitions(self) -> dict:
+        """各分区输出路径及写入行数"""
+        fin = dict(self.__cnt)
+        for path, rows in self.__buf.items():
+            fin[path] = fin.get(path, 0) + len(rows)
+        return fin
+
+    def save(self):
+        try:
+            self.__flush()
+        finally:
+            self.__close_all()
+        if not self.__excel:
+            return
+        import shutil
+        try:
+            for path, tmp in self.__tmp.items():
+                folder = os.path.dirname(path)
+                if folder:
+                    os.makedirs(folder, exist_ok=True)
+                ao = ExcelOutputTab(path, self.__head, **self.__out_kwargs)
+                with open(tmp, 'rb') as f:
+                    while True:
+                        try:
+                            rows = pickle.load(f)
+                        except EOFError:
+                            break
+                        for raw in rows:
+                            ao.write_raw(raw)
+                ao.save()
+        finally:
+            shutil.rmtree(self.__spool, ignore_errors=True)
+
+
+class StageStats:
+    """流水线单个阶段的统计: 处理行数/批数, 工作耗时, 等待上游或下游的耗时"""
+
+    def __init__(self, name: str):
+        self.name = name
+        self.rows = 0
+        self.batches = 0
+        self.busy = 0.0
+        self.wait = 0.0
+
+    def snapshot(self) -> dict:
+        return {
+            "rows": self.rows,
+            "batches": self.batches,
+            "busy": self.busy,
+            "wait": self.wait,
+            "rows_per_sec": self.rows / self.busy if self.busy > 0 else 0.0
+        }
+
+
+CHECKPOINT_VERSION = 2
+
+
+def _file_fingerprint(file_path: str) -> list:
+    st = os.stat(file_path)
+    return [st.st_size, st.st_mtime_ns]
+
+
+def load_checkpoint(path: str, tab_in: _MetaInputTab = None, out_path: str = None,
+                    filter_title: List[str] = None) -> dict:
+    """
+    读取 Task 写入的断点文件; 文件不存在, 或以下任意一项与断点不一致时返回 None:
+        输入文件(路径/大小/修改时间)、标题/数据起始位置、读取参数、筛选条件、输出列(filter_title, 同输出表)、输出路径
+    返回值以 resume_state 传给 Task, 其中 output_state 传给输出表(见 checkpoint_output_kwargs)
+    """
+    if not path or not os.path.isfile(path):
+        return None
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            state = json.load(f)
+        if state.get("version") != CHECKPOINT_VERSION or not state.get("output_state"):
+            return None
+        if tab_in is not None:
+            if os.path.abspath(tab_in.file_path) != state["input"] or \
+                    _file_fingerprint(tab_in.file_path) != state["input_fingerprint"] or \
+                    plan_node_key(tab_in.get_filter_plan()) != state["plan"] or \
+                    list(tab_in.title_pos) != state["title_pos"] or list(tab_in.data_pos) != state["data_pos"] or \
+                    tab_in.get_read_options() != state["read_options"] or \
+                    output_head(tab_in.read_title(), filter_title) != state["output_head"]:
+                return None
+        if out_path is not None and os.path.abspath(out_path) != state["output"]:
+            return None
+        return state
+    except Exception as e:
+        logger.warning("checkpoint ignored %s: %s", path, e)
+        return None
+
+
+def checkpoint_output_kwargs(checkpoint: str, state: dict = None) -> dict:
+    """开启断点续传时构造输出表需要的参数: xlsx 的行日志路径, 续写时的输出状态; 未开启时为空"""
+    if not checkpoint:
+        return {}
+    return {"journal": checkpoint + ".rows", "resume_state": state["output_state"] if state else None}
+
+
 class Task:
-    def __init__(self, tab_in: _MetaInputTab, tab_out: _MetaOutputTab):
+    """
+    读取 -> 筛选 -> 写入 三个阶段各占一个线程, 阶段间用有界队列按批传递行,
+    队列满时上游阻塞等待, 内存占用不超过 2 * queue_size * batch_size 行
+    可暂停(pause/resume)和取消(cancel); 指定 checkpoint 时每隔 checkpoint_interval 秒把
+    已写出的行对应的输入位置和输出状态写入断点文件, 中断后以 resume_state=load_checkpoint(...) 续传
+    instrument=True 统计读取/各条件/写入耗时, profile=True(或 .prof 文件路径) 对各阶段线程做 cProfile,
+    trace_memory=True 用 tracemalloc 记录内存分配, 结果见 get_stats
+    指定 memo_dir 时记录命中的行号(见 Memo.py), 再次执行相同的输入和条件时不再判断条件, 读到最后一个命中行即结束;
+    续传和多进程并行筛选时不使用
+    """
+
+    def __init__(self, tab_in: _MetaInputTab, tab_out: _MetaOutputTab, batch_size: int = 500, queue_size: int = 8,
+                 checkpoint: str = None, checkpoint_interval: float = 30.0, resume_state: dict = None,
+                 instrument: bool = False, profile=False, trace_memory: bool = False, memo_dir: str = None,
+                 memo_max_bytes: int = None):
         self._i = tab_in
         self._o = tab_out
+        # 输入只读取条件和输出用到的列
+        columns = tab_out.get_columns()
+        if columns is not None:
+            tab_in.set_columns(plan_columns(tab_in.get_filter_plan(), tab_in.get_title_map()) | set(columns))
+        if instrument:
+            tab_in.set_instrument(True)
+            tab_out.set_instrument(True)
+        self._profile = profile
+        self._profilers = []
+        self._profile_text = None
+        self._trace_memory = trace_memory
+        self._memory = None
+        self._started = None
+        self._elapsed = 0.0
         self._is_done = False
         self.fault_msg = ""
+        self.cancelled = False
+        self._batch_size = batch_size
+        self._read_q = queue.Queue(queue_size)
+        self._write_q = queue.Queue(queue_size)
+        self._stop = threading.Event()
+        # 清除时暂停读取, 筛选和写入把队列中的行处理完后等待
+        self._running = threading.Event()
+        self._running.set()
+        self._stats = {name: StageStats(name) for name in ("read", "filter", "write")}
+        self._max_depth = {"read": 0, "write": 0}
+        self._checkpoint = checkpoint
+        self._checkpoint_interval = checkpoint_interval
+        self._checkpoint_time = time.time()
+        self._resume_state = resume_state
+        # 已写出的行对应的输入位置
+        self._pos = resume_state["input_pos"] if resume_state else None
+        if checkpoint and (not os.path.isfile(tab_in.file_path) or tab_out.get_state() is None):
+            logger.warning("checkpoint not supported %s -> %s", tab_in.file_path, tab_out.file_path)
+            self._checkpoint = None
+        # 结果缓存: 命中时为升序的命中行号, 未命中时在筛选阶段记录到 _memo_record
+        self._memo = None
+        self._memo_key = None
+        self._memo_hits = None
+        self._memo_record = None
+        self.memo_hit = False
+        if memo_dir and not resume_state and not tab_in.is_parallel():
+            try:
+                from Memo import ResultMemo, memo_key
+                self._memo = ResultMemo(memo_dir, **({"max_bytes": memo_max_bytes} if memo_max_bytes else {}))
+                self._memo_key = memo_key(tab_in)
+                found = self._memo.get(self._memo_key)
+                if found is not None:
+                    self._memo_hits = found[0]
+                    self.memo_hit = True
+                elif self._memo_key:
+                    self._memo_record = []
+            except Exception as e:
+                logger.warning("memo disabled: %s", e)
+                self._memo = None
+
+    def __fault(self, e: Exception):
+        logger.exception("task failed: %s", e)
+        if not self.fault_msg:
+            self.fault_msg = str(e)
+        self._stop.set()
+
+    def __put(self, q: queue.Queue, item, stats: StageStats, depth_key: str) -> bool:
+        st = time.perf_counter()
+        while not self._stop.is_set():
+            try:
+                q.put(item, timeout=0.1)
+                self._max_depth[depth_key] = max(self._max_depth[depth_key], q.qsize())
+                stats.wait += time.perf_counter() - st
+                return True
+            except queue.Full:
+                continue
+        return False
 
-    def start(self):
-        def _t():
+    def __wait_running(self, stats: StageStats) -> bool:
+        if self._running.is_set():
+            return not self._stop.is_set()
+        st = time.perf_counter()
+        while not self._stop.is_set() and not self._running.wait(0.1):
+            pass
+        stats.wait += time.perf_counter() - st
+        return not self._stop.is_set()
+
+    def __get(self, q: queue.Queue, stats: StageStats):
+        st = time.perf_counter()
+        while not self._stop.is_set():
+            try:
+                item = q.get(timeout=0.1)
+                stats.wait += time.perf_counter() - st
+                return item
+            except queue.Empty:
+                continue
+        return None
+
+    def _read_stage(self):
+        stats = self._stats["read"]
+        # 结果缓存命中时读到最后一个命中行为止
+        limit = self._memo_hits[-1] + 1 if self._memo_hits else (0 if self._memo_hits is not None else None)
+        try:
+            line = limit is None or limit > 0
+            cnt = 0
+            while line:
+                if not self.__wait_running(stats):
+                    return
+                t = time.perf_counter()
+                batch = []
+                line = self._i._read_nxt_raw_data_line()
+                while line:
+                    batch.append(line)
+                    cnt += 1
+                    if len(batch) >= self._batch_size or cnt == limit:
+                        break
+                    line = self._i._read_nxt_raw_data_line()
+                if limit is not None and cnt >= limit:
+                    line = []
+                stats.busy += time.perf_counter() - t
+                if batch:
+                    stats.rows += len(batch)
+                    stats.batches += 1
+                    if not self.__put(self._read_q, (batch, self._i._get_position()), stats, "read"):
+                        return
+            self.__put(self._read_q, None, stats, "read")
+        except Exception as e:
+            self.__fault(e)
+
+    def _filter_stage(self):
+        stats = self._stats["filter"]
+        try:
+            batch_match = self._i.get_batch_match()
+            hits = self._memo_hits
+            record = self._memo_record
+            # 当前批次第一行的数据行号, 及下一个待取的命中行号下标
+            base = 0
+            k = 0
+            item = self.__get(self._read_q, stats)
+            while item is not None:
+                batch, pos = item
+                t = time.perf_counter()
+                if hits is not None:
+                    end = base + len(batch)
+                    fin = []
+                    while k < len(hits) and hits[k] < end:
+                        fin.append(batch[hits[k] - base])
+                        k += 1
+                else:
+                    got = batch_match(batch)
+                    fin = [batch[i] for i in got]
+                    if record is not None:
+                        record.extend(base + i for i in got)
+                base += len(batch)
+                stats.busy += time.perf_counter() - t
+                stats.rows += len(batch)
+                stats.batches += 1
+                # 没有命中的批次也传给写入阶段, 以便记录断点位置
+                if (fin or self._checkpoint) and not self.__put(self._write_q, (fin, pos), stats, "write"):
+                    return
+                item = self.__get(self._read_q, stats)
+            self.__put(self._write_q, None, stats, "write")
+        except Exception as e:
+            self.__fault(e)
+
+    def _parallel_stage(self):
+        # 输入端自带并行读取+筛选, 直接产出命中的行
+        stats = self._stats["filter"]
+        try:
+            t = time.perf_counter()
+            for batch in self._i.iter_parallel_batches():
+                stats.busy += time.perf_counter() - t
+                stats.rows += len(batch)
+                stats.batches += 1
+                if (batch or self._checkpoint) and \
+                        not self.__put(self._write_q, (batch, self._i._get_position()), stats, "write"):
+                    return
+                if not self.__wait_running(stats):
+                    return
+                t = time.perf_counter()
+            self.__put(self._write_q, None, stats, "write")
+        except Exception as e:
+            self.__fault(e)
+
+    def _write_stage(self):
+        stats = self._stats["write"]
+        try:
+            item = self.__get(self._write_q, stats)
+            while item is not None:
+                batch, pos = item
+                t = time.perf_counter()
+                for line in batch:
+                    self._o.write(line)
+                self._pos = pos
+                if self._checkpoint and time.time() - self._checkpoint_time >= self._checkpoint_interval:
+                    self.save_checkpoint()
+                stats.busy += time.perf_counter() - t
+                stats.rows += len(batch)
+                stats.batches += 1
+                item = self.__get(self._write_q, stats)
+        except Exception as e:
+            self.__fault(e)
+
+    def save_checkpoint(self):
+        """写入断点: 已写出的行对应的输入位置和输出状态, 先写临时文件再替换, 中途退出不会损坏"""
+        self._checkpoint_time = time.time()
+        if not self._checkpoint or self._pos is None:
+            return
+        state = {
+            "version": CHECKPOINT_VERSION,
+            "input": os.path.abspath(self._i.file_path),
+            "input_fingerprint": _file_fingerprint(self._i.file_path),
+            "plan": plan_node_key(self._i.get_filter_plan()),
+            "title_pos": list(self._i.title_pos),
+            "data_pos": list(self._i.data_pos),
+            "read_options": self._i.get_read_options(),
+            "input_pos": self._pos,
+            "column_types": self._i.get_column_types(),
+            "output": os.path.abspath(self._o.file_path),
+            "output_head": self._o.get_head(),
+            "output_state": self._o.get_state(),
+            "time": self._checkpoint_time
+        }
+        tmp = self._checkpoint + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            f.write(json.dumps(state, ensure_ascii=False))
+        os.replace(tmp, self._checkpoint)
+
+    def __clear_checkpoint(self):
+        if self._checkpoint and os.path.isfile(self._checkpoint):
+            os.remove(self._checkpoint)
+        self._o.clear_state()
+
+    def __profiled(self, stage: Callable) -> Callable:
+        if not self._profile:
+            return stage
+
+        def _run():
+            import cProfile
+            prof = cProfile.Profile()
+            self._profilers.append(prof)
+            prof.enable()
+            try:
+                stage()
+            finally:
+                prof.disable()
+        return _run
+
+    def __collect_profile(self):
+        import io
+        import pstats
+        profilers = [m_item for m_item in self._profilers if m_item.getstats()]
+        if not profilers:
+            return
+        stats = pstats.Stats(profilers[0])
+        for m_item in profilers[1:]:
+            stats.add(m_item)
+        if isinstance(self._profile, str):
+            stats.dump_stats(self._profile)
+        out = io.StringIO()
+        stats.stream = out
+        stats.sort_stats("cumulative").print_stats(30)
+        self._profile_text = out.getvalue()
+
+    def run(self):
+        """在当前线程中执行到结束"""
+        self._started = time.perf_counter()
+        started_trace = False
+        if self._trace_memory:
+            import tracemalloc
+            if not tracemalloc.is_tracing():
+                tracemalloc.start()
+                started_trace = True
+            elif hasattr(tracemalloc, "reset_peak"):
+                tracemalloc.reset_peak()
+        try:
+            self.__run()
+        finally:
+            self._elapsed = time.perf_counter() - self._started
+            if self._trace_memory:
+                import tracemalloc
+                current, peak = tracemalloc.get_traced_memory()
+                top = tracemalloc.take_snapshot().statistics("lineno")[:10]
+                self._memory = {"current": current, "peak": peak, "top": [str(m_item) for m_item in top]}
+                if started_trace:
+                    tracemalloc.stop()
+            if self._profile:
+                self.__collect_profile()
+            self._is_done = True
+
+    def __run(self):
+        if self._resume_state:
+            try:
+                # 续传时沿用首次执行推断的列类型, 保证前后判断一致
+                if self._resume_state.get("column_types") is not None:
+                    self._i.set_column_types(self._resume_state["column_types"])
+                self._i.seek_position(self._resume_state["input_pos"])
+            except Exception as e:
+                self.__fault(e)
+        if not self.fault_msg and self._i.needs_column_types():
             try:
-                item = self._i.read_nxt_data_line()
-                st = time.time()
-                while item and time.time() - st <= 120:
-                    self._o.write(item)
-                    item = self._i.read_nxt_data_line()
-
-                self._i.close()
-                self._o.save()
-                self._is_done = True
+                self._i.infer_types()
             except Exception as e:
-                print(e)
-                self._is_done = True
-                self.fault_msg = str(e)
+                self.__fault(e)
+        if self.fault_msg:
+            workers = []
+        elif self._i.is_parallel():
+            workers = [threading.Thread(target=self.__profiled(self._parallel_stage))]
+        else:
+            workers = [threading.Thread(target=self.__profiled(self._read_stage)),
+                       threading.Thread(target=self.__profiled(self._filter_stage))]
+        for m_item in workers:
+            m_item.setDaemon(True)
+            m_item.start()
+        if workers:
+            self.__profiled(self._write_stage)()
+        for m_item in workers:
+            m_item.join()
+        try:
+            self._i.close()
+            if self.cancelled:
+                # 取消时保留断点, 已写出的部分照常保存
+                self.save_checkpoint()
+                self._o.finish()
+            elif not self.fault_msg:
+                self._o.finish()
+                self.__clear_checkpoint()
+                if self._memo_record is not None:
+                    self._memo.put(self._memo_key, self._memo_record, self._stats["read"].rows)
+        except Exception as e:
+            logger.exception("task failed: %s", e)
+            self.fault_msg = str(e)
 
-        t = threading.Thread(target=_t)
+    def start(self):
+        t = threading.Thread(target=self.run)
         t.setDaemon(True)
         t.start()
 
+    def pause(self):
+        self._running.clear()
+
+    def resume(self):
+        self._running.set()
+
+    def is_paused(self) -> bool:
+        return not self._running.is_set() and not self._is_done
+
+    def cancel(self):
+        """停止读取并丢弃队列中未写出的行, 已写出的部分照常保存; fault_msg 为 "任务已取消" """
+        if self._is_done:
+            return
+        self.cancelled = True
+        if not self.fault_msg:
+            self.fault_msg = "任务已取消"
+        self._stop.set()
+        self._running.set()
+
     def is_done(self):
         return self._is_done
 
@@ -369,6 +2387,146 @@ class Task:
     def get_write_len(self) -> int:
         return self._o.get_cur_len()
 
+    def get_filter_order(self) -> List[dict]:
+        return self._i.get_filter_order()
+
+    def get_stats(self) -> dict:
+        """
+        执行统计快照, 执行中也可调用:
+        input: 读取行数(开启 instrument 时含读取耗时和各条件的求值次数/通过次数/耗时)
+        output: 写入行数, 保存耗时(开启 instrument 时含每次写入的耗时)
+        pipeline: 各阶段吞吐和队列深度, 见 get_pipeline_stats
+        profile / memory: 开启 profile / trace_memory 时执行结束后才有
+        memo_hit: 是否使用了结果缓存
+        """
+        elapsed = self._elapsed
+        if not self._is_done and self._started is not None:
+            elapsed = time.perf_counter() - self._started
+        return {
+            "elapsed": elapsed,
+            "done": self._is_done,
+            "input": self._i.get_stats(),
+            "output": self._o.get_stats(),
+            "pipeline": self.get_pipeline_stats(),
+            "profile": self._profile_text,
+            "memory": self._memory,
+            "memo_hit": self.memo_hit
+        }
+
+    def get_pipeline_stats(self) -> dict:
+        """
+        各阶段吞吐与队列深度, bound 为工作耗时最多的阶段:
+        read 说明瓶颈在输入解析, filter 在条件判断, write 在输出
+        """
+        fin = {name: m_item.snapshot() for name, m_item in self._stats.items()}
+        fin["queue"] = {
+            "read": {"depth": self._read_q.qsize(), "max_depth": self._max_depth["read"],
+                     "size": self._read_q.maxsize},
+            "write": {"depth": self._write_q.qsize(), "max_depth": self._max_depth["write"],
+                      "size": self._write_q.maxsize}
+        }
+        fin["bound"] = max(self._stats.values(), key=lambda m_item: m_item.busy).name
+        return fin
+
+
+class FanOutTask:
+    """
+    一次读取, 多路输出: 每行同时按多组条件判断, 写入所有命中的输出
+    各组条件中相同的子条件每行只求值一次; 某一组条件出错只停止该输出, 其余继续
+    """
+
+    def __init__(self, tab_in: _MetaInputTab, outputs: List[Tuple[object, _MetaOutputTab]]):
+        self._i = tab_in
+        self._outputs = list(outputs)
+        self._is_done = False
+        self.fault_msg = ""
+        # 每个输出的错误信息, 与 outputs 顺序一致
+        self.faults = [""] * len(self._outputs)
+        self._checkers = {}
+        # 提前校验各组条件
+        self._plans = [normalize_filter_plan(plan) for plan, _ in self._outputs]
+        for m_item in self._plans:
+            compile_filter_plan(m_item, self._i.get_title_map(), self._checkers)
+        columns = set()
+        for plan, (_, ao) in zip(self._plans, self._outputs):
+            out_columns = ao.get_columns()
+            if out_columns is None:
+                columns = None
+                break
+            columns |= plan_columns(plan, self._i.get_title_map()) | set(out_columns)
+        if columns is not None:
+            self._i.set_columns(columns)
+
+    def __compile(self, alive: List[int]):
+        return compile_fan_out([self._plans[i] for i in alive], self._i.get_title_map(), self._checkers,
+                               self._i.get_column_types())
+
+    def __isolate(self, alive: List[int], line: List) -> List[int]:
+        # 逐组重新判断, 找出出错的条件组并停止对应输出
+        fin = []
+        for i in alive:
+            try:
+                compile_filter_plan(self._plans[i], self._i.get_title_map(), self._checkers,
+                                    types=self._i.get_column_types())(line)
+                fin.append(i)
+            except Exception as e:
+                logger.exception("filter plan failed: %s", e)
+                self.faults[i] = str(e)
+        return fin
+
+    def run(self):
+        alive = list(range(len(self._outputs)))
+        try:
+            if any(plan_uses_typed(m_item) for m_item in self._plans):
+                self._i.infer_types()
+            fan = self.__compile(alive)
+            line = self._i._read_nxt_raw_data_line() if alive else []
+            while line:
+                try:
+                    ret = fan(line)
+                except Exception:
+                    alive = self.__isolate(alive, line)
+                    if not alive:
+                        break
+                    fan = self.__compile(alive)
+                    ret = fan(line)
+                for i, ok in zip(alive, ret):
+                    if ok:
+                        self._outputs[i][1].write(line)
+                line = self._i._read_nxt_raw_data_line()
+            self._i.close()
+        except Exception as e:
+            # 读取等出错时所有未结束的输出都失败
+            logger.exception("fan-out task failed: %s", e)
+            self._i.close()
+            for i in alive:
+                self.faults[i] = str(e)
+        # 出错的输出也保存已写出的部分并关闭文件
+        for i, (_, ao) in enumerate(self._outputs):
+            try:
+                ao.save()
+            except Exception as e:
+                logger.exception("save failed %s: %s", ao.file_path, e)
+                if not self.faults[i]:
+                    self.faults[i] = str(e)
+        self.fault_msg = "; ".join("{0}: {1}".format(self._outputs[i][1].file_path, m_item)
+                                   for i, m_item in enumerate(self.faults) if m_item)
+        self._is_done = True
+
+    def start(self):
+        t = threading.Thread(target=self.run)
+        t.setDaemon(True)
+        t.start()
+
+    def is_done(self):
+        return self._is_done
+
+    def get_progress(self):
+        return self._i.get_progress()
+
+    def get_write_len(self) -> int:
+        return sum(ao.get_cur_len() for _, ao in self._outputs)
+
 
 def get_input_tab_by_filename(file_name: str):
     name = os.path.splitext(file_name)[-1].lower()
@@ -381,6 +2539,9 @@ def get_input_tab_by_filename(file_name: str):
 
 
 def get_output_tab_by_filename(file_name: str):
+    # 路径中含 {value} 时按列取值拆分输出, 需要传 partition_by 参数
+    if PARTITION_PLACEHOLDER in file_name:
+        return PartitionedOutputTab
     name = os.path.splitext(file_name)[-1].lower()
     r_map = {
         '.csv': CsvOutputTab,
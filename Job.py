@@ -0,0 +1,143 @@
+"""
+筛选任务描述文件(json, python3.11 以上也可用 toml), 单个任务或 {"jobs": [...]} / 任务列表:
+{
+    "input": "data.xlsx",
+    "title_row": 1, "title_col": 1,         # 与界面一致从 1 开始, 标题行为 0 表示无标题
+    "data_row": 2, "data_col": 1,
+    "filter": {"and": [{"filter_type": "raw_list", "pattern": "A\nB", "filter_title": "地区"}]},
+    "columns": ["客户", "金额"],              # 输出列, 不填输出全部列
+    "output": "out.xlsx",                   # 含 {value} 时按 output_options.partition_by 列拆分输出
+    "input_options": {"sep": ","},          # 传给输入表的参数
+    "output_options": {}                    # 传给输出表的参数
+}
+"""
+
+import json
+import os
+import threading
+from typing import List
+from Filter import FanOutTask, normalize_filter_plan, get_input_tab_by_filename, get_output_tab_by_filename
+
+
+def normalize_job_spec(spec: dict) -> dict:
+    for key in ("input", "output"):
+        if not spec.get(key):
+            raise Exception("任务缺少 {0}: {1}".format(key, spec))
+    return {
+        "input": spec["input"],
+        "title_row": int(spec.get("title_row", 1)),
+        "title_col": int(spec.get("title_col", 1)),
+        "data_row": int(spec.get("data_row", 2)),
+        "data_col": int(spec.get("data_col", 1)),
+        "filter": normalize_filter_plan(spec.get("filter", [])),
+        "columns": list(spec.get("columns", None) or []),
+        "output": spec["output"],
+        "input_options": dict(spec.get("input_options", None) or {}),
+        "output_options": dict(spec.get("output_options", None) or {})
+    }
+
+
+def load_job_specs(path: str) -> List[dict]:
+    if os.path.splitext(path)[-1].lower() == ".toml":
+        import tomllib
+        with open(path, "rb") as f:
+            dct = tomllib.load(f)
+    else:
+        with open(path, "r", encoding="utf-8") as f:
+            dct = json.load(f)
+    if isinstance(dct, dict):
+        dct = dct["jobs"] if "jobs" in dct else [dct]
+    return [normalize_job_spec(m_item) for m_item in dct]
+
+
+def dump_job_specs(path: str, specs: List[dict]):
+    specs = [normalize_job_spec(m_item) for m_item in specs]
+    with open(path, "w+", encoding="utf-8") as f:
+        f.write(json.dumps(specs[0] if len(specs) == 1 else {"jobs": specs}, indent=1, ensure_ascii=False))
+
+
+class JobRunner:
+    """
+    执行一组任务; 输入文件及读取参数相同的任务只解析一次输入(FanOutTask),
+    每一行依次交给各任务的条件和输出, 单个任务出错不影响其他任务
+    """
+
+    def __init__(self, specs: List[dict]):
+        self.specs = [normalize_job_spec(m_item) for m_item in specs]
+        # 每个任务的结果: (输出路径, 写入行数, 错误信息), 与 specs 顺序一致
+        self.results = [None] * len(self.specs)
+        self.fault_msg = ""
+        self._is_done = False
+        self._groups = {}
+        for i, m_item in enumerate(self.specs):
+            key = (os.path.abspath(m_item["input"]), m_item["title_row"], m_item["title_col"], m_item["data_row"],
+                   m_item["data_col"], json.dumps(m_item["input_options"], sort_keys=True))
+            self._groups.setdefault(key, []).append(i)
+        self._done_groups = 0
+        self._cur_tab = None
+
+    def __run_group(self, idx_lst: List[int]):
+        first = self.specs[idx_lst[0]]
+        src = first["input"]
+        try:
+            ai = get_input_tab_by_filename(src)(src, title_pos=(first["title_row"] - 1, first["title_col"] - 1),
+                                                data_pos=(first["data_row"] - 1, first["data_col"] - 1),
+                                                **first["input_options"])
+        except Exception as e:
+            for i in idx_lst:
+                self.results[i] = (self.specs[i]["output"], 0, str(e))
+            return
+        self._cur_tab = ai
+        sinks = []
+        outputs = []
+        for i in idx_lst:
+            spec = self.specs[i]
+            try:
+                ao = get_output_tab_by_filename(spec["output"])(spec["output"], title=ai.read_title(),
+                                                                filter_title=spec["columns"] or None,
+                                                                **spec["output_options"])
+                sinks.append(i)
+                outputs.append((spec["filter"], ao))
+            except Exception as e:
+                self.results[i] = (spec["output"], 0, str(e))
+        if not sinks:
+            ai.close()
+            return
+        try:
+            tsk = FanOutTask(ai, outputs)
+        except Exception as e:
+            ai.close()
+            for i in sinks:
+                self.results[i] = (self.specs[i]["output"], 0, str(e))
+            return
+        tsk.run()
+        for i, fault, (_, ao) in zip(sinks, tsk.faults, outputs):
+            self.results[i] = (self.specs[i]["output"], ao.get_cur_len(), fault)
+
+    def run(self):
+        for idx_lst in self._groups.values():
+            self.__run_group(idx_lst)
+            self._cur_tab = None
+            self._done_groups += 1
+        faults = ["{0}: {1}".format(m_item[0], m_item[2]) for m_item in self.results if m_item and m_item[2]]
+        self.fault_msg = "; ".join(faults)
+        self._is_done = True
+
+    def start(self):
+        t = threading.Thread(target=self.run)
+        t.setDaemon(True)
+        t.start()
+
+    def is_done(self):
+        return self._is_done
+
+    def get_progress(self) -> float:
+        """按输入文件计, 已完成的输入按 1 计"""
+        if not self._groups:
+            return 1.0
+        ai = self._cur_tab
+        running = min(ai.get_progress(), 1) if ai is not None else 0
+        return (self._done_groups + running) / len(self._groups)
+
+    def get_write_len(self) -> int:
+        return sum(m_item[1] for m_item in self.results if m_item)
@@ -0,0 +1,225 @@
+"""
+筛选结果缓存: 记录某个输入在某组条件下命中的数据行号, 再次执行相同筛选时不再判断条件, 只按行号取行写出
+
+键: 输入文件(路径/大小/修改时间/抽样内容哈希)、读取参数、标题/数据起始位置、整理后的条件树、条件引用的 @file: 文件;
+输出列不影响命中的行, 不在键中, 只修改输出列时同样命中
+行号按升序存放, 取 位图 / 差值变长整数 两种编码中较小的一种:
+    MAGIC | 头部长度(uint32) | 头部 json | 编码后的行号
+"""
+
+import hashlib
+import json
+import logging
+import os
+import struct
+import tempfile
+from typing import List, Tuple
+from Cache import evict_lru
+
+logger = logging.getLogger(__name__)
+
+MAGIC = b"EFMEMO01"
+MEMO_EXT = ".efm"
+DEFAULT_MAX_BYTES = 64 << 20
+DEFAULT_MEMO_DIR = os.path.join(tempfile.gettempdir(), "ExcelFilter", "memo")
+ENC_BITMAP = "bitmap"
+ENC_DELTA = "delta"
+# 抽样哈希: 文件头尾各 64K 及中间均匀分布的 16 块 4K
+SAMPLE_EDGE_BYTES = 64 << 10
+SAMPLE_BLOCK_BYTES = 4 << 10
+SAMPLE_BLOCKS = 16
+
+def encode_bitmap(indices: List[int], total: int) -> bytes:
+    buf = bytearray((total + 7) // 8)
+    for i in indices:
+        buf[i >> 3] |= 1 << (i & 7)
+    return bytes(buf)
+
+
+def decode_bitmap(data: bytes) -> List[int]:
+    fin = []
+    for pos, byte in enumerate(data):
+        if byte:
+            base = pos << 3
+            for bit in range(8):
+                if byte >> bit & 1:
+                    fin.append(base + bit)
+    return fin
+
+
+def encode_delta(indices: List[int]) -> bytes:
+    """相邻行号之差按 LEB128 变长整数编码, 第一个为行号本身"""
+    buf = bytearray()
+    prev = 0
+    for i in indices:
+        v = i - prev
+        prev = i
+        while v >= 0x80:
+            buf.append((v & 0x7f) | 0x80)
+            v >>= 7
+        buf.append(v)
+    return bytes(buf)
+
+
+def decode_delta(data: bytes) -> List[int]:
+    fin = []
+    prev = 0
+    v = 0
+    shift = 0
+    for byte in data:
+        v |= (byte & 0x7f) << shift
+        if byte & 0x80:
+            shift += 7
+            continue
+        prev += v
+        fin.append(prev)
+        v = 0
+        shift = 0
+    return fin
+
+
+def encode_indices(indices: List[int], total: int) -> Tuple[str, bytes]:
+    """返回 (编码方式, 数据), 取位图和差值编码中较小的一种"""
+    delta = encode_delta(indices)
+    if len(delta) <= (total + 7) // 8:
+        return ENC_DELTA, delta
+    return ENC_BITMAP, encode_bitmap(indices, total)
+
+
+def decode_indices(enc: str, data: bytes) -> List[int]:
+    if enc == ENC_BITMAP:
+        return decode_bitmap(data)
+    if enc == ENC_DELTA:
+        return decode_delta(data)
+    raise Exception("未知的行号编码: {0}".format(enc))
+
+
+def _plan_files(node: dict, fin: list):
+    """条件树中 @file: 引用的文件(列表条件和关键字条件)"""
+    from Filter import KEY_FILE_PREFIX
+    for m_item in node.get("and", node.get("or", [])):
+        _plan_files(m_item, fin)
+    if "not" in node:
+        _plan_files(node["not"], fin)
+    pattern = node.get("pattern", None)
+    if isinstance(pattern, str) and pattern.startswith(KEY_FILE_PREFIX):
+        fin.append(pattern[len(KEY_FILE_PREFIX):].strip().partition("::")[0].strip())
+
+
+def sample_hash(file_path: str, size: int) -> str:
+    """
+    文件头尾和中间抽样块的哈希, 原地改写后大小和修改时间不变(复制工具保留修改时间, 修改时间精度低)时也能发现变化;
+    不超过抽样总量的文件对全部内容做哈希
+    """
+    h = hashlib.sha1()
+    with open(file_path, "rb") as f:
+        if size <= 2 * SAMPLE_EDGE_BYTES + SAMPLE_BLOCKS * SAMPLE_BLOCK_BYTES:
+            h.update(f.read())
+            return h.hexdigest()
+        h.update(f.read(SAMPLE_EDGE_BYTES))
+        step = (size - 2 * SAMPLE_EDGE_BYTES) // (SAMPLE_BLOCKS + 1)
+        for i in range(1, SAMPLE_BLOCKS + 1):
+            f.seek(SAMPLE_EDGE_BYTES + i * step)
+            h.update(f.read(SAMPLE_BLOCK_BYTES))
+        f.seek(size - SAMPLE_EDGE_BYTES)
+        h.update(f.read(SAMPLE_EDGE_BYTES))
+    return h.hexdigest()
+
+
+def _fingerprint(file_path: str) -> list:
+    st = os.stat(file_path)
+    return [os.path.abspath(file_path), st.st_size, st.st_mtime_ns, sample_hash(file_path, st.st_size)]
+
+
+def memo_key(tab_in) -> str:
+    """输入表当前筛选条件的结果缓存键; 输入不是普通文件或条件引用的文件不存在时返回 None"""
+    from Filter import plan_node_key
+    if not os.path.isfile(tab_in.file_path):
+        return None
+    plan = tab_in.get_filter_plan()
+    files = []
+    _plan_files(plan, files)
+    try:
+        files = [_fingerprint(m_item) for m_item in files]
+    except OSError:
+        return None
+    options = tab_in.get_read_options()
+    desc = {
+        "type": type(tab_in).__name__,
+        "input": _fingerprint(tab_in.file_path),
+        "options": options,
+        "title_pos": list(tab_in.title_pos),
+        "data_pos": list(tab_in.data_pos),
+        "plan": plan_node_key(plan),
+        "files": files
+    }
+    return hashlib.sha1(json.dumps(desc, sort_keys=True, ensure_ascii=False).encode("utf-8")).hexdigest()
+
+
+class ResultMemo:
+    """
+    结果缓存目录, 每个键一个 .efm 文件; 命中时更新修改时间,
+    目录总大小超过 max_bytes 时按修改时间删除最久未用的记录
+    """
+
+    def __init__(self, memo_dir: str = DEFAULT_MEMO_DIR, max_bytes: int = DEFAULT_MAX_BYTES):
+        self.memo_dir = memo_dir
+        self.max_bytes = max_bytes
+        os.makedirs(memo_dir, exist_ok=True)
+
+    def entry_path(self, key: str) -> str:
+        return os.path.join(self.memo_dir, key + MEMO_EXT)
+
+    def get(self, key: str) -> Tuple[List[int], int]:
+        """返回 (命中的行号, 总数据行数), 没有记录时返回 None"""
+        if not key or not os.path.isfile(self.entry_path(key)):
+            return None
+        path = self.entry_path(key)
+        try:
+            with open(path, "rb") as f:
+                data = f.read()
+            if data[:8] != MAGIC:
+                raise Exception("结果缓存格式错误: {0}".format(path))
+            head_len = struct.unpack("<I", data[8:12])[0]
+            head = json.loads(data[12:12 + head_len].decode("utf-8"))
+            if head["key"] != key:
+                return None
+            indices = decode_indices(head["enc"], data[12 + head_len:])
+            if len(indices) != head["count"]:
+                raise Exception("结果缓存已损坏: {0}".format(path))
+        except Exception as e:
+            logger.warning("memo ignored %s: %s", path, e)
+            return None
+        try:
+            os.utime(path, None)
+        except OSError:
+            pass
+        return indices, head["total"]
+
+    def put(self, key: str, indices: List[int], total: int):
+        """记录命中的行号(升序), 先写临时文件再替换"""
+        if not key:
+            return
+        path = self.entry_path(key)
+        enc, data = encode_indices(indices, total)
+        head = json.dumps({"key": key, "enc": enc, "count": len(indices), "total": total}).encode("utf-8")
+        tmp = "{0}.{1}.tmp".format(path, os.getpid())
+        try:
+            with open(tmp, "wb") as f:
+                f.write(MAGIC)
+                f.write(struct.pack("<I", len(head)))
+                f.write(head)
+                f.write(data)
+            os.replace(tmp, path)
+        finally:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+        evict_lru(self.memo_dir, MEMO_EXT, self.max_bytes, keep=path)
+
+    def clear(self):
+        for name in os.listdir(self.memo_dir):
+            if name.endswith(MEMO_EXT):
+                try:
+                    os.remove(os.path.join(self.memo_dir, name))
+                except OSError:
+                    pass
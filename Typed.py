@@ -0,0 +1,189 @@
+"""
+列类型推断与按类型转换单元格, 供 python 表达式条件中的 T 使用(X 仍为原始值)
+
+按前 N 行推断每列的类型: int / float / date / datetime / str
+    全为整数 -> int; 整数与小数混合 -> float; 全为日期 -> date; 日期与日期时间混合 -> datetime; 其他 -> str
+    时间为 0 点的日期时间按日期处理, xlsx 的日期单元格与 csv 中的 "yyyy-mm-dd 00:00:00" 推断结果相同
+    空值(None, 空字符串)不参与推断
+转换不会出错, 同一列转换后的类型一致:
+    int 列为 int(小数值为 float), float 列为 float, date 列为 date(带时间的值只取日期), datetime 列为 datetime,
+    str 列为 str(raw).strip(); 无法按列类型转换的值返回 None, 用到 T 的条件对这些值不命中(同空值)
+"""
+
+import re
+from datetime import datetime, date
+from typing import Callable, List
+
+TYPE_INT = "int"
+TYPE_FLOAT = "float"
+TYPE_DATE = "date"
+TYPE_DATETIME = "datetime"
+TYPE_STR = "str"
+
+_INT_RE = re.compile(r'^[+-]?\d+$')
+_DATE_RE = re.compile(r'^(\d{4})[-/](\d{1,2})[-/](\d{1,2})$')
+_DATETIME_RE = re.compile(r'^(\d{4})[-/](\d{1,2})[-/](\d{1,2})[ T](\d{1,2}):(\d{2})(?::(\d{2})(?:\.(\d{1,6}))?)?$')
+
+
+def parse_date(s: str):
+    """yyyy-mm-dd 或 yyyy/mm/dd, 不是日期时返回 None"""
+    m = _DATE_RE.match(s)
+    if m is None:
+        return None
+    try:
+        return date(int(m.group(1)), int(m.group(2)), int(m.group(3)))
+    except ValueError:
+        return None
+
+
+def parse_datetime(s: str):
+    """yyyy-mm-dd hh:mm[:ss[.ffffff]], 日期与时间之间可以是空格或 T, 不是日期时间时返回 None"""
+    m = _DATETIME_RE.match(s)
+    if m is None:
+        return None
+    try:
+        return datetime(int(m.group(1)), int(m.group(2)), int(m.group(3)), int(m.group(4)), int(m.group(5)),
+                        int(m.group(6) or 0), int((m.group(7) or "0").ljust(6, "0")))
+    except ValueError:
+        return None
+
+
+def _parse_float(s: str):
+    try:
+        value = float(s)
+    except ValueError:
+        return None
+    # nan/inf 按文本处理
+    return value if value == value and value not in (float("inf"), float("-inf")) else None
+
+
+def _is_midnight(value: datetime) -> bool:
+    return value.hour == value.minute == value.second == value.microsecond == 0
+
+
+def value_type(value) -> str:
+    """单个值的类型, 空值返回 None"""
+    if value is None:
+        return None
+    cls = type(value)
+    if cls is int:
+        return TYPE_INT
+    if cls is float:
+        return TYPE_FLOAT
+    if cls is datetime:
+        # xlsx 的日期单元格读出为 0 点的 datetime
+        return TYPE_DATE if _is_midnight(value) else TYPE_DATETIME
+    if cls is date:
+        return TYPE_DATE
+    if cls is not str:
+        return TYPE_STR
+    s = value.strip()
+    if not s:
+        return None
+    if _INT_RE.match(s):
+        return TYPE_INT
+    if _parse_float(s) is not None:
+        return TYPE_FLOAT
+    if parse_date(s) is not None:
+        return TYPE_DATE
+    ret = parse_datetime(s)
+    if ret is not None:
+        return TYPE_DATE if _is_midnight(ret) else TYPE_DATETIME
+    return TYPE_STR
+
+
+def infer_column_types(rows: List[List]) -> List[str]:
+    """按样本行推断各列类型, 没有非空值的列为 None"""
+    width = max((len(m_item) for m_item in rows), default=0)
+    seen = [set() for _ in range(width)]
+    for row in rows:
+        for i, m_item in enumerate(row):
+            t = value_type(m_item)
+            if t is not None:
+                seen[i].add(t)
+    fin = []
+    for m_item in seen:
+        if not m_item:
+            fin.append(None)
+        elif len(m_item) == 1:
+            fin.append(next(iter(m_item)))
+        elif m_item == {TYPE_INT, TYPE_FLOAT}:
+            fin.append(TYPE_FLOAT)
+        elif m_item == {TYPE_DATE, TYPE_DATETIME}:
+            fin.append(TYPE_DATETIME)
+        else:
+            fin.append(TYPE_STR)
+    return fin
+
+
+def to_int(value):
+    cls = type(value)
+    if cls is int:
+        return value
+    if cls is float:
+        return int(value) if value.is_integer() else value
+    if cls is not str:
+        return None
+    s = value.strip()
+    if _INT_RE.match(s):
+        return int(s)
+    return _parse_float(s)
+
+
+def to_float(value):
+    cls = type(value)
+    if cls is int or cls is float:
+        return float(value)
+    if cls is not str:
+        return None
+    return _parse_float(value.strip())
+
+
+def to_date(value):
+    cls = type(value)
+    if cls is datetime:
+        return value.date()
+    if cls is date:
+        return value
+    if cls is not str:
+        return None
+    s = value.strip()
+    ret = parse_date(s)
+    if ret is None:
+        ret = parse_datetime(s)
+        ret = None if ret is None else ret.date()
+    return ret
+
+
+def to_datetime(value):
+    cls = type(value)
+    if cls is datetime:
+        return value
+    if cls is date:
+        return datetime(value.year, value.month, value.day)
+    if cls is not str:
+        return None
+    s = value.strip()
+    ret = parse_datetime(s)
+    if ret is None:
+        ret = parse_date(s)
+        ret = None if ret is None else datetime(ret.year, ret.month, ret.day)
+    return ret
+
+
+def to_str(value):
+    return None if value is None else str(value).strip()
+
+
+_CONVERTERS = {
+    TYPE_INT: to_int,
+    TYPE_FLOAT: to_float,
+    TYPE_DATE: to_date,
+    TYPE_DATETIME: to_datetime,
+    TYPE_STR: to_str,
+    None: to_str
+}
+
+
+def get_converter(column_type: str) -> Callable:
+    return _CONVERTERS[column_type]
@@ -0,0 +1,204 @@
+"""
+批量筛选: 一次判断一批行, 条件树按节点逐列求值, 结果为命中行的下标
+
+and/or/not 只对尚未确定的行继续求值, 与逐行判断的短路顺序一致, 各条件被求值的单元格完全相同
+叶子条件:
+    raw_list: 整列与 key 集合做成员判断
+    py_exp: 只含运算/比较/函数调用等简单写法(如 float(X) > 100)时把表达式内联到列推导式中执行, 省去每格一次函数调用
+    其他条件及复杂表达式: 逐个单元格调用判断函数
+同一批内, 多个文本条件(列表/正则/关键字)共用一列时 str(raw).strip() 每格只算一次,
+表达式中的 T 按列类型转换, 每格只转换一次, 由该列上的所有条件共用
+批量求值出错时整批改为逐行判断, 报错信息与逐行判断一致
+单元格读出时已是 python 对象, 转换为 numpy 数组的开销大于比较本身, 因此不使用 numpy
+"""
+
+import ast
+import collections
+from typing import Callable, List
+from Filter import FilterType, normalize_filter_plan, compile_filter_plan
+from Typed import get_converter
+
+# 可以内联的表达式节点, 不含 lambda/推导式/海象赋值等会引入新作用域或绑定名称的写法
+_INLINE_NODES = (
+    ast.Expression, ast.BoolOp, ast.And, ast.Or, ast.UnaryOp, ast.Not, ast.USub, ast.UAdd, ast.Invert,
+    ast.BinOp, ast.Add, ast.Sub, ast.Mult, ast.Div, ast.FloorDiv, ast.Mod, ast.Pow,
+    ast.Compare, ast.Eq, ast.NotEq, ast.Lt, ast.LtE, ast.Gt, ast.GtE, ast.In, ast.NotIn, ast.Is, ast.IsNot,
+    ast.Call, ast.keyword, ast.Attribute, ast.Name, ast.Load, ast.Constant, ast.IfExp,
+    ast.Subscript, ast.Slice, ast.Tuple, ast.List, ast.Set
+)
+
+# 判断前先做 str(raw).strip() 的条件类型
+_TEXT_TYPES = (FilterType.raw_list, FilterType.reg_exp, FilterType.reg_multi, FilterType.kw_contains)
+
+
+def _can_inline(tree: ast.AST) -> bool:
+    for node in ast.walk(tree):
+        if not isinstance(node, _INLINE_NODES):
+            return False
+        # 内联后 _ 开头的名称会与推导式的局部变量冲突
+        if isinstance(node, ast.Name) and node.id.startswith("_"):
+            return False
+    return True
+
+
+def _column(node: dict, title_map: dict) -> int:
+    idx = title_map.get(node["filter_title"], None)
+    if idx is None:
+        raise Exception("筛选列[{0}]不存在, 可选列: {1}".format(node["filter_title"], list(title_map.keys())))
+    return idx
+
+
+def _column_strs(ctx: dict, rows: List[List], col: int) -> List[str]:
+    """本批中该列各格的 str(raw).strip()"""
+    key = ("s", col)
+    if key not in ctx:
+        ctx[key] = [str(m_item[col]).strip() for m_item in rows]
+    return ctx[key]
+
+
+def _column_typed(ctx: dict, rows: List[List], col: int, convert: Callable) -> list:
+    """本批中该列各格按列类型转换后的值"""
+    key = ("t", col)
+    if key not in ctx:
+        ctx[key] = [convert(m_item[col]) for m_item in rows]
+    return ctx[key]
+
+
+def _inline_leaf(col: int, exp: str, typed: bool) -> Callable:
+    if typed:
+        src = "lambda _rows, _idx, _T: [_i for _i in _idx for T in (_T[_i],) if (X := _rows[_i][{0}]) and T is not None and ({1}\n)]"
+    else:
+        src = "lambda _rows, _idx: [_i for _i in _idx if (X := _rows[_i][{0}]) and ({1}\n)]"
+    return eval(compile(src.format(col, exp), '<py_exp_batch>', 'eval'), dict(FilterType.py_exp_namespace))
+
+
+def _compile_text_leaf(check: Callable, col: int, shared: bool) -> Callable:
+    keys = getattr(check, "keys", None)
+    if not shared:
+        if keys is not None:
+            return lambda rows, idx, ctx: [i for i in idx if str(rows[i][col]).strip() in keys]
+        return lambda rows, idx, ctx: [i for i in idx if check(rows[i][col])]
+    if keys is not None:
+        def _leaf(rows: List[List], idx: List[int], ctx: dict) -> List[int]:
+            strs = _column_strs(ctx, rows, col)
+            return [i for i in idx if strs[i] in keys]
+        return _leaf
+    strip_check = check.strip_check
+    if check.skip_falsy:
+        def _leaf(rows: List[List], idx: List[int], ctx: dict) -> List[int]:
+            strs = _column_strs(ctx, rows, col)
+            return [i for i in idx if rows[i][col] and strip_check(strs[i])]
+        return _leaf
+
+    def _leaf(rows: List[List], idx: List[int], ctx: dict) -> List[int]:
+        strs = _column_strs(ctx, rows, col)
+        return [i for i in idx if strip_check(strs[i])]
+    return _leaf
+
+
+def _compile_py_exp_leaf(check: Callable, pattern, col: int, convert: Callable) -> Callable:
+    typed = getattr(check, "uses_t", False)
+    if isinstance(pattern, str):
+        exp = pattern.strip()
+        if _can_inline(ast.parse(exp, mode="eval")):
+            func = _inline_leaf(col, exp, typed)
+            if typed:
+                return lambda rows, idx, ctx: func(rows, idx, _column_typed(ctx, rows, col, convert))
+            return lambda rows, idx, ctx: func(rows, idx)
+    if typed:
+        def _leaf(rows: List[List], idx: List[int], ctx: dict) -> List[int]:
+            values = _column_typed(ctx, rows, col, convert)
+            return [i for i in idx if check(rows[i][col], values[i])]
+        return _leaf
+    return lambda rows, idx, ctx: [i for i in idx if check(rows[i][col])]
+
+
+class _BatchCodeGen:
+    """把条件树编译为 (rows, idx, ctx) -> idx 中判断为真的下标(升序), ctx 为本批共用的列转换结果"""
+
+    def __init__(self, title_map: dict, checkers: dict, types: List[str] = None):
+        self.title_map = title_map
+        self.checkers = checkers
+        self.types = types
+        # 有多个文本条件的列, 这些列的 str(raw).strip() 在批内共用
+        self.shared = set()
+
+    def count_text_columns(self, node: dict, counts: collections.Counter):
+        for m_item in node.get("and", node.get("or", [])):
+            self.count_text_columns(m_item, counts)
+        if "not" in node:
+            self.count_text_columns(node["not"], counts)
+        elif "and" not in node and "or" not in node and node["filter_type"] in _TEXT_TYPES:
+            counts[_column(node, self.title_map)] += 1
+
+    def gen(self, node: dict) -> Callable:
+        if "and" in node:
+            subs = [self.gen(m_item) for m_item in node["and"]]
+
+            def _and(rows: List[List], idx: List[int], ctx: dict) -> List[int]:
+                for m_item in subs:
+                    if not idx:
+                        break
+                    idx = m_item(rows, idx, ctx)
+                return idx
+            return _and
+        if "or" in node:
+            subs = [self.gen(m_item) for m_item in node["or"]]
+
+            def _or(rows: List[List], idx: List[int], ctx: dict) -> List[int]:
+                hit = set()
+                for m_item in subs:
+                    if not idx:
+                        break
+                    got = m_item(rows, idx, ctx)
+                    if got:
+                        hit.update(got)
+                        idx = [i for i in idx if i not in hit]
+                return sorted(hit)
+            return _or
+        if "not" in node:
+            sub = self.gen(node["not"])
+
+            def _not(rows: List[List], idx: List[int], ctx: dict) -> List[int]:
+                got = set(sub(rows, idx, ctx))
+                return [i for i in idx if i not in got]
+            return _not
+        return self.__leaf(node)
+
+    def __leaf(self, node: dict) -> Callable:
+        col = _column(node, self.title_map)
+        options = node.get("options", {})
+        key = (node["filter_type"], node["pattern"], tuple(sorted(options.items())))
+        if key not in self.checkers:
+            self.checkers[key] = FilterType.compile(node["filter_type"], node["pattern"], **options)
+        check = self.checkers[key]
+        if node["filter_type"] in _TEXT_TYPES and hasattr(check, "strip_check"):
+            return _compile_text_leaf(check, col, col in self.shared)
+        if node["filter_type"] == FilterType.py_exp:
+            column_type = self.types[col] if self.types and col < len(self.types) else None
+            return _compile_py_exp_leaf(check, node["pattern"], col, get_converter(column_type))
+        return lambda rows, idx, ctx: [i for i in idx if check(rows[i][col])]
+
+
+def compile_batch_plan(plan, title_map: dict, checkers: dict = None,
+                       types: List[str] = None) -> Callable[[List[List]], List[int]]:
+    """
+    把筛选条件树编译为批量判断函数 rows -> 命中行的下标列表(升序), 结果与 compile_filter_plan 逐行判断一致
+    checkers, types: 同 compile_filter_plan
+    """
+    if checkers is None:
+        checkers = {}
+    plan = normalize_filter_plan(plan)
+    gen = _BatchCodeGen(title_map, checkers, types)
+    counts = collections.Counter()
+    gen.count_text_columns(plan, counts)
+    gen.shared = {k for k, v in counts.items() if v > 1}
+    fast = gen.gen(plan)
+    match = compile_filter_plan(plan, title_map, checkers, types=types)
+
+    def _batch(rows: List[List]) -> List[int]:
+        try:
+            return fast(rows, list(range(len(rows))), {})
+        except Exception:
+            return [i for i, line in enumerate(rows) if match(line)]
+    return _batch
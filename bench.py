@@ -0,0 +1,335 @@
+"""
+性能基准: 生成指定规模的 xlsx/csv 测试数据, 分别测量读取、各类筛选条件、写入及完整 Task 流水线,
+结果(吞吐、峰值内存、单条件耗时)以 json 输出, 便于不同版本之间对比:
+
+    python bench.py --rows 200000 --width 12 --selectivity 0.1 -o bench.json
+    python bench.py --rows 200000 --baseline old.json --threshold 0.15   # 比旧结果慢 15% 以上时返回 1
+
+默认每个用例在单独的子进程中执行, 峰值内存(peak_rss_kb)只包含该用例本身
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import platform
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import date, timedelta
+from typing import List
+
+# 数据列: tag 用于列表/正则/关键字条件, 命中值为 hit0~hit9; score 为 [0, 1) 的均匀分布
+TAG_COLUMN = "tag"
+SCORE_COLUMN = "score"
+VALUE_TYPES = ("int", "float", "str", "date")
+# 各筛选用例: 名称 -> (筛选类型, 在 tag/score 上达到 selectivity 命中率的条件, 列名)
+FILTER_CASES = {
+    "raw_list": ("raw_list", "\n".join("hit{0}".format(i) for i in range(10)), TAG_COLUMN),
+    "reg_exp": ("reg_exp", "^hit", TAG_COLUMN),
+    "reg_multi": ("reg_multi", "^hit\n^zzz\nqqq$", TAG_COLUMN),
+    "kw_contains": ("kw_contains", "hit", TAG_COLUMN),
+    "py_exp": ("py_exp", "X.startswith('hit')", TAG_COLUMN),
+    "py_exp_num": ("py_exp", "float(X) < {selectivity}", SCORE_COLUMN)
+}
+
+
+def peak_rss_kb() -> int:
+    """当前进程的峰值内存(KB), 取不到时返回 None"""
+    try:
+        import resource
+        ret = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return ret // 1024 if sys.platform == "darwin" else ret
+    except ImportError:
+        pass
+    try:
+        import psutil
+        return psutil.Process().memory_info().peak_wset // 1024
+    except Exception:
+        return None
+
+
+def gen_title(width: int) -> List[str]:
+    width = max(width, 2)
+    return [TAG_COLUMN, SCORE_COLUMN] + ["c{0}_{1}".format(i, VALUE_TYPES[i % len(VALUE_TYPES)])
+                                          for i in range(width - 2)]
+
+
+def gen_rows(rows: int, width: int, selectivity: float, seed: int = 0, types=VALUE_TYPES):
+    """逐行生成数据, tag 列约 selectivity 比例为命中值; 其余列按 types 循环取类型"""
+    rnd = random.Random(seed)
+    width = max(width, 2)
+    col_types = [types[i % len(types)] for i in range(width - 2)]
+    day0 = date(2020, 1, 1)
+    for i in range(rows):
+        score = rnd.random()
+        tag = "hit{0}".format(i % 10) if rnd.random() < selectivity else "miss{0}".format(rnd.randrange(100000))
+        row = [tag, score]
+        for m_type in col_types:
+            if m_type == "int":
+                row.append(rnd.randrange(1000000))
+            elif m_type == "float":
+                row.append(round(rnd.random() * 10000, 2))
+            elif m_type == "date":
+                row.append(day0 + timedelta(days=rnd.randrange(3650)))
+            else:
+                row.append("s{0:x}".format(rnd.getrandbits(40)))
+        yield row
+
+
+def gen_csv(path: str, rows: int, width: int, selectivity: float, seed: int = 0, types=VALUE_TYPES, sep=","):
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(sep.join(gen_title(width)) + "\n")
+        for row in gen_rows(rows, width, selectivity, seed, types):
+            f.write(sep.join(str(m_item) for m_item in row) + "\n")
+
+
+def gen_xlsx(path: str, rows: int, width: int, selectivity: float, seed: int = 0, types=VALUE_TYPES):
+    import openpyxl
+    wb = openpyxl.Workbook(write_only=True)
+    ws = wb.create_sheet()
+    ws.append(gen_title(width))
+    for row in gen_rows(rows, width, selectivity, seed, types):
+        ws.append(row)
+    wb.save(path)
+
+
+def _result(case: str, rows: int, seconds: float, **extra) -> dict:
+    fin = {
+        "case": case,
+        "rows": rows,
+        "seconds": round(seconds, 6),
+        "rows_per_sec": round(rows / seconds, 1) if seconds > 0 else None,
+        "ns_per_row": round(seconds * 1e9 / rows, 1) if rows else None
+    }
+    fin.update(extra)
+    fin["peak_rss_kb"] = peak_rss_kb()
+    return fin
+
+
+def _open_input(path: str):
+    from Filter import get_input_tab_by_filename
+    return get_input_tab_by_filename(path)(path, title_pos=(0, 0), data_pos=(1, 0))
+
+
+def _read_all(ai) -> List[List]:
+    fin = []
+    line = ai._read_nxt_raw_data_line()
+    while line:
+        fin.append(line)
+        line = ai._read_nxt_raw_data_line()
+    return fin
+
+
+def bench_read(path: str) -> dict:
+    ai = _open_input(path)
+    st = time.perf_counter()
+    cnt = 0
+    line = ai._read_nxt_raw_data_line()
+    while line:
+        cnt += 1
+        line = ai._read_nxt_raw_data_line()
+    cost = time.perf_counter() - st
+    ai.close()
+    return _result("read:" + os.path.splitext(path)[-1][1:], cnt, cost)
+
+
+def bench_filter(path: str, name: str, selectivity: float) -> dict:
+    """单个条件在内存中的行上的耗时, 不含读取"""
+    from Filter import compile_filter_plan
+    ai = _open_input(path)
+    rows = _read_all(ai)
+    title_map = dict(ai.get_title_map())
+    ai.close()
+    filter_type, pattern, column = FILTER_CASES[name]
+    match = compile_filter_plan((filter_type, pattern.format(selectivity=selectivity), column), title_map)
+    st = time.perf_counter()
+    passed = sum(1 for line in rows if match(line))
+    cost = time.perf_counter() - st
+    return _result("filter:" + name, len(rows), cost, pass_rate=round(passed / len(rows), 4) if rows else None)
+
+
+def bench_write(path: str, out_ext: str, out_dir: str) -> dict:
+    """输出表写入及保存耗时, 数据先读入内存"""
+    from Filter import get_output_tab_by_filename
+    ai = _open_input(path)
+    rows = _read_all(ai)
+    title = ai.read_title()
+    ai.close()
+    out = os.path.join(out_dir, "bench_write." + out_ext)
+    st = time.perf_counter()
+    ao = get_output_tab_by_filename(out)(out, title=title)
+    for line in rows:
+        ao.write(line)
+    t = time.perf_counter()
+    ao.save()
+    cost = time.perf_counter() - st
+    return _result("write:" + out_ext, len(rows), cost, save_seconds=round(time.perf_counter() - t, 6))
+
+
+def bench_task(path: str, out_ext: str, out_dir: str, selectivity: float) -> dict:
+    """完整 读取 -> 筛选 -> 写入 流水线"""
+    from Filter import Task, get_output_tab_by_filename
+    ai = _open_input(path)
+    filter_type, pattern, column = FILTER_CASES["py_exp_num"]
+    ai.set_filter_plan([(filter_type, pattern.format(selectivity=selectivity), column),
+                        ("reg_exp", "^(hit|miss)", TAG_COLUMN)])
+    out = os.path.join(out_dir, "bench_task." + out_ext)
+    ao = get_output_tab_by_filename(out)(out, title=ai.read_title())
+    tsk = Task(ai, ao)
+    st = time.perf_counter()
+    tsk.run()
+    cost = time.perf_counter() - st
+    if tsk.fault_msg:
+        raise Exception(tsk.fault_msg)
+    rows = tsk.get_pipeline_stats()["read"]["rows"]
+    return _result("task:{0}->{1}".format(os.path.splitext(path)[-1][1:], out_ext), rows, cost,
+                   written=tsk.get_write_len(), bound=tsk.get_pipeline_stats()["bound"])
+
+
+def _run_case(func_name: str, args: tuple) -> dict:
+    # 子进程入口, 按名称取函数以便 spawn 方式 pickle
+    return globals()[func_name](*args)
+
+
+def build_cases(inputs: List[str], out_exts: List[str], out_dir: str, selectivity: float, filters: List[str]):
+    cases = []
+    for path in inputs:
+        cases.append(("bench_read", (path,)))
+    # 条件和写入只与内存中的行有关, 用第一个输入即可
+    for name in filters:
+        cases.append(("bench_filter", (inputs[0], name, selectivity)))
+    for m_ext in out_exts:
+        cases.append(("bench_write", (inputs[0], m_ext, out_dir)))
+    for path in inputs:
+        for m_ext in out_exts:
+            cases.append(("bench_task", (path, m_ext, out_dir, selectivity)))
+    return cases
+
+
+def run_cases(cases, repeat: int = 1, isolate: bool = True) -> List[dict]:
+    """每个用例执行 repeat 次取最快的一次; isolate 时每次在新的子进程中执行"""
+    fin = []
+    for func_name, args in cases:
+        best = None
+        for _ in range(max(repeat, 1)):
+            if isolate:
+                with ProcessPoolExecutor(1, mp_context=multiprocessing.get_context("spawn")) as pool:
+                    ret = pool.submit(_run_case, func_name, args).result()
+            else:
+                ret = _run_case(func_name, args)
+            if best is None or ret["seconds"] < best["seconds"]:
+                best = ret
+        print("{0:<28} {1:>12} rows/s  {2} KB".format(best["case"], best["rows_per_sec"], best["peak_rss_kb"]),
+              file=sys.stderr)
+        fin.append(best)
+    return fin
+
+
+def git_revision() -> str:
+    try:
+        return subprocess.check_output(["git", "describe", "--always", "--dirty"], cwd=os.path.dirname(
+            os.path.abspath(__file__)), stderr=subprocess.DEVNULL).decode().strip()
+    except Exception:
+        return ""
+
+
+def compare(results: List[dict], baseline: List[dict], threshold: float) -> List[dict]:
+    """与旧结果按用例名对比吞吐, 返回变慢超过 threshold 比例的用例"""
+    old = {m_item["case"]: m_item for m_item in baseline}
+    fin = []
+    for m_item in results:
+        prev = old.get(m_item["case"], None)
+        if not prev or not prev.get("rows_per_sec") or not m_item.get("rows_per_sec"):
+            continue
+        ratio = m_item["rows_per_sec"] / prev["rows_per_sec"]
+        if ratio < 1 - threshold:
+            fin.append({"case": m_item["case"], "before": prev["rows_per_sec"], "after": m_item["rows_per_sec"],
+                        "ratio": round(ratio, 3)})
+    return fin
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description="表格筛选性能基准")
+    parser.add_argument("--rows", type=int, default=100000, help="数据行数, 默认 100000")
+    parser.add_argument("--width", type=int, default=10, help="列数, 默认 10")
+    parser.add_argument("--types", default=",".join(VALUE_TYPES), help="其余列的值类型, 逗号分隔: int,float,str,date")
+    parser.add_argument("--selectivity", type=float, default=0.1, help="条件命中比例, 默认 0.1")
+    parser.add_argument("--formats", default="csv,xlsx", help="输入格式, 默认 csv,xlsx")
+    parser.add_argument("--outputs", default="csv,xlsx", help="输出格式, 默认 csv,xlsx")
+    parser.add_argument("--filters", default=",".join(FILTER_CASES), help="测量的条件, 默认全部")
+    parser.add_argument("--repeat", type=int, default=1, help="每个用例执行次数, 取最快一次")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--data-dir", help="测试数据目录, 已存在同规模数据时直接使用; 默认临时目录, 结束后删除")
+    parser.add_argument("--no-isolate", action="store_true", help="在当前进程中执行全部用例(峰值内存不再区分用例)")
+    parser.add_argument("-o", "--output", help="结果 json 路径, 默认写到标准输出")
+    parser.add_argument("--baseline", help="对比的旧结果 json")
+    parser.add_argument("--threshold", type=float, default=0.1, help="吞吐下降超过该比例视为退化, 默认 0.1")
+    return parser
+
+
+def main(argv=None) -> int:
+    args = build_parser().parse_args(argv)
+    types = tuple(m_item.strip() for m_item in args.types.split(",") if m_item.strip())
+    for m_item in types:
+        if m_item not in VALUE_TYPES:
+            raise Exception("未知的值类型[{0}]".format(m_item))
+    data_dir = args.data_dir or tempfile.mkdtemp(prefix="excel_filter_bench_")
+    os.makedirs(data_dir, exist_ok=True)
+    try:
+        inputs = []
+        for m_ext in [m_item.strip() for m_item in args.formats.split(",") if m_item.strip()]:
+            path = os.path.join(data_dir, "bench_{0}x{1}_{2}_{3}_{4}.{5}".format(
+                args.rows, args.width, "-".join(types), args.selectivity, args.seed, m_ext))
+            if not os.path.isfile(path):
+                st = time.perf_counter()
+                gen = gen_xlsx if m_ext in ("xlsx", "xls") else gen_csv
+                gen(path, args.rows, args.width, args.selectivity, args.seed, types)
+                print("generated {0} in {1:.1f}s".format(path, time.perf_counter() - st), file=sys.stderr)
+            inputs.append(path)
+        out_exts = [m_item.strip() for m_item in args.outputs.split(",") if m_item.strip()]
+        filters = [m_item.strip() for m_item in args.filters.split(",") if m_item.strip()]
+        cases = build_cases(inputs, out_exts, data_dir, args.selectivity, filters)
+        results = run_cases(cases, args.repeat, not args.no_isolate)
+    finally:
+        if not args.data_dir:
+            shutil.rmtree(data_dir, ignore_errors=True)
+
+    report = {
+        "meta": {
+            "revision": git_revision(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "time": time.strftime("%Y-%m-%d %H:%M:%S"),
+            "rows": args.rows,
+            "width": args.width,
+            "types": list(types),
+            "selectivity": args.selectivity,
+            "seed": args.seed
+        },
+        "results": results
+    }
+    ret = 0
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            slower = compare(results, json.load(f)["results"], args.threshold)
+        report["regressions"] = slower
+        for m_item in slower:
+            print("slower: {case} {before} -> {after} rows/s ({ratio})".format(**m_item), file=sys.stderr)
+        ret = 1 if slower else 0
+    text = json.dumps(report, indent=1, ensure_ascii=False)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text)
+    else:
+        print(text)
+    return ret
+
+
+if __name__ == "__main__":
+    multiprocessing.freeze_support()
+    sys.exit(main())
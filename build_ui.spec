@@ -3,7 +3,7 @@
 block_cipher = None
 
 
-a = Analysis(['main.py','main_ui.py','imgs.py','Filter.py'],
+a = Analysis(['main.py','main_ui.py','imgs.py','Filter.py','Batch.py','Job.py','Cache.py','Memo.py','Vector.py','Typed.py'],
              pathex=['D:\\share_dir\\product_env\\01.SVN\01.local_git\\ExcelFilter.git','res'],
              binaries=[],
              datas=[],
@@ -0,0 +1,183 @@
+"""
+命令行筛选入口, 不依赖界面, 可用于定时任务和管道:
+
+    python cli.py -i data.xlsx -o out.csv -f raw_list 地区 "华东\n华南" -f py_exp 金额 "float(X) > 100" -c 客户 -c 金额
+    cat data.csv | python cli.py -i - -o - -f reg_exp name "^A"
+    python cli.py -i data.xlsx -o "out/{value}.csv" --partition-by 地区
+    python cli.py --job jobs.json
+
+位置参数与界面一致从 1 开始, 标题行为 0 表示没有标题行(列名按 1,2,3... 编号)
+"""
+import argparse
+import glob
+import json
+import os
+import sys
+import threading
+from Filter import CsvInputTab, CsvOutputTab, PartitionedOutputTab, Task, checkpoint_output_kwargs, load_checkpoint, \
+    get_input_tab_by_filename, get_output_tab_by_filename
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description="表格条件筛选")
+    parser.add_argument("--job", action="append", default=[],
+                        help="任务描述文件(json/toml, 格式见 Job.py), 可重复; 指定后忽略其他参数")
+    parser.add_argument("-i", "--input", action="append",
+                        help="输入文件, 可重复/目录/通配符(批量); '-' 表示从标准输入读取 csv")
+    parser.add_argument("-o", "--output", help="输出文件; '-' 表示 csv 写到标准输出")
+    parser.add_argument("--title-row", type=int, default=1, help="标题行, 默认 1, 0 表示无标题")
+    parser.add_argument("--title-col", type=int, default=1, help="标题起始列, 默认 1")
+    parser.add_argument("--data-row", type=int, default=2, help="数据起始行, 默认 2")
+    parser.add_argument("--data-col", type=int, default=1, help="数据起始列, 默认 1")
+    parser.add_argument("-f", "--filter", nargs=3, action="append", default=[], metavar=("TYPE", "COLUMN", "PATTERN"),
+                        help="筛选条件(可重复, 之间为 and): 类型 raw_list/py_exp/reg_exp/reg_multi/kw_contains, 列名, 条件")
+    parser.add_argument("--plan", help="and/or/not 条件树, json 字符串或 json 文件路径")
+    parser.add_argument("-c", "--column", action="append", default=[], help="输出列名, 可重复, 默认输出全部列")
+    parser.add_argument("--sep", default=",", help="csv 分隔符, 默认 ','")
+    parser.add_argument("--encoding", default=None, help="输入 csv 编码, 默认系统编码")
+    parser.add_argument("--workers", type=int, default=1, help="csv 多进程并行数 / 批量执行的并行数")
+    parser.add_argument("--adaptive", action="store_true", help="按通过率和耗时自适应调整条件顺序")
+    parser.add_argument("--partition-by", metavar="COLUMN",
+                        help="按该列取值拆分输出, 输出路径中的 {value} 替换为取值, 如 out/{value}.csv")
+    parser.add_argument("--cache-dir", metavar="DIR",
+                        help="xlsx 列式缓存目录, 同一文件再次读取时跳过解析, 文件变化时自动重建")
+    parser.add_argument("--memo-dir", metavar="DIR",
+                        help="筛选结果缓存目录, 再次以相同输入和条件执行时不再判断条件")
+    parser.add_argument("--merge", action="store_true", help="批量执行时合并输出到一个文件")
+    parser.add_argument("--checkpoint", metavar="PATH",
+                        help="断点文件: 定期记录进度, 中断(Ctrl+C 或异常退出)后以相同参数再次执行时从断点继续")
+    parser.add_argument("--checkpoint-interval", type=float, default=30.0, help="写入断点的间隔秒数, 默认 30")
+    parser.add_argument("--stats", metavar="PATH",
+                        help="统计读取/各条件/写入耗时, 结束后以 json 写入该文件('-' 为标准错误输出)")
+    parser.add_argument("--profile", metavar="PATH", help="对本次执行做 cProfile, 结果写入该 .prof 文件")
+    parser.add_argument("--progress", action="store_true", help="在标准错误输出进度")
+    return parser
+
+
+def load_plan(text: str):
+    if os.path.isfile(text):
+        with open(text, "r", encoding="utf-8") as f:
+            return json.load(f)
+    return json.loads(text)
+
+
+def _unescape(pattern: str) -> str:
+    # 命令行里不方便输入换行, 允许用 \n 和 \t 分隔列表项
+    return pattern.replace("\\n", "\n").replace("\\t", "\t")
+
+
+def _wait(tsk, show_progress: bool):
+    # 在子线程执行, 主线程等待时可响应 Ctrl+C: 取消任务, 保存已写出的部分和断点后退出
+    t = threading.Thread(target=tsk.run, daemon=True)
+    t.start()
+    while t.is_alive():
+        try:
+            t.join(1)
+        except KeyboardInterrupt:
+            if hasattr(tsk, "cancel"):
+                tsk.cancel()
+                t.join()
+                break
+            raise
+        if show_progress:
+            sys.stderr.write("\r进度: {0:.2f}%  写入行数: {1}".format(100 * min(tsk.get_progress(), 1),
+                                                                  tsk.get_write_len()))
+            sys.stderr.flush()
+    if show_progress:
+        sys.stderr.write("\n")
+
+
+def run_job_files(paths, show_progress: bool) -> int:
+    from Job import JobRunner, load_job_specs
+    try:
+        specs = []
+        for m_item in paths:
+            specs.extend(load_job_specs(m_item))
+        runner = JobRunner(specs)
+        _wait(runner, show_progress)
+    except Exception as e:
+        sys.stderr.write("发生错误 {0}\n".format(e))
+        return 1
+    for output, cnt, fault in runner.results:
+        if fault:
+            sys.stderr.write("{0} 发生错误 {1}\n".format(output, fault))
+        else:
+            sys.stderr.write("{0} 分析完成，写入行数:{1}\n".format(output, cnt))
+    return 1 if runner.fault_msg else 0
+
+
+def main(argv=None) -> int:
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    if args.job:
+        return run_job_files(args.job, args.progress)
+    if not args.input or not args.output:
+        parser.error("需要 -i/--input 和 -o/--output, 或 --job")
+    title_pos = (args.title_row - 1, args.title_col - 1)
+    data_pos = (args.data_row - 1, args.data_col - 1)
+    plan = [(filter_type, _unescape(pattern), column) for filter_type, column, pattern in args.filter]
+    if args.plan:
+        plan.append(load_plan(args.plan))
+    filter_title = args.column or None
+    in_kwargs = {"sep": args.sep, "encoding": args.encoding, "workers": args.workers, "adaptive": args.adaptive}
+    if args.cache_dir:
+        in_kwargs["cache_dir"] = args.cache_dir
+    out_kwargs = {"sep": args.sep}
+    if args.partition_by:
+        out_kwargs["partition_by"] = args.partition_by
+
+    src = args.input[0]
+    try:
+        if len(args.input) > 1 or os.path.isdir(src) or glob.has_magic(src):
+            # 批量执行时才导入
+            from Batch import BatchTask
+            tsk = BatchTask(args.input, args.output, title_pos, data_pos, plan=plan, filter_title=filter_title,
+                            merge=args.merge, workers=args.workers, in_kwargs=dict(in_kwargs, workers=1),
+                            out_kwargs=out_kwargs, memo_dir=args.memo_dir)
+        else:
+            if src == "-":
+                ai = CsvInputTab(src, title_pos, data_pos, fileobj=sys.stdin.buffer, **in_kwargs)
+            else:
+                ai = get_input_tab_by_filename(src)(src, title_pos, data_pos, **in_kwargs)
+            try:
+                ai.set_filter_plan(plan)
+            except Exception:
+                ai.close()
+                raise
+            state = None
+            if args.checkpoint:
+                state = load_checkpoint(args.checkpoint, ai, args.output, filter_title)
+                out_kwargs.update(checkpoint_output_kwargs(args.checkpoint, state))
+                if state:
+                    sys.stderr.write("从断点继续, 已写入行数:{0}\n".format(state["output_state"]["rows"]))
+            if args.partition_by:
+                ao = PartitionedOutputTab(args.output, ai.read_title(), filter_title, **out_kwargs)
+            elif args.output == "-":
+                ao = CsvOutputTab(args.output, ai.read_title(), filter_title, fileobj=sys.stdout, **out_kwargs)
+            else:
+                ao = get_output_tab_by_filename(args.output)(args.output, ai.read_title(), filter_title,
+                                                             **out_kwargs)
+            tsk = Task(ai, ao, checkpoint=args.checkpoint, checkpoint_interval=args.checkpoint_interval,
+                       resume_state=state, instrument=bool(args.stats), profile=args.profile or False,
+                       memo_dir=args.memo_dir)
+        _wait(tsk, args.progress)
+    except Exception as e:
+        sys.stderr.write("发生错误 {0}\n".format(e))
+        return 1
+
+    if args.stats and hasattr(tsk, "get_stats"):
+        text = json.dumps(tsk.get_stats(), indent=1, ensure_ascii=False)
+        if args.stats == "-":
+            sys.stderr.write(text + "\n")
+        else:
+            with open(args.stats, "w", encoding="utf-8") as f:
+                f.write(text)
+    if tsk.fault_msg:
+        sys.stderr.write("发生错误 {0}\n".format(tsk.fault_msg))
+        return 1
+    sys.stderr.write("分析完成，写入行数:{0}\n".format(tsk.get_write_len()))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
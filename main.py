@@ -1,22 +1,98 @@
+import glob
 import json
+import multiprocessing
 import os
-import re
 import sys
-import time
 import threading
 from PySide2.QtCore import Slot
 from PySide2.QtGui import QTextCursor, QIcon, QPixmap
 from PySide2.QtWidgets import QApplication, QMainWindow, QLineEdit, QTextEdit, \
     QPushButton, \
-    QFileDialog
-from PySide2.QtCore import Signal, Slot, QDateTime, QTimer, QEventLoop, QCoreApplication
+    QFileDialog, QWidget, QLabel, QProgressBar, QHBoxLayout, QVBoxLayout
+from PySide2.QtCore import Signal, Slot, QObject, QRunnable, QThreadPool
 from main_ui import Ui_water_mainwd
-from Filter import FilterType, get_input_tab_by_filename, get_output_tab_by_filename, Task
+from Filter import FilterType, get_input_tab_by_filename, get_output_tab_by_filename, Task, load_checkpoint, \
+    checkpoint_output_kwargs
+from Batch import BatchTask
+from Job import load_job_specs, dump_job_specs
+from Memo import DEFAULT_MEMO_DIR
 import imgs
 
 
+class TaskSignals(QObject):
+    # 任务编号, 进度(0~1), 写入行数
+    progress = Signal(int, float, int)
+    finished = Signal(int)
+
+
+class TaskWorker(QRunnable):
+    """
+    在线程池中执行 Task/BatchTask, 执行期间每隔 interval 秒取一次进度,
+    有变化时才发出 progress 信号, 界面刷新频率与任务行数无关
+    """
+
+    def __init__(self, tid: int, tsk, interval: float = 0.2):
+        QRunnable.__init__(self)
+        self.tid = tid
+        self.tsk = tsk
+        self.interval = interval
+        self.signals = TaskSignals()
+
+    def run(self):
+        t = threading.Thread(target=self.tsk.run)
+        t.setDaemon(True)
+        t.start()
+        last = None
+        while t.is_alive():
+            t.join(self.interval)
+            cur = (int(1000 * min(self.tsk.get_progress(), 1)), self.tsk.get_write_len())
+            if cur != last:
+                last = cur
+                self.signals.progress.emit(self.tid, cur[0] / 1000.0, cur[1])
+        self.signals.finished.emit(self.tid)
+
+
+class TaskItem(QWidget):
+    """任务面板中的一行: 名称, 进度条, 写入行数, 暂停/取消; 进度更新只改本行控件"""
+
+    def __init__(self, name: str, tsk, parent=None):
+        QWidget.__init__(self, parent)
+        self.tsk = tsk
+        layout = QHBoxLayout(self)
+        layout.setContentsMargins(2, 0, 2, 0)
+        self.name_lbl = QLabel(name, self)
+        self.name_lbl.setFixedWidth(260)
+        self.bar = QProgressBar(self)
+        self.bar.setRange(0, 1000)
+        self.bar.setFormat("%p%")
+        self.cnt_lbl = QLabel("写入行数:0", self)
+        self.cnt_lbl.setFixedWidth(130)
+        self.pause_btn = QPushButton("暂停", self)
+        self.pause_btn.setFixedWidth(45)
+        self.cancel_btn = QPushButton("取消", self)
+        self.cancel_btn.setFixedWidth(45)
+        for m_item in (self.name_lbl, self.bar, self.cnt_lbl, self.pause_btn, self.cancel_btn):
+            layout.addWidget(m_item)
+        self.pause_btn.clicked.connect(self.toggle_pause)
+        self.cancel_btn.clicked.connect(self.tsk.cancel)
+
+    def set_progress(self, pct: float, cnt: int):
+        self.bar.setValue(int(pct * 1000))
+        self.cnt_lbl.setText("写入行数:{0}".format(cnt))
+
+    def set_paused(self, paused: bool):
+        if paused:
+            self.tsk.pause()
+        else:
+            self.tsk.resume()
+        self.pause_btn.setText("继续" if paused else "暂停")
+
+    def toggle_pause(self):
+        self.set_paused(not self.tsk.is_paused())
+
+
 class UI(QMainWindow, Ui_water_mainwd):
-    signal_log = Signal(str, bool, object)
+    signal_log = Signal(str, bool)
 
     def __init__(self, *wd, **kw):
         Ui_water_mainwd.__init__(self)
@@ -53,10 +129,15 @@ class UI(QMainWindow, Ui_water_mainwd):
 
         self.load_input_set()
 
+        # 执行中的任务: 编号 -> (名称, 输出路径, 任务, 进度行, worker)
         self.__task_map = {}
-        self.__task_lock = threading.RLock()
-
-        self.start()
+        self.__task_id = 0
+        self.__pool = QThreadPool(self)
+        self.__pool.setMaxThreadCount(max(4, os.cpu_count() or 1))
+        self.__task_layout = QVBoxLayout(self.task_area_contents)
+        self.__task_layout.setContentsMargins(0, 0, 0, 0)
+        self.__task_layout.setSpacing(0)
+        self.__task_layout.addStretch()
 
     def dump_input_set(self):
         dct = {}
@@ -86,6 +167,10 @@ class UI(QMainWindow, Ui_water_mainwd):
     def closeEvent(self, event):
         print("main window close event")
         self.dump_input_set()
+        # 取消执行中的任务, 已写出的部分和断点保存后再退出
+        for m_item in self.__task_map.values():
+            m_item[2].cancel()
+        self.__pool.waitForDone(10000)
         # os._exit(0)
         sys.exit(0)
 
@@ -133,87 +218,94 @@ class UI(QMainWindow, Ui_water_mainwd):
                 callback(item)
 
     def load_setting(self, path):
-        pass
-        # try:
-        #     with open(path, "r", encoding="utf-8") as f:
-        #         dct = json.load(f)
-        #         if dct:
-        #             # 先清空
-        #             for i in range(99):
-        #                 if hasattr(self, "{0}_{1}".format("item_name", i + 1)):
-        #                     self.__getattribute__("{0}_{1}".format("item_name", i + 1)).setText("")
-        #                     self.__getattribute__("{0}_{1}".format("item_reg", i + 1)).setText("")
-        #                     self.__getattribute__("{0}_{1}".format("item_index", i + 1)).setText("0")
-        #                     self.__getattribute__("{0}_{1}".format("item_skip", i + 1)).setText("0")
-        #                 else:
-        #                     break
-        #             for k, v in dct.items():
-        #                 if hasattr(self, k):
-        #                     item = self.__getattribute__(k)
-        #                     if isinstance(item, QLineEdit) or isinstance(item, QTextEdit):
-        #                         item.setText(v)
-        #             # 更新读取字典
-        #             if dct.get("items_lists", None) is not None and isinstance(dct["items_lists"], list):
-        #                 for idx, item in enumerate(dct["items_lists"]):
-        #                     if not isinstance(item, dict):
-        #                         self.log_msg(u"{0} 读取异常".format(item))
-        #                         continue
-        #                     for k_name in ["item_name", "item_reg", "item_index", "item_skip"]:
-        #                         if hasattr(self, "{0}_{1}".format(k_name, idx + 1)):
-        #                             self.__getattribute__("{0}_{1}".format(k_name, idx + 1)).setText(
-        #                                 str(item.get(k_name, "")))
-        #             else:
-        #                 self.log_msg(u"未发现items_lists 或其不为列表")
-        #
-        #         self.log_msg(u"从:{0} 读取配置成功".format(path))
-        # except Exception as e:
-        #     self.log_msg(str(e))
-
+        try:
+            specs = load_job_specs(path)
+            spec = specs[0]
+            self.sel_input_lbl.setText(spec["input"])
+            out_dir, out_name = os.path.split(spec["output"])
+            self.sel_output_lbl.setText(out_dir)
+            self.sel_output_file.setText(out_name)
+            for k, widget in (("title_row", self.title_start_row), ("title_col", self.title_start_column),
+                              ("data_row", self.data_start_row), ("data_col", self.data_start_column)):
+                widget.setText(str(spec[k]))
+            plan = spec["filter"]
+            leaves = plan.get("and", [plan])
+            check_map = {
+                FilterType.raw_list: "sel_btn_lst_{0}",
+                FilterType.py_exp: "sel_btn_py_{0}",
+                FilterType.reg_exp: "sel_btn_regexp_{0}"
+            }
+            if len(leaves) > self.filter_num or \
+                    any(m_item.get("filter_type", None) not in check_map or m_item.get("options") for m_item in leaves):
+                self.log_msg(u"条件超出界面支持的范围(最多{0}个并列的列表/表达式/正则条件), 请用命令行执行".format(
+                    self.filter_num))
+                return
+            for i in range(self.filter_num):
+                filter_input = self.__getattribute__("filter_input_{0}".format(i + 1))
+                filter_col = self.__getattribute__("title_start_row_{0}".format(i + 1))
+                if i < len(leaves):
+                    filter_input.setText(leaves[i]["pattern"])
+                    filter_col.setText(leaves[i]["filter_title"])
+                    self.__getattribute__(check_map[leaves[i]["filter_type"]].format(i + 1)).setChecked(True)
+                else:
+                    filter_input.clear()
+                    filter_col.clear()
+            self.filter_result_items.setText("\n".join(spec["columns"]))
+            if len(specs) > 1:
+                self.log_msg(u"配置中有{0}个任务, 界面只显示第一个".format(len(specs)))
+            self.log_msg(u"从:{0} 读取配置成功".format(path))
+        except Exception as e:
+            self.log_msg(str(e))
 
     def dump_setting(self, path):
-        pass
-        # try:
-        #     with open(path, "w+", encoding="utf-8") as f:
-        #         dct = {}
-        #         for k, item in self.__dict__.items():
-        #             if isinstance(item, QLineEdit):
-        #                 if k.endswith("_filter"):
-        #                     dct[k] = item.text()
-        #         dct["items_lists"] = []
-        #         idx_cnt = 1
-        #         while 1:
-        #             if not hasattr(self, "{0}_{1}".format("item_name", idx_cnt)):
-        #                 break
-        #             per_line = {}
-        #             for k_name in ["item_name", "item_reg", "item_index", "item_skip"]:
-        #                 if hasattr(self, "{0}_{1}".format(k_name, idx_cnt)):
-        #                     per_line[k_name] = self.__getattribute__("{0}_{1}".format(k_name, idx_cnt)).text()
-        #             dct["items_lists"].append(per_line)
-        #             idx_cnt += 1
-        #         f.write(json.dumps(dct, indent=1, ensure_ascii=False))
-        #         self.log_msg(u"保存配置文件到:{0} 成功".format(path))
-        # except Exception as e:
-        #     self.log_msg(str(e))
-
-    def log_msg(self, msg, mv_end=True, replace_pattern: str or re.RegexFlag = ""):
-        self.signal_log.emit(msg, mv_end, replace_pattern)
-
-    def _log_msg(self, msg, mv_end=True, replace_pattern: str or re.RegexFlag = ""):
-        cursor = self.result_lbl.textCursor()
-        if replace_pattern:
-            ret = []
-            found = False
-            for item in self.result_lbl.toPlainText().split("\n"):
-                if re.search(replace_pattern, item):
-                    ret.append(msg)
-                    found = True
+        try:
+            filter_title = [m_item for m_item in self.filter_result_items.toPlainText().strip().split('\n') if m_item]
+            dump_job_specs(path, [{
+                "input": self.sel_input_lbl.text(),
+                "title_row": int(self.title_start_row.text()),
+                "title_col": int(self.title_start_column.text()),
+                "data_row": int(self.data_start_row.text()),
+                "data_col": int(self.data_start_column.text()),
+                "filter": self.get_filters(),
+                "columns": filter_title,
+                "output": self.get_output_path()
+            }])
+            self.log_msg(u"保存配置文件到:{0} 成功".format(path))
+        except Exception as e:
+            self.log_msg(str(e))
+
+    def get_output_path(self) -> str:
+        output_file_name = self.sel_output_file.text()
+        if not os.path.splitext(output_file_name)[-1]:
+            output_file_name = output_file_name + '.xlsx'
+        if not self.sel_output_lbl.text():
+            return output_file_name
+        return self.sel_output_lbl.text() + os.sep + output_file_name
+
+    def get_filters(self) -> list:
+        filters = []
+        for i in range(self.filter_num):
+            filter_txt = self.__getattribute__("filter_input_{0}".format(i + 1)).toPlainText().strip()
+            if filter_txt:
+                if self.__getattribute__("sel_btn_lst_{0}".format(i+1)).isChecked():
+                    filter_type = FilterType.raw_list
+                elif self.__getattribute__("sel_btn_py_{0}".format(i+1)).isChecked():
+                    filter_type = FilterType.py_exp
                 else:
-                    ret.append(item)
-            if not found:
-                ret.append(msg)
-            self.result_lbl.setText("\n".join(ret))
-        else:
-            cursor.insertText(msg + "\n")
+                    filter_type = FilterType.reg_exp
+                filter_col = self.__getattribute__("title_start_row_{0}".format(i+1)).text()
+                print(filter_type, filter_txt, filter_col)
+                filters.append((filter_type, filter_txt, filter_col))
+        return filters
+
+    def log_msg(self, msg, mv_end=True):
+        self.signal_log.emit(msg, mv_end)
+
+    def _log_msg(self, msg, mv_end=True):
+        # 只在末尾追加, 进度显示在任务面板中
+        cursor = self.result_lbl.textCursor()
+        cursor.movePosition(QTextCursor.End)
+        cursor.insertText(msg + "\n")
 
         if mv_end:
             cursor.movePosition(QTextCursor.End)
@@ -238,91 +330,124 @@ class UI(QMainWindow, Ui_water_mainwd):
 
     @Slot()
     def on_exec_btn_clicked(self):
-        self.clear_output_btn.click()
-        self.log_msg("请等待...")
-        output_file_name = self.sel_output_file.text()
-        if not os.path.splitext(output_file_name)[-1]:
-            output_file_name = output_file_name + '.xlsx'
-        if not self.sel_output_lbl.text():
-            dst = output_file_name
-        else:
-            dst = self.sel_output_lbl.text() + os.sep + output_file_name
+        if not self.__task_map:
+            self.clear_output_btn.click()
+        dst = self.get_output_path()
         src = self.sel_input_lbl.text()
-        try:
-            ai = get_input_tab_by_filename(src)(
-                src, data_pos=(int(self.data_start_row.text()) - 1, int(self.data_start_column.text()) - 1),
-                title_pos=(int(self.title_start_row.text()) - 1, int(self.title_start_column.text()) - 1))
-        except Exception as e:
-            self.log_msg(e.__str__())
+        if any(m_item[1] == dst for m_item in self.__task_map.values()):
+            self.log_msg("{0} 正在执行中".format(dst))
             return
-        for i in range(self.filter_num):
-            filter_txt = self.__getattribute__("filter_input_{0}".format(i + 1)).toPlainText().strip()
-            if filter_txt:
-                if self.__getattribute__("sel_btn_lst_{0}".format(i+1)).isChecked():
-                    filter_type = FilterType.raw_list
-                elif self.__getattribute__("sel_btn_py_{0}".format(i+1)).isChecked():
-                    filter_type = FilterType.py_exp
-                else:
-                    filter_type = FilterType.reg_exp
-                filter_col = self.__getattribute__("title_start_row_{0}".format(i+1)).text()
-                print(filter_type, filter_txt, filter_col)
-                ai.add_filter(filter_type, filter_txt, filter_col)
-
-        title = ai.read_title()
+        self.log_msg("请等待...")
+        data_pos = (int(self.data_start_row.text()) - 1, int(self.data_start_column.text()) - 1)
+        title_pos = (int(self.title_start_row.text()) - 1, int(self.title_start_column.text()) - 1)
+        filters = self.get_filters()
         filter_title = self.filter_result_items.toPlainText().strip().split('\n')
-        ao = get_output_tab_by_filename(dst)(dst, title=title, filter_title=filter_title)
-        tsk = Task(ai, ao)
-
-        self.__task_lock.acquire()
-        self.__task_map["{0}->{1}".format(
-            os.path.split(src)[-1], os.path.split(dst)[-1])] = tsk
-        self.__task_lock.release()
-        st = time.time()
-        tsk.start()
-        while time.time() - st <= 120 and not tsk.is_done():
-            QCoreApplication.processEvents(QEventLoop.AllEvents, 100)
-            time.sleep(1)
-        if tsk.is_done() and self.open_when_fin_btn.isChecked():
+        # 勾选结果缓存时, 输入和条件与之前某次执行相同则直接使用记录的命中行
+        memo_dir = DEFAULT_MEMO_DIR if self.memo_btn.isChecked() else None
+
+        # 多个文件/目录/通配符: 批量执行, 每个输入各输出一个文件
+        if "||" in src or os.path.isdir(src) or glob.has_magic(src):
             try:
-                os.system("explorer \\e,\\root,{0}".format(self.sel_output_lbl.text().replace("/", os.sep)))
+                tsk = BatchTask(src, dst, title_pos=title_pos, data_pos=data_pos, plan=filters,
+                                filter_title=filter_title, memo_dir=memo_dir)
             except Exception as e:
-                print(e)
-
-    def _routine(self):
-        while True:
-            self.__task_lock.acquire()
-            for item in list(self.__task_map.items()):
-                if item is not None:
-                    k, v = item
-                else:
-                    continue
-                if not isinstance(v, Task):
-                    continue
-
-                raw_pct = v.get_progress()
-                raw_pct = raw_pct if raw_pct < 1 else 1
-                pct = int(35 * raw_pct)
-                p = "▋" * pct + " " * (35 - pct)
-                self.log_msg("{0} 分析进度:{1} \t{2:.2f}%\n".format(k, p, 100*pct/35.0),
-                             mv_end=True, replace_pattern="{0} 分析进度".format(k))
-                if v.is_done():
-                    if not v.fault_msg:
-                        self.log_msg("{0} 分析完成，写入行数:{1}".format(k, v.get_write_len()))
-                    else:
-                        self.log_msg("发生错误 " + v.fault_msg + "\n")
-                    self.__task_map.pop(k)
-
-            self.__task_lock.release()
-            QCoreApplication.processEvents(QEventLoop.AllEvents, 100)
-            time.sleep(1)
-
-    def start(self):
-        t = threading.Thread(target=self._routine)
-        t.setDaemon(True)
-        t.start()
+                self.log_msg(e.__str__())
+                return
+            src = "{0}个文件".format(len(tsk.inputs))
+        else:
+            try:
+                ai = get_input_tab_by_filename(src)(src, data_pos=data_pos, title_pos=title_pos)
+            except Exception as e:
+                self.log_msg(e.__str__())
+                return
+            for filter_type, filter_txt, filter_col in filters:
+                try:
+                    ai.add_filter(filter_type, filter_txt, filter_col)
+                except Exception as e:
+                    ai.close()
+                    self.log_msg(e.__str__())
+                    return
+
+            title = ai.read_title()
+            # 勾选断点续跑时断点文件放在输出旁边, 上次取消或中断的同一任务从断点继续, 成功完成后删除
+            checkpoint = dst + ".ckpt" if self.checkpoint_btn.isChecked() else None
+            state = load_checkpoint(checkpoint, ai, dst, filter_title)
+            if state:
+                self.log_msg("从断点继续, 已写入行数:{0}".format(state["output_state"]["rows"]))
+            try:
+                ao = get_output_tab_by_filename(dst)(dst, title=title, filter_title=filter_title,
+                                                     **checkpoint_output_kwargs(checkpoint, state))
+            except Exception as e:
+                ai.close()
+                self.log_msg(e.__str__())
+                return
+            # 只修改输出列也可以命中结果缓存
+            tsk = Task(ai, ao, checkpoint=checkpoint, resume_state=state, memo_dir=memo_dir)
+            if tsk.memo_hit:
+                self.log_msg("输入和条件未变化, 使用上次的筛选结果")
+
+        self.__submit("{0}->{1}".format(os.path.split(src)[-1], os.path.split(dst)[-1]), dst, tsk)
+
+    def __submit(self, name: str, dst: str, tsk):
+        self.__task_id += 1
+        tid = self.__task_id
+        item = TaskItem(name, tsk, self.task_area_contents)
+        self.__task_layout.insertWidget(self.__task_layout.count() - 1, item)
+        worker = TaskWorker(tid, tsk)
+        worker.signals.progress.connect(self.on_task_progress)
+        worker.signals.finished.connect(self.on_task_finished)
+        self.__task_map[tid] = (name, dst, tsk, item, worker)
+        self.__pool.start(worker)
+
+    @Slot(int, float, int)
+    def on_task_progress(self, tid, pct, cnt):
+        m_item = self.__task_map.get(tid, None)
+        if m_item is not None:
+            m_item[3].set_progress(pct, cnt)
+
+    @Slot(int)
+    def on_task_finished(self, tid):
+        m_item = self.__task_map.pop(tid, None)
+        if m_item is None:
+            return
+        k, _, v, item, _ = m_item
+        self.__task_layout.removeWidget(item)
+        item.deleteLater()
+        if v.cancelled:
+            self.log_msg("{0} 已取消，写入行数:{1}{2}".format(
+                k, v.get_write_len(), ", 再次执行时从断点继续" if isinstance(v, Task) and v._checkpoint else ""))
+        elif not v.fault_msg:
+            self.log_msg("{0} 分析完成，写入行数:{1}".format(k, v.get_write_len()))
+            if self.open_when_fin_btn.isChecked():
+                try:
+                    os.system("explorer \\e,\\root,{0}".format(self.sel_output_lbl.text().replace("/", os.sep)))
+                except Exception as e:
+                    print(e)
+        else:
+            self.log_msg("{0} 发生错误 {1}".format(k, v.fault_msg))
+        if not self.__task_map:
+            self.pause_btn.setText("暂停")
+
+    @Slot()
+    def on_pause_btn_clicked(self):
+        # 对全部执行中的任务: 有暂停的则全部继续, 否则全部暂停
+        items = [m_item[3] for m_item in self.__task_map.values()]
+        if not items:
+            return
+        paused = not any(m_item.tsk.is_paused() for m_item in items)
+        for m_item in items:
+            m_item.set_paused(paused)
+        self.pause_btn.setText("继续" if paused else "暂停")
+
+    @Slot()
+    def on_cancel_btn_clicked(self):
+        for m_item in self.__task_map.values():
+            m_item[2].cancel()
 
 
 if __name__ == "__main__":
+    # 打包后多进程筛选需要
+    multiprocessing.freeze_support()
     uiapp = QApplication([])
     a = UI()
     a.show()
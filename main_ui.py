@@ -57,10 +57,24 @@ class Ui_water_mainwd(object):
         self.dump_setting_btn.setGeometry(QRect(880, 120, 71, 28))
         self.result_lbl = QTextBrowser(self.centralwidget)
         self.result_lbl.setObjectName(u"result_lbl")
-        self.result_lbl.setGeometry(QRect(20, 590, 901, 181))
+        self.result_lbl.setGeometry(QRect(20, 680, 901, 91))
+        self.task_area = QScrollArea(self.centralwidget)
+        self.task_area.setObjectName(u"task_area")
+        self.task_area.setGeometry(QRect(20, 590, 901, 85))
+        self.task_area.setWidgetResizable(True)
+        self.task_area_contents = QWidget()
+        self.task_area_contents.setObjectName(u"task_area_contents")
+        self.task_area_contents.setGeometry(QRect(0, 0, 899, 83))
+        self.task_area.setWidget(self.task_area_contents)
         self.exec_btn = QPushButton(self.centralwidget)
         self.exec_btn.setObjectName(u"exec_btn")
-        self.exec_btn.setGeometry(QRect(930, 700, 61, 71))
+        self.exec_btn.setGeometry(QRect(930, 730, 61, 41))
+        self.pause_btn = QPushButton(self.centralwidget)
+        self.pause_btn.setObjectName(u"pause_btn")
+        self.pause_btn.setGeometry(QRect(930, 674, 61, 25))
+        self.cancel_btn = QPushButton(self.centralwidget)
+        self.cancel_btn.setObjectName(u"cancel_btn")
+        self.cancel_btn.setGeometry(QRect(930, 702, 61, 25))
         self.clear_output_btn = QPushButton(self.centralwidget)
         self.clear_output_btn.setObjectName(u"clear_output_btn")
         self.clear_output_btn.setGeometry(QRect(930, 590, 51, 31))
@@ -191,6 +205,12 @@ class Ui_water_mainwd(object):
         self.filter_result_items = QTextEdit(self.centralwidget)
         self.filter_result_items.setObjectName(u"filter_result_items")
         self.filter_result_items.setGeometry(QRect(450, 90, 241, 91))
+        self.checkpoint_btn = QCheckBox(self.centralwidget)
+        self.checkpoint_btn.setObjectName(u"checkpoint_btn")
+        self.checkpoint_btn.setGeometry(QRect(720, 90, 141, 21))
+        self.memo_btn = QCheckBox(self.centralwidget)
+        self.memo_btn.setObjectName(u"memo_btn")
+        self.memo_btn.setGeometry(QRect(720, 120, 141, 21))
         water_mainwd.setCentralWidget(self.centralwidget)
         self.label_36.raise_()
         self.sel_input_btn.raise_()
@@ -204,7 +224,10 @@ class Ui_water_mainwd(object):
         self.load_setting_btn.raise_()
         self.dump_setting_btn.raise_()
         self.result_lbl.raise_()
+        self.task_area.raise_()
         self.exec_btn.raise_()
+        self.pause_btn.raise_()
+        self.cancel_btn.raise_()
         self.clear_output_btn.raise_()
         self.clear_input_btn.raise_()
         self.title_start_row.raise_()
@@ -223,6 +246,8 @@ class Ui_water_mainwd(object):
         self.open_when_fin_btn.raise_()
         self.label_20.raise_()
         self.filter_result_items.raise_()
+        self.checkpoint_btn.raise_()
+        self.memo_btn.raise_()
         self.menubar = QMenuBar(water_mainwd)
         self.menubar.setObjectName(u"menubar")
         self.menubar.setGeometry(QRect(0, 0, 1000, 26))
@@ -249,6 +274,8 @@ class Ui_water_mainwd(object):
         self.load_setting_btn.setText(QCoreApplication.translate("water_mainwd", u"\u8f7d\u5165\u914d\u7f6e", None))
         self.dump_setting_btn.setText(QCoreApplication.translate("water_mainwd", u"\u5bfc\u51fa\u914d\u7f6e", None))
         self.exec_btn.setText(QCoreApplication.translate("water_mainwd", u"\u6267\u884c", None))
+        self.pause_btn.setText(QCoreApplication.translate("water_mainwd", u"\u6682\u505c", None))
+        self.cancel_btn.setText(QCoreApplication.translate("water_mainwd", u"\u53d6\u6d88", None))
         self.clear_output_btn.setText(QCoreApplication.translate("water_mainwd", u"clear", None))
         self.clear_input_btn.setText(QCoreApplication.translate("water_mainwd", u"\u6e05\u7a7a\u8f93\u5165", None))
         self.title_start_row.setText(QCoreApplication.translate("water_mainwd", u"1", None))
@@ -298,5 +325,13 @@ class Ui_water_mainwd(object):
 "<p style=\" margin-top:0px; margin-bottom:0px; margin-left:0px; margin-right:0px; -qt-block-indent:0; text-indent:0px;\">\u673a\u67dc</p>\n"
 "<p style=\"-qt-paragraph-type:empty; margin-top:0px; margin-bottom:0px; margin-left:0px; margin-right:0px; -qt-block-indent:0; text-indent:0px;\"><br /></p>\n"
 "<p style=\"-qt-paragraph-type:empty; margin-top:0px; margin-bottom:0px; margin-left:0px; margin-right:0px; -qt-block-indent:0; text-indent:0px;\"><br /></p></body></html>", None))
+#if QT_CONFIG(tooltip)
+        self.checkpoint_btn.setToolTip(QCoreApplication.translate("water_mainwd", u"\u5b9a\u671f\u5728\u8f93\u51fa\u65c1\u5199\u5165\u65ad\u70b9, \u53d6\u6d88\u6216\u4e2d\u65ad\u540e\u518d\u6b21\u6267\u884c\u65f6\u4ece\u65ad\u70b9\u7ee7\u7eed", None))
+#endif // QT_CONFIG(tooltip)
+        self.checkpoint_btn.setText(QCoreApplication.translate("water_mainwd", u"\u65ad\u70b9\u7eed\u8dd1", None))
+#if QT_CONFIG(tooltip)
+        self.memo_btn.setToolTip(QCoreApplication.translate("water_mainwd", u"\u8f93\u5165\u6587\u4ef6\u548c\u6761\u4ef6\u4e0e\u4e4b\u524d\u67d0\u6b21\u6267\u884c\u76f8\u540c\u65f6\u76f4\u63a5\u4f7f\u7528\u8bb0\u5f55\u7684\u547d\u4e2d\u884c", None))
+#endif // QT_CONFIG(tooltip)
+        self.memo_btn.setText(QCoreApplication.translate("water_mainwd", u"\u7ed3\u679c\u7f13\u5b58", None))
     # retranslateUi
 
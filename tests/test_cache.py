@@ -0,0 +1,55 @@
+import os
+from datetime import datetime
+import openpyxl
+import pytest
+import Cache
+from Cache import ColumnarCache
+
+
+@pytest.fixture
+def xlsx(tmp_path):
+    path = str(tmp_path / "a.xlsx")
+    wb = openpyxl.Workbook()
+    ws = wb.active
+    ws.append(["id", "name", "day", "amt"])
+    for i in range(500):
+        ws.append([i, "n{0}".format(i % 7), datetime(2021, 1, 1 + i % 28), i * 0.5 if i % 3 else None])
+    wb.save(path)
+    return path
+
+
+def _rows(sheet) -> list:
+    try:
+        return list(sheet.iter_rows())
+    finally:
+        sheet.close()
+
+
+def test_cached_rows_match_source(xlsx, tmp_path):
+    cache = ColumnarCache(str(tmp_path / "cache"))
+    expect = [list(m_item) for m_item in openpyxl.load_workbook(xlsx).active.iter_rows(values_only=True)]
+    assert _rows(cache.open(xlsx)) == expect
+    assert _rows(cache.open(xlsx)) == expect
+
+
+def test_touch_hashes_once(xlsx, tmp_path, monkeypatch):
+    cache = ColumnarCache(str(tmp_path / "cache"))
+    expect = _rows(cache.open(xlsx))
+    calls = []
+    content_hash = Cache.content_hash
+    monkeypatch.setattr(Cache, "content_hash", lambda path: calls.append(path) or content_hash(path))
+    st = os.stat(xlsx)
+    os.utime(xlsx, ns=(st.st_atime_ns, st.st_mtime_ns + 10 ** 9))
+    assert _rows(cache.open(xlsx)) == expect
+    assert len(calls) == 1
+    # 修改时间已记录, 不再计算内容哈希
+    assert _rows(cache.open(xlsx)) == expect
+    assert len(calls) == 1
+
+
+def test_corrupt_entry_is_rebuilt(xlsx, tmp_path):
+    cache = ColumnarCache(str(tmp_path / "cache"))
+    expect = _rows(cache.open(xlsx))
+    with open(cache.entry_path(xlsx), "wb") as f:
+        f.write(b"garbage")
+    assert _rows(cache.open(xlsx)) == expect
@@ -0,0 +1,91 @@
+import csv
+import os
+import time
+import openpyxl
+import pytest
+from Filter import CsvInputTab, CsvOutputTab, ExcelOutputTab, Task, load_checkpoint, checkpoint_output_kwargs
+
+
+@pytest.fixture(scope="module")
+def src(tmp_path_factory):
+    path = str(tmp_path_factory.mktemp("ckpt") / "a.csv")
+    with open(path, "w", encoding="utf-8", newline="") as f:
+        w = csv.writer(f)
+        w.writerow(["id", "v"])
+        for i in range(60000):
+            w.writerow([i, i % 7])
+    return path
+
+
+def _task(src: str, dst: str, checkpoint: str = None, state: dict = None, columns: list = None) -> Task:
+    tab = CsvInputTab(src, (0, 0), (1, 0), encoding="utf-8")
+    tab.set_filter_plan([(1, "int(X) in (1, 3)", "v")])
+    out_cls = ExcelOutputTab if dst.endswith(".xlsx") else CsvOutputTab
+    out = out_cls(dst, tab.read_title(), columns or ["id"], **checkpoint_output_kwargs(checkpoint, state))
+    return Task(tab, out, checkpoint=checkpoint, checkpoint_interval=0.0, resume_state=state, batch_size=100,
+                queue_size=2)
+
+
+def _ids(path: str) -> list:
+    if path.endswith(".xlsx"):
+        return [m_item[0] for m_item in openpyxl.load_workbook(path, read_only=True).active.iter_rows(values_only=True)]
+    with open(path, encoding="utf-8") as f:
+        return [m_item[0] for m_item in csv.reader(f)]
+
+
+@pytest.mark.parametrize("ext", [".csv", ".xlsx"])
+def test_resume_matches_full_run(src, tmp_path, ext):
+    full = str(tmp_path / ("full" + ext))
+    _task(src, full).run()
+    dst = str(tmp_path / ("out" + ext))
+    ckpt = dst + ".ckpt"
+    tsk = _task(src, dst, ckpt)
+    tsk.start()
+    time.sleep(0.05)
+    tsk.cancel()
+    while not tsk.is_done():
+        time.sleep(0.01)
+    tab = CsvInputTab(src, (0, 0), (1, 0), encoding="utf-8")
+    tab.set_filter_plan([(1, "int(X) in (1, 3)", "v")])
+    state = load_checkpoint(ckpt, tab, dst, ["id"])
+    tab.close()
+    tsk = _task(src, dst, ckpt, state)
+    tsk.run()
+    assert tsk.fault_msg == ""
+    assert [str(m_item) for m_item in _ids(dst)] == [str(m_item) for m_item in _ids(full)]
+    # 成功完成后删除断点和 xlsx 行日志
+    assert not os.path.exists(ckpt)
+    assert not os.path.exists(ckpt + ".rows")
+
+
+def test_no_side_files_without_checkpoint(src, tmp_path):
+    dst = str(tmp_path / "out.xlsx")
+    _task(src, dst).run()
+    assert sorted(os.listdir(str(tmp_path))) == ["out.xlsx"]
+
+
+def _cancelled_state(src: str, dst: str) -> str:
+    ckpt = dst + ".ckpt"
+    tsk = _task(src, dst, ckpt)
+    tsk.start()
+    time.sleep(0.05)
+    tsk.cancel()
+    while not tsk.is_done():
+        time.sleep(0.01)
+    return ckpt
+
+
+@pytest.mark.parametrize("change", ["columns", "data_pos", "options"])
+def test_changed_task_ignores_checkpoint(src, tmp_path, change):
+    dst = str(tmp_path / "out.csv")
+    ckpt = _cancelled_state(src, dst)
+    tab = CsvInputTab(src, (0, 0), (2, 0) if change == "data_pos" else (1, 0),
+                      encoding="utf-8-sig" if change == "options" else "utf-8")
+    tab.set_filter_plan([(1, "int(X) in (1, 3)", "v")])
+    same = load_checkpoint(ckpt, tab, dst, ["id"])
+    changed = load_checkpoint(ckpt, tab, dst, ["v", "id"] if change == "columns" else ["id"])
+    tab.close()
+    assert changed is None
+    if change == "columns":
+        # 只改输出列时, 原输出列仍可续跑
+        assert same is not None
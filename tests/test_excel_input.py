@@ -0,0 +1,42 @@
+from datetime import datetime
+import pytest
+from Filter import ExcelInputTab, ExcelOutputTab
+
+TITLE = ["id", "name", "day", "amt"]
+
+
+@pytest.fixture(scope="module")
+def no_dimension(tmp_path_factory):
+    """只写模式保存的文件不记录表格尺寸"""
+    path = str(tmp_path_factory.mktemp("xlsx") / "w.xlsx")
+    out = ExcelOutputTab(path, TITLE)
+    for i in range(3000):
+        out.write([i, "n{0}".format(i % 11), datetime(2021, 1, 1 + i % 28), None if i % 5 == 0 else i * 0.25])
+    out.save()
+    return path
+
+
+def _read_all(tab) -> list:
+    fin = []
+    line = tab.read_nxt_raw_data_line()
+    while line:
+        fin.append(line)
+        line = tab.read_nxt_raw_data_line()
+    tab.close()
+    return fin
+
+
+@pytest.mark.parametrize("title_pos, data_pos", [((0, 0), (1, 0)), ((0, 1), (1, 1)), ((-1, 0), (0, 0))])
+def test_read_only_matches_full_mode(no_dimension, title_pos, data_pos):
+    fast = ExcelInputTab(no_dimension, title_pos, data_pos)
+    full = ExcelInputTab(no_dimension, title_pos, data_pos, read_only=False)
+    assert fast.read_title() == full.read_title()
+    assert fast.get_total_data_len() == full.get_total_data_len() == 3001 - data_pos[0]
+    assert _read_all(fast) == _read_all(full)
+
+
+def test_progress_counts_rows_lazily(no_dimension):
+    tab = ExcelInputTab(no_dimension, (0, 0), (1, 0))
+    tab.read_nxt_data_line()
+    assert 0 < tab.get_progress() < 0.01
+    tab.close()
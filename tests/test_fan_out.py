@@ -0,0 +1,22 @@
+import csv
+from Filter import CsvInputTab, CsvOutputTab, FanOutTask
+
+
+def test_failed_plan_keeps_partial_output_and_others_finish(tmp_path):
+    src = str(tmp_path / "a.csv")
+    with open(src, "w", encoding="utf-8", newline="") as f:
+        w = csv.writer(f)
+        w.writerow(["id", "v"])
+        for i in range(1000):
+            w.writerow([i, "bad" if i == 500 else i % 4])
+    tab = CsvInputTab(src, (0, 0), (1, 0), encoding="utf-8")
+    good = CsvOutputTab(str(tmp_path / "good.csv"), tab.read_title(), ["id"])
+    bad = CsvOutputTab(str(tmp_path / "bad.csv"), tab.read_title(), ["id"])
+    tsk = FanOutTask(tab, [((2, "^[01]$", "v"), good), ((1, "int(X) == 1", "v"), bad)])
+    tsk.run()
+    assert tsk.faults[0] == "" and "int(X) == 1" in tsk.faults[1]
+    with open(str(tmp_path / "good.csv"), encoding="utf-8") as f:
+        assert [m_item.strip() for m_item in f][1:] == [str(i) for i in range(1000) if i != 500 and i % 4 < 2]
+    # 出错前写出的行已保存
+    with open(str(tmp_path / "bad.csv"), encoding="utf-8") as f:
+        assert [m_item.strip() for m_item in f][1:] == [str(i) for i in range(500) if i % 4 == 1]
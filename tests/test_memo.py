@@ -0,0 +1,79 @@
+import csv
+import os
+import random
+import pytest
+from Filter import CsvInputTab, CsvOutputTab, Task
+from Memo import ResultMemo, memo_key, encode_indices, decode_indices
+
+
+@pytest.mark.parametrize("density", [0.001, 0.3, 1.0])
+def test_indices_round_trip(density):
+    rnd = random.Random(22)
+    total = 5000
+    indices = [i for i in range(total) if rnd.random() < density]
+    enc, data = encode_indices(indices, total)
+    assert decode_indices(enc, data) == indices
+
+
+def _write(path: str, flag: int):
+    with open(path, "w", encoding="utf-8", newline="") as f:
+        w = csv.writer(f)
+        w.writerow(["id", "v"])
+        for i in range(20000):
+            w.writerow([i, (i + flag) % 5])
+
+
+def _run(src: str, dst: str, memo_dir: str) -> Task:
+    tab = CsvInputTab(src, (0, 0), (1, 0), encoding="utf-8")
+    tab.set_filter_plan([(0, "1", "v")])
+    tsk = Task(tab, CsvOutputTab(dst, tab.read_title(), encoding="utf-8"), memo_dir=memo_dir)
+    tsk.run()
+    return tsk
+
+
+def _read(path: str) -> str:
+    with open(path, encoding="utf-8") as f:
+        return f.read()
+
+
+def test_hit_writes_same_rows(tmp_path):
+    src = str(tmp_path / "a.csv")
+    _write(src, 0)
+    memo_dir = str(tmp_path / "memo")
+    first = _run(src, str(tmp_path / "o1.csv"), memo_dir)
+    second = _run(src, str(tmp_path / "o2.csv"), memo_dir)
+    assert not first.memo_hit and second.memo_hit
+    assert _read(str(tmp_path / "o1.csv")) == _read(str(tmp_path / "o2.csv"))
+
+
+def test_rewrite_with_same_size_and_mtime_misses(tmp_path):
+    src = str(tmp_path / "a.csv")
+    _write(src, 0)
+    st = os.stat(src)
+    tab = CsvInputTab(src, (0, 0), (1, 0), encoding="utf-8")
+    tab.set_filter_plan([(0, "1", "v")])
+    before = memo_key(tab)
+    tab.close()
+    memo_dir = str(tmp_path / "memo")
+    _run(src, str(tmp_path / "o1.csv"), memo_dir)
+    # 同样大小的内容原地改写, 并恢复修改时间
+    _write(src, 1)
+    os.utime(src, ns=(st.st_atime_ns, st.st_mtime_ns))
+    assert os.path.getsize(src) == st.st_size
+    tab = CsvInputTab(src, (0, 0), (1, 0), encoding="utf-8")
+    tab.set_filter_plan([(0, "1", "v")])
+    assert memo_key(tab) != before
+    tab.close()
+    tsk = _run(src, str(tmp_path / "o2.csv"), memo_dir)
+    assert not tsk.memo_hit
+    _run(src, str(tmp_path / "o3.csv"), None)
+    assert _read(str(tmp_path / "o2.csv")) == _read(str(tmp_path / "o3.csv"))
+
+
+def test_corrupt_entry_is_ignored(tmp_path):
+    memo = ResultMemo(str(tmp_path))
+    memo.put("k", [1, 5, 9], 10)
+    assert memo.get("k") == ([1, 5, 9], 10)
+    with open(memo.entry_path("k"), "wb") as f:
+        f.write(b"garbage")
+    assert memo.get("k") is None
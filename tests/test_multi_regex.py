@@ -0,0 +1,59 @@
+import random
+import pytest
+from Filter import MultiRegex, AhoCorasick, FilterType, KEY_FILE_PREFIX
+
+
+@pytest.mark.parametrize("pattern, prefix", [
+    ("abc", "abc"),
+    ("^abc\\d+", "abc"),
+    ("abc*", "ab"),
+    ("ab{0,2}x", "a"),
+    ("abc|xyz", ""),
+    ("^ord|^inv", ""),
+    ("ab(c|d)", "ab"),
+    ("ab[|]c", "ab"),
+    ("ab\\|c", "ab"),
+    ("(?i)abc", ""),
+])
+def test_literal_prefix(pattern, prefix):
+    assert MultiRegex.literal_prefix(pattern) == prefix
+
+
+@pytest.mark.parametrize("patterns", [
+    ["abc|xyz"],
+    ["ord-\\d+", "inv|rcp"],
+    ["^AB\\d{3}", "CD[0-9]+", "x(y|z)w"],
+    ["a[]|]b|qq", "zz"],
+])
+def test_prefilter_matches_unfiltered(patterns):
+    rnd = random.Random(8)
+    alphabet = "abcdxyzqwinvorCDAB-|]0123456789"
+    values = ["".join(rnd.choice(alphabet) for _ in range(rnd.randint(0, 12))) for _ in range(3000)]
+    values += ["xyz", "rcp", "xzw", "a|b", "qq"]
+    plain = MultiRegex(patterns)
+    fast = MultiRegex(patterns, prefilter=True)
+    for m_item in values:
+        assert fast.is_match(m_item) == plain.is_match(m_item), m_item
+        assert fast.which(m_item) == plain.which(m_item), m_item
+
+
+def test_aho_corasick_matches_substring_search():
+    rnd = random.Random(9)
+    keys = ["ab", "abc", "bca", "c", "zz"]
+    ac = AhoCorasick(keys)
+    for _ in range(2000):
+        s = "".join(rnd.choice("abcz") for _ in range(rnd.randint(0, 10)))
+        assert ac.is_match(s) == any(k in s for k in keys), s
+
+
+@pytest.mark.parametrize("filter_type", [FilterType.raw_list, FilterType.kw_contains])
+def test_key_file_change_is_picked_up(tmp_path, filter_type):
+    path = str(tmp_path / "kw.txt")
+    with open(path, "w", encoding="utf-8") as f:
+        f.write("alpha\n")
+    pt = KEY_FILE_PREFIX + path
+    assert FilterType.compile(filter_type, pt)("alpha")
+    with open(path, "w", encoding="utf-8") as f:
+        f.write("beta\nbeta2\n")
+    check = FilterType.compile(filter_type, pt)
+    assert check("beta") and not check("alpha")
@@ -0,0 +1,173 @@
+"""逐行解释执行的参考实现 / 生成代码的逐行判断 / 批量判断 / 自适应排序 / 多条件树共用 结果一致"""
+import csv
+import os
+import random
+import pytest
+from Filter import FilterType, normalize_filter_plan, compile_filter_plan, compile_fan_out, AdaptiveConjunction, \
+    CsvInputTab, CsvOutputTab, PartitionedOutputTab, Task
+from Vector import compile_batch_plan
+from Typed import infer_column_types, get_converter
+
+TITLE = ["name", "amt", "day", "code"]
+TITLE_MAP = {m_item: i for i, m_item in enumerate(TITLE)}
+
+LEAVES = [
+    (0, "alice\nbob\ncarol", "name"),
+    (0, "A1\nB2", "code"),
+    (1, "float(X) > 500", "amt"),
+    (1, "T > 250", "amt"),
+    (1, "T >= date(2021, 7, 1)", "day"),
+    (1, "len([c for c in str(X) if c in 'ae']) >= 2", "name"),
+    (1, "X.startswith('C')", "code"),
+    (2, "^[ab]", "name"),
+    (2, "\\d$", "code"),
+    {"filter_type": 3, "pattern": "^al|^da\nro", "filter_title": "name", "options": {"prefilter": True}},
+    {"filter_type": 3, "pattern": "A\\d\nzz|C3", "filter_title": "code", "options": {"prefilter": True}},
+    {"filter_type": 4, "pattern": "li\nve", "filter_title": "name"},
+    {"filter_type": 4, "pattern": "ALI", "filter_title": "name", "options": {"ignore_case": True}},
+]
+
+
+def _rows(n: int, seed: int) -> list:
+    rnd = random.Random(seed)
+    names = ["alice", "bob", "carol", "dave", "eve", " alice ", "", "Alina"]
+    fin = []
+    for _ in range(n):
+        amt = rnd.choice([str(rnd.randint(0, 1000)), "{0:.2f}".format(rnd.random() * 1000), ""])
+        day = "2021-{0:02d}-{1:02d}".format(rnd.randint(1, 12), rnd.randint(1, 28))
+        fin.append([rnd.choice(names), amt, day, rnd.choice(["A1", "B2", "C3", "C9", "zz", ""])])
+    return fin
+
+
+def _random_plan(rnd: random.Random, depth: int = 0):
+    if depth >= 2 or rnd.random() < 0.3:
+        return rnd.choice(LEAVES)
+    op = rnd.choice(["and", "or", "not"])
+    if op == "not":
+        return {"not": _random_plan(rnd, depth + 1)}
+    return {op: [_random_plan(rnd, depth + 1) for _ in range(rnd.randint(2, 3))]}
+
+
+def _reference(node: dict, line: list, types: list) -> bool:
+    """按条件树逐个调用 FilterType.compile 得到的判断函数"""
+    if "and" in node:
+        return all(_reference(m_item, line, types) for m_item in node["and"])
+    if "or" in node:
+        return any(_reference(m_item, line, types) for m_item in node["or"])
+    if "not" in node:
+        return not _reference(node["not"], line, types)
+    col = TITLE_MAP[node["filter_title"]]
+    check = FilterType.compile(node["filter_type"], node["pattern"], **node.get("options", {}))
+    if getattr(check, "uses_t", False):
+        return bool(check(line[col], get_converter(types[col])(line[col])))
+    return bool(check(line[col]))
+
+
+PLANS = [_random_plan(random.Random(s)) for s in range(120)]
+
+
+@pytest.fixture(scope="module")
+def rows():
+    return _rows(800, 5)
+
+
+@pytest.fixture(scope="module")
+def types(rows):
+    return infer_column_types(rows)
+
+
+def test_inferred_types(types):
+    assert types == ["str", "float", "date", "str"]
+
+
+@pytest.mark.parametrize("idx", range(len(PLANS)))
+def test_engines_agree(idx, rows, types):
+    plan = normalize_filter_plan(PLANS[idx])
+    expect = [i for i, line in enumerate(rows) if _reference(plan, line, types)]
+    match = compile_filter_plan(plan, TITLE_MAP, types=types)
+    assert [i for i, line in enumerate(rows) if match(line)] == expect
+    assert compile_batch_plan(plan, TITLE_MAP, types=types)(rows) == expect
+    adaptive = AdaptiveConjunction(plan, TITLE_MAP, sample_rows=50, retune_rows=200, types=types)
+    assert [i for i, line in enumerate(rows) if adaptive(line)] == expect
+
+
+def test_fan_out_agrees(rows, types):
+    plans = [normalize_filter_plan(m_item) for m_item in PLANS[:30]]
+    fan = compile_fan_out(plans, TITLE_MAP, types=types)
+    got = [fan(line) for line in rows]
+    for k, plan in enumerate(plans):
+        assert [i for i, m_item in enumerate(got) if m_item[k]] == \
+               [i for i, line in enumerate(rows) if _reference(plan, line, types)]
+
+
+def test_errors_agree(rows, types):
+    # 带小数的 amt 使 int(X) 出错
+    plan = normalize_filter_plan({"and": [(0, "bob", "name"), (1, "int(X) > 500", "amt")]})
+    match = compile_filter_plan(plan, TITLE_MAP, types=types)
+    with pytest.raises(Exception) as row_err:
+        [match(line) for line in rows]
+    with pytest.raises(Exception) as batch_err:
+        compile_batch_plan(plan, TITLE_MAP, types=types)(rows)
+    assert str(row_err.value) == str(batch_err.value)
+
+
+def _write_csv(path: str, rows: list):
+    with open(path, "w", encoding="utf-8", newline="") as f:
+        w = csv.writer(f)
+        w.writerow(TITLE)
+        w.writerows(rows)
+
+
+def _read_csv(path: str) -> list:
+    with open(path, encoding="utf-8") as f:
+        return list(csv.reader(f))
+
+
+PLAN = {"or": [{"and": [(0, "alice\nbob", "name"), (1, "T > 250", "amt")]}, (2, "^C", "code")]}
+
+
+@pytest.mark.parametrize("options", [{"vectorize": True}, {"vectorize": False}, {"workers": 2, "chunk_bytes": 4096}])
+def test_task_matches_reference(tmp_path, options):
+    rows = _rows(5000, 6)
+    src = str(tmp_path / "a.csv")
+    _write_csv(src, rows)
+    tab = CsvInputTab(src, (0, 0), (1, 0), encoding="utf-8", **options)
+    tab.set_filter_plan(PLAN)
+    dst = str(tmp_path / "out.csv")
+    tsk = Task(tab, CsvOutputTab(dst, tab.read_title(), encoding="utf-8"), batch_size=97)
+    tsk.run()
+    assert tsk.fault_msg == ""
+    # csv 按整行去掉首尾空白后拆分
+    rows = [",".join(m_item).strip().split(",") for m_item in rows]
+    types = infer_column_types(rows[:1000])
+    plan = normalize_filter_plan(PLAN)
+    assert _read_csv(dst)[1:] == [m_item for m_item in rows if _reference(plan, m_item, types)]
+
+
+def test_partitioned_output_matches_single_output(tmp_path):
+    rows = _rows(3000, 7)
+    src = str(tmp_path / "a.csv")
+    _write_csv(src, rows)
+    outputs = {}
+    for name in ("single", "part"):
+        tab = CsvInputTab(src, (0, 0), (1, 0), encoding="utf-8")
+        tab.set_filter_plan(PLAN)
+        if name == "single":
+            out = CsvOutputTab(str(tmp_path / "single.csv"), tab.read_title(), ["code", "name"], encoding="utf-8")
+        else:
+            os.makedirs(str(tmp_path / "part"))
+            out = PartitionedOutputTab(str(tmp_path / "part" / "{value}.csv"), tab.read_title(), ["code", "name"],
+                                       partition_by="code", buffer_rows=100, max_open=2,
+                                       out_kwargs={"encoding": "utf-8"})
+        tsk = Task(tab, out)
+        tsk.run()
+        assert tsk.fault_msg == ""
+    single = _read_csv(str(tmp_path / "single.csv"))
+    parts = []
+    for m_item in sorted(os.listdir(str(tmp_path / "part"))):
+        got = _read_csv(str(tmp_path / "part" / m_item))
+        assert got[0] == single[0]
+        # 空值的分区文件名为 _
+        assert {line[0] or "_" for line in got[1:]} == {os.path.splitext(m_item)[0]}
+        parts.extend(got[1:])
+    assert sorted(parts) == sorted(single[1:])
@@ -0,0 +1,98 @@
+import csv
+import random
+from datetime import datetime, date
+import pytest
+from Filter import CsvInputTab, ExcelInputTab, CsvOutputTab, Task
+from Typed import value_type, infer_column_types, to_int, to_float, to_date, to_datetime, to_str
+
+
+def test_midnight_datetime_is_date():
+    assert value_type(datetime(2021, 5, 1)) == "date"
+    assert value_type("2021-05-01 00:00:00") == "date"
+    assert value_type("2021-05-01 08:30") == "datetime"
+    assert infer_column_types([["2021-05-01 00:00:00"], ["2021/05/02"]]) == ["date"]
+    assert infer_column_types([[datetime(2021, 5, 1)], ["2021-05-02 00:00:00"]]) == ["date"]
+    assert infer_column_types([["2021-05-01"], ["2021-05-02 08:00"]]) == ["datetime"]
+
+
+def test_converters_keep_column_type():
+    assert to_int(" 12 ") == 12 and to_int(3.0) == 3 and to_int("n/a") is None
+    assert to_float(2) == 2.0 and to_float("1e3") == 1000.0 and to_float("x") is None
+    assert to_date("2021-05-01 00:00:00") == date(2021, 5, 1)
+    assert to_date(datetime(2021, 5, 1, 8, 30)) == date(2021, 5, 1)
+    assert to_date("tomorrow") is None
+    assert to_datetime(date(2021, 5, 1)) == datetime(2021, 5, 1)
+    assert to_datetime("2021-05-01") == datetime(2021, 5, 1)
+    assert to_str(12) == "12" and to_str(" a ") == "a" and to_str(None) is None
+
+
+def _rows(n: int):
+    # 推断只看前 1000 行, 之后的 "n/a" 无法转换为 float, 用到 T 的条件不命中
+    rnd = random.Random(25)
+    fin = []
+    for i in range(n):
+        day = datetime(2021, rnd.randint(1, 12), rnd.randint(1, 28))
+        amt = "n/a" if i >= 1500 and i % 97 == 5 else round(rnd.random() * 1000, 2)
+        fin.append([i, day, amt])
+    return fin
+
+
+@pytest.fixture(scope="module")
+def inputs(tmp_path_factory):
+    import openpyxl
+    root = tmp_path_factory.mktemp("typed")
+    rows = _rows(3000)
+    xlsx = str(root / "a.xlsx")
+    wb = openpyxl.Workbook()
+    ws = wb.active
+    ws.append(["id", "day", "amt"])
+    for m_item in rows:
+        ws.append(m_item)
+    wb.save(xlsx)
+    path = str(root / "a.csv")
+    with open(path, "w", encoding="utf-8", newline="") as f:
+        w = csv.writer(f)
+        w.writerow(["id", "day", "amt"])
+        for i, day, amt in rows:
+            w.writerow([i, day.strftime("%Y-%m-%d %H:%M:%S"), amt])
+    expect = [str(i) for i, day, amt in rows
+              if day.date() >= date(2021, 6, 1) and not isinstance(amt, str) and amt > 500]
+    return root, xlsx, path, expect
+
+
+PLAN = [(1, "T >= date(2021, 6, 1)", "day"), (1, "T > 500", "amt")]
+
+
+def _open(kind: str, inputs, **kwargs):
+    root, xlsx, path, expect = inputs
+    if kind == "xlsx":
+        tab = ExcelInputTab(xlsx, (0, 0), (1, 0), **kwargs)
+    else:
+        tab = CsvInputTab(path, (0, 0), (1, 0), encoding="utf-8", **kwargs)
+    tab.set_filter_plan(PLAN)
+    return tab
+
+
+@pytest.mark.parametrize("kind", ["csv", "xlsx"])
+def test_row_engine(kind, inputs):
+    tab = _open(kind, inputs)
+    got = []
+    line = tab.read_nxt_data_line()
+    while line:
+        got.append(str(line[0]))
+        line = tab.read_nxt_data_line()
+    assert tab.get_column_types() == ["int", "date", "float"]
+    assert got == inputs[3]
+
+
+@pytest.mark.parametrize("kind", ["csv", "xlsx"])
+@pytest.mark.parametrize("vectorize", [True, False])
+def test_task_csv_matches_xlsx(kind, vectorize, inputs):
+    tab = _open(kind, inputs, vectorize=vectorize)
+    out = str(inputs[0] / "out_{0}_{1}.csv".format(kind, vectorize))
+    task = Task(tab, CsvOutputTab(out, tab.read_title(), ["id"], encoding="utf-8"), batch_size=64)
+    task.run()
+    assert task.fault_msg == ""
+    with open(out, encoding="utf-8") as f:
+        got = [m_item[0] for m_item in csv.reader(f)][1:]
+    assert got == inputs[3]